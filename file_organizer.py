@@ -1,24 +1,264 @@
 import os
 import sys
-import shutil
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import threading
-import time
-import queue
 from pathlib import Path
 
-# 1. 定义分类规则
-FILE_CATEGORIES = {
-    '图片': ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tiff', 'svg'],
-    '文档': ['pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'md', 'rtf', 'csv'],
-    '压缩包': ['zip', 'rar', '7z', 'tar', 'gz', 'bz2', 'xz'],
-    '视频': ['mp4', 'avi', 'mkv', 'mov', 'flv', 'wmv', 'mpeg', 'mpg', 'webm'],
-    '音频': ['mp3', 'wav', 'm4a', 'flac', 'aac', 'ogg', 'wma'],
-    '程序': ['py', 'js', 'java', 'cpp', 'c', 'html', 'css', 'php', 'json', 'xml'],
-    '可执行文件': ['exe', 'msi', 'bat', 'sh', 'app', 'dmg'],
-    '其他': []  # 默认分类
-}
+from organizer.batch import run_batch
+from organizer.channel import UpdateChannel
+from organizer.engine import FILE_CATEGORIES, OrganizerEngine
+from organizer.filetable import RUN_SORT_KEYS, RUN_STATUSES, STATUS_LABELS
+
+# 日志框最多保留的行数
+MAX_LOG_LINES = 1000
+
+# 界面刷新间隔（毫秒）
+UI_REFRESH_MS = 100
+
+# 结果列表一次显示的行数（Treeview 只创建这么多行，滚动时替换内容）
+RESULT_ROWS = 12
+
+# 鼠标滚轮每格滚动的行数
+RESULT_WHEEL_ROWS = 3
+
+# 结果列表的列：(字段, 标题, 宽度)
+RESULT_COLUMNS = (
+    ('source', '源文件', 220),
+    ('destination', '目标', 200),
+    ('category', '分类', 70),
+    ('size', '大小', 70),
+    ('status', '状态', 60),
+    ('error', '错误信息', 160),
+)
+
+# 筛选下拉框中表示不筛选的选项
+ALL_LABEL = "全部"
+
+
+class ResultsPanel:
+    """虚拟化的整理结果列表（数据在 filetable.RunTable 中）
+
+    Treeview 中只有 RESULT_ROWS 个固定的行，滚动时按偏移量重新填入可见行的内容，
+    不论结果有多少行，界面上的控件数量都不变。筛选和排序在后台线程中由
+    RunTable.view() 计算出下标数组，通过 post 回调经消息通道交回界面线程；
+    没有筛选和排序时直接按下标显示，整理进行中的新结果实时出现。
+    """
+
+    def __init__(self, parent, post, log):
+        self.post = post
+        self.log = log
+        self.table = None
+        # 筛选/排序后的下标数组，None 表示按记录顺序显示全部行
+        self.view = None
+        self.offset = 0
+        self.sort = None
+        self.reverse = False
+        self._shown_rows = -1
+        # 每次筛选递增，丢弃过期的后台结果
+        self._generation = 0
+
+        frame = ttk.LabelFrame(parent, text="整理结果", padding=10)
+        frame.pack(fill=tk.X, pady=(0, 15))
+
+        toolbar = ttk.Frame(frame)
+        toolbar.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(toolbar, text="分类:").pack(side=tk.LEFT)
+        self.category_var = tk.StringVar(value=ALL_LABEL)
+        self.category_box = ttk.Combobox(toolbar, textvariable=self.category_var, values=[ALL_LABEL],
+                                         state="readonly", width=12)
+        self.category_box.pack(side=tk.LEFT, padx=(2, 10))
+        self.category_box.bind("<<ComboboxSelected>>", self.apply_filter)
+        ttk.Label(toolbar, text="状态:").pack(side=tk.LEFT)
+        self.status_var = tk.StringVar(value=ALL_LABEL)
+        status_box = ttk.Combobox(toolbar, textvariable=self.status_var,
+                                  values=[ALL_LABEL, *(STATUS_LABELS[s] for s in RUN_STATUSES)],
+                                  state="readonly", width=10)
+        status_box.pack(side=tk.LEFT, padx=(2, 10))
+        status_box.bind("<<ComboboxSelected>>", self.apply_filter)
+        ttk.Button(toolbar, text="导出...", command=self.export, width=10).pack(side=tk.RIGHT)
+        self.count_var = tk.StringVar(value="")
+        ttk.Label(toolbar, textvariable=self.count_var, foreground="#7f8c8d").pack(side=tk.RIGHT, padx=10)
+
+        body = ttk.Frame(frame)
+        body.pack(fill=tk.X)
+        self.tree = ttk.Treeview(body, columns=[key for key, _, _ in RESULT_COLUMNS], show="headings",
+                                 height=RESULT_ROWS, selectmode="browse")
+        for key, title, width in RESULT_COLUMNS:
+            command = (lambda k=key: self.sort_by(k)) if key in RUN_SORT_KEYS else ""
+            self.tree.heading(key, text=title, command=command)
+            self.tree.column(key, width=width, anchor=tk.E if key == 'size' else tk.W, stretch=True)
+        for i in range(RESULT_ROWS):
+            self.tree.insert("", tk.END, iid=str(i), values=("",) * len(RESULT_COLUMNS))
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbar.set(0, 1)
+
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self._on_wheel)
+
+    def row_count(self):
+        if self.view is not None:
+            return len(self.view)
+        return len(self.table) if self.table is not None else 0
+
+    def set_table(self, table):
+        """显示一次整理的结果（None 清空）；有筛选或排序时重新计算"""
+        self.table = table
+        self.view = None
+        self.offset = 0
+        self._generation += 1
+        if table is not None:
+            self.category_box.config(values=[ALL_LABEL, *sorted(table.categories)])
+        if table is not None and (self._filters() != (None, None) or self.sort):
+            self.apply_filter()
+        else:
+            self.refresh()
+
+    def follow(self, table):
+        """整理进行中调用：切换到新的结果表，或在不筛选时显示新增的行"""
+        if table is not self.table:
+            self.set_table(table)
+        elif table is not None and self.view is None and len(table) != self._shown_rows:
+            self.refresh()
+
+    def _filters(self):
+        category = self.category_var.get()
+        status = self.status_var.get()
+        categories = None if category == ALL_LABEL else [category]
+        statuses = None
+        if status != ALL_LABEL:
+            statuses = [key for key, label in STATUS_LABELS.items() if label == status]
+        return categories, statuses
+
+    def apply_filter(self, event=None):
+        """按当前的筛选条件和排序列在后台线程中计算显示的行"""
+        self._generation += 1
+        table = self.table
+        if table is None:
+            return
+        categories, statuses = self._filters()
+        if categories is None and statuses is None and self.sort is None:
+            self.view = None
+            self.offset = 0
+            self.refresh()
+            return
+
+        generation = self._generation
+        sort, reverse = self.sort, self.reverse
+        self.count_var.set("正在筛选...")
+
+        def compute():
+            try:
+                view = table.view(categories, statuses, sort, reverse)
+            except Exception as e:
+                self.log(f"筛选整理结果失败: {e}")
+                return
+            self.post((generation, view))
+
+        threading.Thread(target=compute, daemon=True).start()
+
+    def set_view(self, result):
+        """接收后台计算的结果（界面线程中调用）"""
+        generation, view = result
+        if generation != self._generation:
+            return
+        self.view = view
+        self.offset = 0
+        self.refresh()
+
+    def sort_by(self, key):
+        """点击列标题：按该列排序，再次点击反向"""
+        if self.sort == key:
+            self.reverse = not self.reverse
+        else:
+            self.sort, self.reverse = key, False
+        for column, title, _ in RESULT_COLUMNS:
+            mark = (" ▼" if self.reverse else " ▲") if column == key else ""
+            self.tree.heading(column, text=title + mark)
+        self.apply_filter()
+
+    def refresh(self):
+        """按当前偏移量重新填入可见的行"""
+        table = self.table
+        total = self.row_count()
+        self.offset = max(0, min(self.offset, total - RESULT_ROWS))
+        for i in range(RESULT_ROWS):
+            position = self.offset + i
+            if position < total:
+                index = self.view[position] if self.view is not None else position
+                values = self._values(table, index)
+            else:
+                values = ("",) * len(RESULT_COLUMNS)
+            self.tree.item(str(i), values=values)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + RESULT_ROWS) / total))
+        else:
+            self.scrollbar.set(0, 1)
+        self._shown_rows = len(table) if table is not None else 0
+        if table is None:
+            self.count_var.set("")
+        elif self.view is None:
+            self.count_var.set(f"共 {self._shown_rows} 个文件")
+        else:
+            self.count_var.set(f"共 {self._shown_rows} 个文件，显示 {total} 个")
+
+    @staticmethod
+    def _values(table, index):
+        size = table.sizes[index]
+        return (
+            table.path(index),
+            table.destination(index) or "",
+            table.category(index) or "",
+            f"{size / 1024:.1f} KB" if size >= 1024 else f"{size} B",
+            STATUS_LABELS[table.status(index)],
+            table.error(index) or "",
+        )
+
+    def scroll_to(self, offset):
+        self.offset = int(offset)
+        self.refresh()
+
+    def _on_scrollbar(self, *args):
+        total = self.row_count()
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = RESULT_ROWS if args[2] == "pages" else 1
+            self.scroll_to(self.offset + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        if event.num == 4 or getattr(event, "delta", 0) > 0:
+            self.scroll_to(self.offset - RESULT_WHEEL_ROWS)
+        else:
+            self.scroll_to(self.offset + RESULT_WHEEL_ROWS)
+        return "break"
+
+    def export(self):
+        """把当前显示的行（筛选、排序后）逐行导出为 CSV 或 JSON Lines"""
+        table = self.table
+        if table is None or not len(table):
+            messagebox.showwarning("警告", "没有可以导出的整理结果！")
+            return
+        path = filedialog.asksaveasfilename(
+            title="导出整理结果",
+            defaultextension=".csv",
+            filetypes=[("CSV 文件", "*.csv"), ("JSON Lines 文件", "*.jsonl")]
+        )
+        if not path:
+            return
+        rows = self.view
+
+        def write():
+            try:
+                count = table.export(path, rows)
+            except OSError as e:
+                self.log(f"导出整理结果失败: {e}")
+                return
+            self.log(f"已导出 {count} 条整理结果: {path}")
+
+        threading.Thread(target=write, daemon=True).start()
 
 
 class FileOrganizerApp:
@@ -34,8 +274,17 @@ class FileOrganizerApp:
         except:
             pass
 
-        # 线程安全的消息队列
-        self.message_queue = queue.Queue()
+        # 线程安全的消息通道（进度/状态只保留最新值，日志有上限）
+        self.message_queue = UpdateChannel()
+
+        # 整理引擎（扫描、分类、移动都在引擎中完成）
+        self.engine = OrganizerEngine(
+            on_log=self.log,
+            on_progress=self._on_engine_progress,
+            on_status=self.update_status,
+            metrics=True,
+            run_table=True
+        )
 
         # 设置样式
         self.setup_styles()
@@ -124,6 +373,15 @@ class FileOrganizerApp:
         )
         browse_btn.pack(side=tk.RIGHT)
 
+        # 批量整理：追加多个文件夹（用路径分隔符分开），在多个进程中同时整理
+        add_btn = ttk.Button(
+            path_frame,
+            text="添加文件夹...",
+            command=self.add_folder,
+            width=12
+        )
+        add_btn.pack(side=tk.RIGHT, padx=(0, 5))
+
         # 选项框架
         options_frame = ttk.LabelFrame(scrollable_frame, text="选项", padding=10)
         options_frame.pack(fill=tk.X, pady=(0, 15))
@@ -217,6 +475,16 @@ class FileOrganizerApp:
         )
         stats_label.pack(pady=(5, 0))
 
+        # 性能摘要（各阶段耗时、移动延迟、界面队列峰值）
+        self.metrics_var = tk.StringVar(value="")
+        metrics_label = ttk.Label(
+            status_frame,
+            textvariable=self.metrics_var,
+            font=("Arial", 8),
+            foreground="#95a5a6"
+        )
+        metrics_label.pack(pady=(2, 0))
+
         # 日志文本框 - 减少高度
         log_frame = ttk.LabelFrame(scrollable_frame, text="操作日志", padding=10)
         log_frame.pack(fill=tk.X, pady=(0, 15))
@@ -231,6 +499,13 @@ class FileOrganizerApp:
         self.log_text.pack(fill=tk.X, expand=False)
         self.log_text.config(background="#f9f9f9")
 
+        # 整理结果列表（每个文件的目标、状态、错误，可筛选、排序和导出）
+        self.results_panel = ResultsPanel(
+            scrollable_frame,
+            post=lambda value: self.message_queue.put("results_view", value),
+            log=self.log
+        )
+
         # 按钮框架 - 确保按钮可见
         button_frame = ttk.LabelFrame(scrollable_frame, text="控制面板", padding=15)
         button_frame.pack(fill=tk.X, pady=(0, 10), ipady=5)
@@ -300,37 +575,47 @@ class FileOrganizerApp:
         tip_label.pack(pady=(10, 5))
 
     def process_messages(self):
-        """处理消息队列中的消息（线程安全）"""
-        try:
-            while True:
-                message = self.message_queue.get_nowait()
-                message_type = message[0]
-
-                if message_type == "log":
-                    self._log_message(message[1])
-                elif message_type == "progress":
-                    self._update_progress(message[1])
-                elif message_type == "status":
-                    self._update_status(message[1])
-                elif message_type == "stats":
-                    self._update_stats(message[1])
-
-        except queue.Empty:
-            pass
-
-        # 每100ms检查一次消息队列
-        self.root.after(100, self.process_messages)
+        """处理消息通道中的消息（线程安全）"""
+        metrics = self.engine.metrics
+        if metrics is not None and self.is_organizing:
+            metrics.gauge("message_queue_depth", self.message_queue.qsize())
+        lines, latest, dropped = self.message_queue.drain()
+
+        if dropped:
+            lines.insert(0, f"... 省略了 {dropped} 条日志 ...")
+        if lines:
+            self._log_lines(lines)
+
+        if "progress" in latest:
+            self._update_progress(latest["progress"])
+        if "status" in latest:
+            self._update_status(latest["status"])
+        if "stats" in latest:
+            self._update_stats(latest["stats"])
+        if "metrics" in latest:
+            self.metrics_var.set(latest["metrics"])
+        if "results" in latest:
+            self.results_panel.set_table(latest["results"])
+        elif self.is_organizing:
+            self.results_panel.follow(self.engine.run_table)
+        if "results_view" in latest:
+            self.results_panel.set_view(latest["results_view"])
+
+        # 每100ms检查一次消息通道
+        self.root.after(UI_REFRESH_MS, self.process_messages)
+
+    def _log_lines(self, lines):
+        """一次性插入一批日志行"""
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+
+        # 限制日志长度，防止内存泄漏（一次删除所有超出的行）
+        # 文本以换行结尾，end-1c 所在的行是最后的空行
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > MAX_LOG_LINES:
+            self.log_text.delete(1.0, f"{line_count - MAX_LOG_LINES + 1}.0")
 
-    def _log_message(self, message):
-        """线程安全的日志记录"""
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
         self.log_text.see(tk.END)
 
-        # 限制日志长度，防止内存泄漏
-        if self.log_text.index('end-1c').split('.')[0] > '1000':
-            self.log_text.delete(1.0, "2.0")
-
     def _update_progress(self, value):
         """线程安全的进度更新"""
         self.progress_var.set(value)
@@ -345,20 +630,20 @@ class FileOrganizerApp:
         self.stats_var.set(stats)
 
     def log(self, message):
-        """将日志消息放入队列"""
-        self.message_queue.put(("log", message))
+        """将日志消息放入通道"""
+        self.message_queue.log(message)
 
     def update_progress(self, value):
-        """将进度更新放入队列"""
-        self.message_queue.put(("progress", value))
+        """将进度更新放入通道（只保留最新值）"""
+        self.message_queue.put("progress", value)
 
     def update_status(self, status):
-        """将状态更新放入队列"""
-        self.message_queue.put(("status", status))
+        """将状态更新放入通道（只保留最新值）"""
+        self.message_queue.put("status", status)
 
     def update_stats(self, stats):
-        """将统计信息放入队列"""
-        self.message_queue.put(("stats", stats))
+        """将统计信息放入通道（只保留最新值）"""
+        self.message_queue.put("stats", stats)
 
     def browse_folder(self):
         """打开文件夹选择对话框"""
@@ -367,14 +652,27 @@ class FileOrganizerApp:
             self.path_var.set(folder_selected)
             self.log(f"已选择文件夹: {folder_selected}")
 
+    def add_folder(self):
+        """追加一个要批量整理的文件夹"""
+        folder_selected = filedialog.askdirectory(title="添加要整理的文件夹")
+        if folder_selected:
+            current = self.path_var.get().strip()
+            self.path_var.set(f"{current}{os.pathsep}{folder_selected}" if current else folder_selected)
+            self.log(f"已添加文件夹: {folder_selected}")
+
+    def selected_folders(self):
+        """路径输入框中的文件夹列表（多个文件夹用路径分隔符分开）"""
+        return [p.strip() for p in self.path_var.get().split(os.pathsep) if p.strip()]
+
     def clear_log(self):
         """清空日志"""
         self.log_text.delete(1.0, tk.END)
         self.log("日志已清空")
 
     def open_target_folder(self):
-        """打开目标文件夹"""
-        target_folder = self.path_var.get().strip()
+        """打开目标文件夹（批量整理时打开第一个）"""
+        folders = self.selected_folders()
+        target_folder = folders[0] if folders else ""
         if target_folder and os.path.exists(target_folder):
             try:
                 if os.name == 'nt':  # Windows
@@ -388,24 +686,25 @@ class FileOrganizerApp:
 
     def start_organize(self):
         """开始整理文件"""
-        target_folder = self.path_var.get().strip()
+        folders = self.selected_folders()
 
         # 验证文件夹路径
-        if not target_folder:
+        if not folders:
             messagebox.showwarning("警告", "请先选择要整理的文件夹！")
             return
 
-        try:
-            target_path = Path(target_folder)
-            if not target_path.exists():
-                messagebox.showerror("错误", f"文件夹不存在:\n{target_folder}")
-                return
-            if not target_path.is_dir():
-                messagebox.showerror("错误", f"路径不是文件夹:\n{target_folder}")
+        for target_folder in folders:
+            try:
+                target_path = Path(target_folder)
+                if not target_path.exists():
+                    messagebox.showerror("错误", f"文件夹不存在:\n{target_folder}")
+                    return
+                if not target_path.is_dir():
+                    messagebox.showerror("错误", f"路径不是文件夹:\n{target_folder}")
+                    return
+            except Exception as e:
+                messagebox.showerror("错误", f"路径无效:\n{e}")
                 return
-        except Exception as e:
-            messagebox.showerror("错误", f"路径无效:\n{e}")
-            return
 
         # 禁用开始按钮，启用停止按钮
         self.organize_btn.config(state=tk.DISABLED)
@@ -416,172 +715,66 @@ class FileOrganizerApp:
         self.processed_files = 0
         self.update_progress(0)
         self.update_stats("")
+        self.results_panel.set_table(None)
 
-        # 在新线程中执行整理操作
-        self.organize_thread = threading.Thread(
-            target=self.organize_files,
-            args=(target_folder, self.recursive_var.get(), self.skip_errors_var.get()),
-            daemon=True
-        )
+        # 在新线程中执行整理操作（多个文件夹时批量整理）
+        if len(folders) > 1:
+            target, args = self.organize_batch, (folders, self.recursive_var.get(), self.skip_errors_var.get())
+        else:
+            target, args = self.organize_files, (folders[0], self.recursive_var.get(), self.skip_errors_var.get())
+        self.organize_thread = threading.Thread(target=target, args=args, daemon=True)
         self.organize_thread.start()
 
     def stop_organize(self):
         """停止整理"""
         self.is_organizing = False
+        self.engine.stop()
         self.update_status("正在停止...")
         self.log("用户请求停止整理操作")
 
     def collect_files(self, folder_path, recursive=False):
         """收集要整理的文件列表"""
-        all_files = []
-        folder_path = Path(folder_path)
-
-        try:
-            if recursive:
-                # 递归收集所有文件
-                for root, dirs, files in os.walk(folder_path):
-                    # 跳过已经创建的分类文件夹
-                    dirs[:] = [d for d in dirs if d not in FILE_CATEGORIES.keys()]
-
-                    for file in files:
-                        file_path = Path(root) / file
-                        # 跳过分类文件夹中的文件
-                        if file_path.parent.name not in FILE_CATEGORIES.keys():
-                            all_files.append(str(file_path))
-            else:
-                # 只收集当前文件夹中的文件
-                for item in folder_path.iterdir():
-                    if item.is_file():
-                        all_files.append(str(item))
+        return self.engine.collect_files(folder_path, recursive)
 
-        except PermissionError as e:
-            self.log(f"权限错误，无法访问文件夹: {e}")
-        except Exception as e:
-            self.log(f"扫描文件时出错: {e}")
-
-        return all_files
+    def _on_engine_progress(self, processed, total):
+        """引擎进度回调"""
+        self.processed_files = processed
+        self.total_files = total
+        self.update_progress(int((processed / total) * 100) if total else 0)
 
     def organize_files(self, target_folder, recursive=False, skip_errors=True):
-        """整理文件的主要逻辑"""
+        """整理文件的主要逻辑（在工作线程中调用引擎）"""
         try:
-            self.update_status("正在扫描文件...")
-            self.log("开始扫描文件...")
-
-            # 获取所有文件
-            all_files = self.collect_files(target_folder, recursive)
-            self.total_files = len(all_files)
-
-            if self.total_files == 0:
-                self.log("目标文件夹中没有找到可整理的文件。")
-                self.update_status("没有找到文件")
-                self.finish_organize()
+            result = self.engine.organize(target_folder, recursive, skip_errors)
+            self.total_files = result.total_files
+            if result.metrics is not None:
+                self.message_queue.put("metrics", result.metrics.summary())
+            # 整理结束：结果列表按当前筛选条件重新计算
+            self.message_queue.put("results", result.run_table)
+
+            if result.total_files == 0:
                 return
 
-            self.log(f"找到 {self.total_files} 个文件，开始整理...")
-            self.update_status(f"正在整理文件 (0/{self.total_files})")
-
-            # 预创建分类文件夹
-            for category in FILE_CATEGORIES.keys():
-                category_folder = Path(target_folder) / category
-                try:
-                    if not category_folder.exists():
-                        category_folder.mkdir(exist_ok=True)
-                        self.log(f"创建文件夹: {category}")
-                except Exception as e:
-                    self.log(f"创建文件夹 {category} 失败: {e}")
-
-            # 处理每个文件
-            moved_files = 0
-            skipped_files = 0
-            error_files = 0
-
-            for i, file_path in enumerate(all_files):
-                if not self.is_organizing:
-                    break
-
-                try:
-                    file_path = Path(file_path)
-                    filename = file_path.name
-
-                    # 获取文件扩展名
-                    ext = file_path.suffix.lower().lstrip('.')
-
-                    # 根据扩展名找到对应的分类
-                    found_category = '其他'
-                    for category, exts in FILE_CATEGORIES.items():
-                        if ext in exts:
-                            found_category = category
-                            break
-
-                    # 目标路径
-                    category_folder = Path(target_folder) / found_category
-                    target_path = category_folder / filename
-
-                    # 如果目标文件已存在，添加序号
-                    counter = 1
-                    while target_path.exists():
-                        name_parts = file_path.stem.split('_')
-                        if len(name_parts) > 1 and name_parts[-1].isdigit():
-                            base_name = '_'.join(name_parts[:-1])
-                        else:
-                            base_name = file_path.stem
-
-                        new_filename = f"{base_name}_{counter}{file_path.suffix}"
-                        target_path = category_folder / new_filename
-                        counter += 1
-
-                    # 移动文件
-                    shutil.move(str(file_path), str(target_path))
-                    self.log(f"已移动: {filename} -> {found_category}/")
-                    moved_files += 1
-
-                except PermissionError as e:
-                    error_msg = f"权限错误，无法移动文件 {filename}: {e}"
-                    self.log(error_msg)
-                    error_files += 1
-                    if not skip_errors:
-                        raise
-                except shutil.Error as e:
-                    error_msg = f"移动文件 {filename} 时出错: {e}"
-                    self.log(error_msg)
-                    error_files += 1
-                    if not skip_errors:
-                        raise
-                except Exception as e:
-                    error_msg = f"处理文件 {filename} 时出错: {e}"
-                    self.log(error_msg)
-                    error_files += 1
-                    if not skip_errors:
-                        raise
-
-                # 更新进度
-                self.processed_files += 1
-                progress_percent = int((self.processed_files / self.total_files) * 100)
-                self.update_progress(progress_percent)
-                self.update_status(f"正在整理文件 ({self.processed_files}/{self.total_files})")
-
             # 整理完成
-            if self.is_organizing:
+            if not result.stopped:
                 self.log("=" * 40)
                 self.log(f"整理完成！")
-                self.log(f"成功移动: {moved_files} 个文件")
-                self.log(f"跳过文件: {skipped_files} 个")
-                self.log(f"错误文件: {error_files} 个")
+                self.log(f"成功移动: {result.moved_files} 个文件")
+                self.log(f"跳过文件: {result.skipped_files} 个")
+                self.log(f"错误文件: {result.error_files} 个")
                 self.log("=" * 40)
 
-                stats_text = f"成功: {moved_files} | 跳过: {skipped_files} | 错误: {error_files}"
+                stats_text = f"成功: {result.moved_files} | 跳过: {result.skipped_files} | 错误: {result.error_files}"
                 self.update_stats(stats_text)
-                self.update_status("整理完成")
 
                 messagebox.showinfo("完成",
                                     f"文件整理完成！\n\n"
-                                    f"总文件数: {self.total_files}\n"
-                                    f"成功移动: {moved_files}\n"
-                                    f"跳过文件: {skipped_files}\n"
-                                    f"错误文件: {error_files}")
+                                    f"总文件数: {result.total_files}\n"
+                                    f"成功移动: {result.moved_files}\n"
+                                    f"跳过文件: {result.skipped_files}\n"
+                                    f"错误文件: {result.error_files}")
             else:
-                self.update_status("整理已停止")
-                self.update_stats(f"已处理: {self.processed_files} 个文件")
+                self.update_stats(f"已处理: {result.processed_files} 个文件")
 
         except Exception as e:
             self.log(f"整理过程中发生严重错误: {e}")
@@ -591,6 +784,55 @@ class FileOrganizerApp:
         finally:
             self.finish_organize()
 
+    def organize_batch(self, folders, recursive=False, skip_errors=True):
+        """在多个进程中同时整理多个文件夹（在工作线程中调用）"""
+        finished = []
+
+        def on_result(entry):
+            finished.append(entry)
+            if entry.get('error'):
+                self.log(f"整理 {entry['target_folder']} 失败: {entry['error']}")
+            else:
+                self.log(f"已完成 {entry['target_folder']}: 成功 {entry['moved_files']} 个，"
+                         f"跳过 {entry['skipped_files']} 个，错误 {entry['error_files']} 个")
+            self.update_progress(int(len(finished) / len(folders) * 100))
+            self.update_status(f"正在批量整理 ({len(finished)}/{len(folders)} 个文件夹)")
+
+        try:
+            self.log(f"开始批量整理 {len(folders)} 个文件夹...")
+            self.update_status(f"正在批量整理 (0/{len(folders)} 个文件夹)")
+            report = run_batch(
+                folders,
+                {'recursive': recursive, 'skip_errors': skip_errors},
+                processes=min(len(folders), os.cpu_count() or 1),
+                on_result=on_result,
+                keep_running=lambda: self.is_organizing
+            )
+            summary = report.to_dict()
+            stats_text = (f"文件夹: {summary['roots']}（失败 {summary['failed_roots']}） | "
+                          f"成功: {summary['moved_files']} | 跳过: {summary['skipped_files']} | "
+                          f"错误: {summary['error_files']}")
+            self.update_stats(stats_text)
+            if report.stopped:
+                self.update_status("批量整理已停止")
+            else:
+                self.update_status("批量整理完成")
+                messagebox.showinfo("完成",
+                                    f"批量整理完成！\n\n"
+                                    f"文件夹数: {summary['roots']}（失败 {summary['failed_roots']}）\n"
+                                    f"总文件数: {summary['total_files']}\n"
+                                    f"成功移动: {summary['moved_files']}\n"
+                                    f"跳过文件: {summary['skipped_files']}\n"
+                                    f"错误文件: {summary['error_files']}")
+
+        except Exception as e:
+            self.log(f"批量整理过程中发生严重错误: {e}")
+            self.update_status("整理出错")
+            messagebox.showerror("错误", f"批量整理过程中发生严重错误:\n{e}")
+
+        finally:
+            self.finish_organize()
+
     def finish_organize(self):
         """整理完成后的清理工作"""
         self.is_organizing = False
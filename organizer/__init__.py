@@ -0,0 +1,11 @@
+"""文件整理工具的无界面核心
+
+命令行用法: python -m organizer <文件夹> [--recursive] [--json]
+"""
+from .engine import OrganizeResult, OrganizerEngine
+from .rules import DEFAULT_CATEGORY, FILE_CATEGORIES, Classifier, RuleError, compile_rules, load_rules
+
+__all__ = [
+    'DEFAULT_CATEGORY', 'FILE_CATEGORIES', 'Classifier', 'OrganizeResult', 'OrganizerEngine',
+    'RuleError', 'compile_rules', 'load_rules',
+]
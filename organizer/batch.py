@@ -0,0 +1,319 @@
+"""批量整理：把多个目标文件夹分配到进程池中并行整理
+
+每个目标文件夹在独立的工作进程中由一个 OrganizerEngine 整理，分类、哈希等
+CPU 工作不受 GIL 限制。调度器在主进程中运行，按文件夹所在的物理设备（分区
+归到所在磁盘）限制同时整理的文件夹数，同一块磁盘不会被多个进程同时随机读写。
+
+任何一个文件夹出错（包括工作进程崩溃）只记录在它自己的结果中，不影响其他
+文件夹；工作进程崩溃时，同时在整理的其他文件夹会在新的进程池中重试一次
+（记录移动日志时按续做方式重试）。
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+# 每个物理设备默认同时整理的文件夹数
+DEFAULT_ROOTS_PER_DEVICE = 1
+
+# 工作进程崩溃时，受牵连的文件夹最多重试的次数
+MAX_ROOT_RETRIES = 1
+
+# 工作进程中的停止事件（由进程池的 initializer 设置）
+_stop_event = None
+
+
+def read_manifest(path):
+    """读取目标文件夹清单：每行一个路径，忽略空行和 # 开头的注释；path 为 '-' 时读标准输入"""
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    roots = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            roots.append(line)
+    return roots
+
+
+def physical_device(path):
+    """文件夹所在的物理设备标识
+
+    Linux 上通过 /sys/dev/block 把分区映射到所在的磁盘（sda1、sda2 -> sda）；
+    无法确定时使用 st_dev（即文件系统）。
+    """
+    st = os.stat(path)
+    try:
+        block = os.path.realpath(f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}")
+        if os.path.exists(os.path.join(block, 'partition')):
+            block = os.path.dirname(block)
+        if os.path.isdir(block):
+            return os.path.basename(block)
+    except (OSError, AttributeError):
+        pass
+    return st.st_dev
+
+
+class BatchReport:
+    """批量整理的汇总报告：每个文件夹一项结果（OrganizeResult.to_dict() 或错误）"""
+
+    def __init__(self):
+        self.roots = []
+        self.elapsed = 0.0
+        self.stopped = False
+
+    def add(self, entry):
+        self.roots.append(entry)
+
+    @property
+    def failed_roots(self):
+        return [entry for entry in self.roots if entry.get('error')]
+
+    def total(self, key):
+        return sum(entry.get(key, 0) for entry in self.roots)
+
+    def to_dict(self):
+        categories = {}
+        for entry in self.roots:
+            for category, count in entry.get('categories', {}).items():
+                categories[category] = categories.get(category, 0) + count
+        return {
+            'results': list(self.roots),
+            'roots': len(self.roots),
+            'failed_roots': len(self.failed_roots),
+            'moved_files': self.total('moved_files'),
+            'skipped_files': self.total('skipped_files'),
+            'error_files': self.total('error_files'),
+            'total_files': self.total('total_files'),
+            'categories': categories,
+            'stopped': self.stopped,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+def _stderr_logger(root):
+    name = os.path.basename(os.path.normpath(root)) or root
+
+    def log(message):
+        print(f"[{time.strftime('%H:%M:%S')}] [{name}] {message}", file=sys.stderr, flush=True)
+
+    return log
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _watch_stop(engine, finished):
+    """主进程请求停止时让引擎在当前移动完成后停下"""
+    while not finished.wait(0.2):
+        if _stop_event.is_set():
+            engine.stop()
+            return
+
+
+def organize_root(root, options):
+    """在工作进程中整理一个文件夹，返回可序列化的结果字典（出错时带 error）"""
+    from .engine import OrganizerEngine
+    from .rules import load_rules
+
+    started = time.monotonic()
+    finished = threading.Event()
+    try:
+        classifier = load_rules(options['rules']) if options.get('rules') else None
+        engine = OrganizerEngine(
+            on_log=_stderr_logger(root) if options.get('log') else None,
+            classifier=classifier,
+            workers=options.get('workers', 1),
+            journal=options.get('journal', False),
+            incremental=options.get('incremental', False),
+            sniff=options.get('sniff'),
+            dedupe=options.get('dedupe'),
+            metrics=options.get('metrics', False),
+            max_ops=options.get('max_ops'),
+            max_bandwidth=options.get('max_bandwidth'),
+            latency_target=options.get('latency_target'),
+            shard=options.get('shard'),
+            verify=options.get('verify'),
+            path_filter=options.get('path_filter'),
+            order=options.get('order') or 'scan',
+            pack=options.get('pack'),
+        )
+        if options.get('device_limit'):
+            engine.device_limit = options['device_limit']
+        if options.get('shard_size'):
+            engine.shard_size = options['shard_size']
+        if options.get('order_window'):
+            engine.order_window = options['order_window']
+        if options.get('pack_threshold'):
+            engine.pack_threshold = options['pack_threshold']
+        if options.get('pack_max_bytes'):
+            engine.pack_max_bytes = options['pack_max_bytes']
+        if options.get('pack_max_files'):
+            engine.pack_max_files = options['pack_max_files']
+        if _stop_event is not None:
+            threading.Thread(target=_watch_stop, args=(engine, finished), daemon=True).start()
+        if options.get('undo'):
+            result = engine.undo(root)
+        else:
+            result = engine.organize(root, options.get('recursive', False),
+                                     options.get('skip_errors', True), resume=options.get('resume', False))
+        return result.to_dict()
+    except Exception as e:
+        return {'target_folder': root, 'error': f"{type(e).__name__}: {e}",
+                'elapsed': round(time.monotonic() - started, 3)}
+    finally:
+        finished.set()
+
+
+def _share_budgets(options, concurrent):
+    """限速预算是整个批量整理的总量：平均分给同时整理的文件夹"""
+    if concurrent <= 1 or not (options.get('max_ops') or options.get('max_bandwidth')):
+        return options
+    options = dict(options)
+    if options.get('max_ops'):
+        options['max_ops'] = options['max_ops'] / concurrent
+    if options.get('max_bandwidth'):
+        options['max_bandwidth'] = max(1, options['max_bandwidth'] // concurrent)
+    return options
+
+
+def _failed(root, message):
+    return {'target_folder': root, 'error': message}
+
+
+class BatchScheduler:
+    """把文件夹分配给进程池，每个物理设备同时最多 per_device 个文件夹
+
+    on_result(结果字典) 在主进程中按完成顺序调用。keep_running() 返回 False 时
+    不再开始新的文件夹，正在整理的文件夹在当前移动完成后停止。
+    """
+
+    def __init__(self, processes=None, per_device=DEFAULT_ROOTS_PER_DEVICE, on_result=None,
+                 keep_running=None):
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        self.per_device = max(1, per_device)
+        self.on_result = on_result
+        self.keep_running = keep_running
+        self._context = None
+        self._stop_event = None
+
+    def _new_pool(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self._context is None:
+            # spawn：调用方（例如图形界面）可能已有其他线程，fork 不安全
+            self._context = multiprocessing.get_context('spawn')
+            self._stop_event = self._context.Event()
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=self._context,
+                                   initializer=_init_worker, initargs=(self._stop_event,))
+
+    def run(self, roots, options):
+        """整理 roots 中的全部文件夹，返回 BatchReport"""
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+
+        report = BatchReport()
+        started = time.monotonic()
+        # 设备 -> 等待中的文件夹；设备按第一次出现的顺序轮流调度
+        queues = collections.OrderedDict()
+        seen = set()
+        for root in roots:
+            root = os.path.abspath(root)
+            if os.path.realpath(root) in seen:
+                continue
+            seen.add(os.path.realpath(root))
+            try:
+                if not os.path.isdir(root):
+                    raise NotADirectoryError(f"路径不是有效的文件夹: {root}")
+                device = physical_device(root)
+            except OSError as e:
+                self._report(report, _failed(root, str(e)))
+                continue
+            queues.setdefault(device, collections.deque()).append(root)
+        pending = sum(len(queue) for queue in queues.values())
+        options = _share_budgets(options, min(pending, self.processes,
+                                              self.per_device * len(queues)))
+
+        active = collections.Counter()
+        retries = collections.Counter()
+        running = {}
+        pool = self._new_pool()
+        try:
+            while queues or running:
+                if not report.stopped and self.keep_running is not None and not self.keep_running():
+                    report.stopped = True
+                    self._stop_event.set()
+                    queues.clear()
+                # 各设备轮流提交，直到进程或设备名额用完
+                submitted = True
+                while submitted:
+                    submitted = False
+                    for device in list(queues):
+                        if len(running) >= self.processes:
+                            break
+                        if active[device] >= self.per_device:
+                            continue
+                        root = queues[device].popleft()
+                        if not queues[device]:
+                            del queues[device]
+                        root_options = options
+                        if retries[root] and options.get('journal'):
+                            # 重试时先续做被强制结束的那次整理中未完成的移动
+                            root_options = dict(options, resume=True)
+                        running[pool.submit(organize_root, root, root_options)] = (root, device, pool)
+                        active[device] += 1
+                        submitted = True
+
+                done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    root, device, owner = running.pop(future)
+                    active[device] -= 1
+                    try:
+                        self._report(report, future.result())
+                    except BrokenProcessPool:
+                        # 只有当前进程池的任务失败才需要换新的进程池
+                        broken = broken or owner is pool
+                        retries[root] += 1
+                        if retries[root] > MAX_ROOT_RETRIES or report.stopped:
+                            self._report(report, _failed(root, "工作进程异常退出"))
+                        else:
+                            queues.setdefault(device, collections.deque()).appendleft(root)
+                    except Exception as e:
+                        self._report(report, _failed(root, f"{type(e).__name__}: {e}"))
+                if broken:
+                    # 进程池已不可用：其余在途的文件夹也会失败，换一个新的进程池
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._new_pool()
+        except BaseException:
+            self._stop_event.set()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            report.elapsed = time.monotonic() - started
+        return report
+
+    def _report(self, report, entry):
+        report.add(entry)
+        if self.on_result is not None:
+            self.on_result(entry)
+
+
+def run_batch(roots, options=None, processes=None, per_device=DEFAULT_ROOTS_PER_DEVICE, on_result=None,
+              keep_running=None):
+    """批量整理多个文件夹，返回 BatchReport
+
+    options 为传给每个工作进程的整理设置（recursive、skip_errors、rules 文件路径、
+    workers、journal、incremental、sniff、dedupe、metrics、max_ops、max_bandwidth、
+    latency_target、shard、shard_size、verify、path_filter、order、order_window、
+    pack、pack_threshold、pack_max_bytes、pack_max_files、resume、undo、log）。
+    max_ops / max_bandwidth 为所有进程合计的预算。
+    """
+    scheduler = BatchScheduler(processes, per_device, on_result, keep_running)
+    return scheduler.run(roots, dict(options or {}))
@@ -0,0 +1,496 @@
+"""性能基准：生成合成目录树，分阶段测量整理的吞吐量
+
+用法::
+
+    python -m organizer.bench --files 50000 --depth 3 --collisions 0.1 --save base.json
+    python -m organizer.bench --files 50000 --depth 3 --collisions 0.1 --compare base.json
+
+树默认生成在 /dev/shm（不可用时在系统临时目录）。使用与命令行相同的无界面代码，
+依次测量：
+- scan:     扫描（Scanner，即 collect_files 使用的扫描）
+- classify: 分类
+- resolve:  重名处理（DestinationIndex 分配目标名）
+- move:     移动（Transfer）
+- organize: 在重新生成的同一棵树上完整运行 OrganizerEngine.organize()
+- organize_<排序方式>: --orders 指定时，用各种移动顺序（见 order.py）分别完整运行一次，
+  比较局部性排序的效果（应使用 --root 指向机械硬盘或 NFS 上的目录，并用
+  --drop-caches 在每次运行前清空页缓存，否则差别会被内存缓存掩盖）
+
+每个阶段报告耗时、文件/秒、CPU 时间、read/write 类系统调用数（/proc/self/io 的
+syscr/syscw，其他系统调用不在其中）、上下文切换次数和峰值 RSS（每个阶段开始前
+通过 /proc/self/clear_refs 重置）。结果可以保存为 JSON 基线，之后与基线比较。
+同一 --seed 生成的树完全相同。
+
+--memory 时另外用 tracemalloc 比较保存扫描结果的几种方式占用的内存：路径字符串
+列表（collect_files）、每个文件一个 (路径, 大小, mtime, 分类) 元组的列表，以及
+filetable.FileTable（collect_table）。
+"""
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .destination import DestinationIndex
+from .engine import OrganizerEngine
+from .order import ORDER_MODES
+from .transfer import Transfer
+
+# 默认的扩展名分布（权重）；空字符串表示没有扩展名
+DEFAULT_EXT_MIX = {
+    'jpg': 20, 'png': 8, 'pdf': 8, 'txt': 8, 'docx': 4, 'zip': 4, 'tar.gz': 2,
+    'mp4': 4, 'mp3': 6, 'py': 6, 'json': 4, 'exe': 2, 'dat': 4, '': 4,
+}
+
+PHASES = ('scan', 'classify', 'resolve', 'move', 'organize')
+
+# 比较基线时，文件/秒下降超过这个比例视为退化
+DEFAULT_THRESHOLD = 0.10
+
+
+class TreeSpec:
+    """合成目录树的参数"""
+
+    def __init__(self, files=10000, depth=2, fanout=8, ext_mix=None, size_median=4096,
+                 size_sigma=1.5, size_max=1024 * 1024, collisions=0.1, seed=1):
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.ext_mix = dict(ext_mix or DEFAULT_EXT_MIX)
+        # 文件大小服从对数正态分布（中位数 size_median），截断到 size_max
+        self.size_median = size_median
+        self.size_sigma = size_sigma
+        self.size_max = size_max
+        # 与其他文件同名（整理时需要编号）的文件比例
+        self.collisions = collisions
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def default_root():
+    """优先使用 tmpfs，避免测到磁盘缓存的状态"""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _directories(spec):
+    """按深度和扇出生成目录的相对路径列表（包括根目录 ''）"""
+    dirs = ['']
+    level = ['']
+    for depth in range(spec.depth):
+        level = [os.path.join(parent, f"d{depth}_{i}") for parent in level for i in range(spec.fanout)]
+        dirs.extend(level)
+    return dirs
+
+
+def generate_tree(root, spec):
+    """在 root 中生成合成目录树，返回 (文件数, 总字节数)"""
+    rnd = random.Random(spec.seed)
+    dirs = _directories(spec)
+    for rel in dirs[1:]:
+        os.makedirs(os.path.join(root, rel), exist_ok=True)
+    os.makedirs(root, exist_ok=True)
+
+    exts = list(spec.ext_mix)
+    weights = [spec.ext_mix[e] for e in exts]
+    # 文件内容取自同一块随机数据，开头写入序号保证内容互不相同
+    block = rnd.randbytes(spec.size_max)
+    # 重名的文件从一个较小的名称池中取名
+    pool = max(1, int(spec.files * spec.collisions / 4))
+    total_bytes = 0
+
+    for i in range(spec.files):
+        ext = rnd.choices(exts, weights)[0]
+        if rnd.random() < spec.collisions:
+            stem = f"dup{rnd.randrange(pool)}"
+        else:
+            stem = f"file{i}"
+        name = f"{stem}.{ext}" if ext else stem
+        folder = os.path.join(root, rnd.choice(dirs))
+        size = min(spec.size_max, int(rnd.lognormvariate(0, spec.size_sigma) * spec.size_median))
+        header = i.to_bytes(8, 'little')
+
+        path = os.path.join(folder, name)
+        if os.path.lexists(path):
+            path = os.path.join(folder, f"{stem}-{i}.{ext}" if ext else f"{stem}-{i}")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if size:
+                os.write(fd, header[:size] + block[:max(0, size - 8)])
+        finally:
+            os.close(fd)
+        total_bytes += size
+    return spec.files, total_bytes
+
+
+def _proc_io():
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                counters[key] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def _reset_peak_rss():
+    """重置峰值 RSS（Linux 4.0+），失败时返回 False（峰值为进程启动以来的值）"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kib():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class PhaseTimer:
+    """测量一个阶段：with PhaseTimer('scan', n) as timer: ...，结果在 timer.result
+
+    处理的数量事先不知道时，可以在 with 块结束前设置 timer.items。
+    """
+
+    def __init__(self, name, items=0):
+        self.name = name
+        self.items = items
+        self.result = None
+
+    def __enter__(self):
+        self._peak_reset = _reset_peak_rss()
+        self._io = _proc_io()
+        self._usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        io = _proc_io()
+        self.result = {
+            'items': self.items,
+            'seconds': round(wall, 6),
+            'files_per_sec': round(self.items / wall, 1) if wall > 0 else None,
+            'cpu_seconds': round(cpu, 6),
+            'read_syscalls': io.get('syscr', 0) - self._io.get('syscr', 0),
+            'write_syscalls': io.get('syscw', 0) - self._io.get('syscw', 0),
+            'context_switches': (usage.ru_nvcsw - self._usage.ru_nvcsw
+                                 + usage.ru_nivcsw - self._usage.ru_nivcsw),
+            'minor_faults': usage.ru_minflt - self._usage.ru_minflt,
+            'peak_rss_kib': _peak_rss_kib(),
+            'peak_rss_is_phase': self._peak_reset,
+        }
+        return False
+
+
+def _traced(build):
+    """调用 build() 并返回 (结果, 结果占用的字节数)"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        value = build()
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return value, used
+
+
+def measure_memory(tree, engine=None):
+    """比较保存扫描结果的几种方式占用的内存（字节）"""
+    engine = engine or OrganizerEngine()
+
+    def records():
+        rows = []
+        for entry in engine.make_scanner().scan(tree, recursive=True):
+            st = entry.stat(follow_symlinks=False)
+            rows.append((entry.path, st.st_size, st.st_mtime_ns, engine._classify(entry)))
+        return rows
+
+    paths, paths_bytes = _traced(lambda: engine.collect_files(tree, recursive=True))
+    rows, rows_bytes = _traced(records)
+    del rows
+    table, table_bytes = _traced(lambda: engine.collect_table(tree, recursive=True))
+    files = len(paths)
+    return {
+        'files': files,
+        'paths_bytes': paths_bytes,
+        'records_bytes': rows_bytes,
+        'table_bytes': table_bytes,
+        'table_reported_bytes': table.memory_usage(),
+        'reduction_vs_paths': round(1 - table_bytes / paths_bytes, 3) if paths_bytes else None,
+    }
+
+
+def drop_caches():
+    """同步并清空页缓存、目录项和 inode 缓存（需要 root 权限），成功时返回 True"""
+    os.sync()
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+    except OSError:
+        return False
+    return True
+
+
+def _organize_phase(tree, spec, name, cold=False, **options):
+    """在新生成的树上完整运行一次 organize()"""
+    generate_tree(tree, spec)
+    if cold and not drop_caches():
+        print("注意: 无法清空页缓存（需要 root 权限），结果包含缓存的影响", file=sys.stderr)
+    engine = OrganizerEngine(**options)
+    with PhaseTimer(name, spec.files) as timer:
+        organized = engine.organize(tree, recursive=True)
+    result = timer.result
+    result['moved_files'] = organized.moved_files
+    result['error_files'] = organized.error_files
+    shutil.rmtree(tree)
+    return result
+
+
+def run_phases(root, spec, workers=1, memory=False, orders=(), cold=False):
+    """在 root 下生成树并分阶段测量一次，返回 {阶段: 结果}"""
+    tree = os.path.join(root, 'tree')
+    results = {}
+
+    generate_tree(tree, spec)
+    engine = OrganizerEngine()
+    if memory:
+        results['memory'] = measure_memory(tree, engine)
+    scanner = engine.make_scanner()
+
+    with PhaseTimer('scan') as timer:
+        entries = list(scanner.scan(tree, recursive=True))
+        timer.items = len(entries)
+    results['scan'] = timer.result
+
+    with PhaseTimer('classify', len(entries)) as timer:
+        categories = [engine._classify(entry) for entry in entries]
+    results['classify'] = timer.result
+
+    engine._prepare_folders(tree)
+    destinations = DestinationIndex()
+    with PhaseTimer('resolve', len(entries)) as timer:
+        plan = []
+        for entry, category in zip(entries, categories):
+            folder = os.path.join(tree, category)
+            plan.append((entry.path, folder, destinations.reserve(folder, entry.name)))
+    results['resolve'] = timer.result
+
+    transfer = Transfer()
+    with PhaseTimer('move', len(plan)) as timer:
+        for src, folder, name in plan:
+            transfer.move(src, folder, name)
+    transfer.close()
+    results['move'] = timer.result
+
+    # 完整流程：同一棵树重新生成，与命令行使用相同的引擎设置
+    shutil.rmtree(tree)
+    results['organize'] = _organize_phase(tree, spec, 'organize', cold, workers=workers)
+    for order in orders:
+        name = f'organize_{order}'
+        results[name] = _organize_phase(tree, spec, name, cold, workers=workers, order=order)
+    return results
+
+
+def phase_names(report):
+    """报告中的阶段：固定阶段在前，然后是各排序方式的完整流程"""
+    phases = report.get('phases', {})
+    return [*PHASES, *(name for name in phases if name.startswith('organize_'))]
+
+
+def _median_results(runs):
+    """多次运行取每个阶段耗时的中位数那一次"""
+    merged = {}
+    for phase in runs[0]:
+        if phase == 'memory':
+            # 内存占用与计时无关，每次相同
+            merged[phase] = runs[0][phase]
+            continue
+        ordered = sorted((run[phase] for run in runs), key=lambda r: r['seconds'])
+        merged[phase] = ordered[len(ordered) // 2]
+    return merged
+
+
+def environment(root):
+    """记录运行环境，便于判断基线是否可比"""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'root': root,
+    }
+    try:
+        st = os.statvfs(root)
+        info['root_fs_blocks'] = st.f_blocks * st.f_frsize
+    except OSError:
+        pass
+    return info
+
+
+def run_benchmark(spec, root=None, repeat=1, workers=1, memory=False, orders=(), cold=False):
+    """运行基准，返回可保存为 JSON 基线的字典"""
+    root = root or default_root()
+    work = tempfile.mkdtemp(prefix='organizer-bench-', dir=root)
+    try:
+        runs = [run_phases(work, spec, workers, memory and i == 0, orders, cold) for i in range(max(1, repeat))]
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        'version': 1,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(root),
+        'spec': spec.to_dict(),
+        'workers': workers,
+        'repeat': max(1, repeat),
+        'phases': _median_results(runs),
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """与基线比较，返回 [(阶段, 基线文件/秒, 当前文件/秒, 变化比例, 是否退化)]"""
+    rows = []
+    for phase in phase_names(current):
+        old = baseline.get('phases', {}).get(phase, {}).get('files_per_sec')
+        new = current.get('phases', {}).get(phase, {}).get('files_per_sec')
+        if not old or not new:
+            continue
+        change = new / old - 1
+        rows.append((phase, old, new, change, change < -threshold))
+    return rows
+
+
+def _parse_ext_mix(text):
+    """解析 jpg=3,pdf=1,=2 形式的扩展名分布"""
+    mix = {}
+    for item in text.split(','):
+        ext, _, weight = item.partition('=')
+        mix[ext.strip().lstrip('.')] = float(weight or 1)
+    return mix
+
+
+def _parse_orders(text):
+    import argparse
+
+    orders = [item.strip() for item in text.split(',') if item.strip()]
+    for order in orders:
+        if order not in ORDER_MODES:
+            raise argparse.ArgumentTypeError(f"未知的排序方式: {order}")
+    return orders
+
+
+def format_results(report):
+    lines = [f"{'阶段':<20}{'文件数':>10}{'秒':>10}{'文件/秒':>12}{'读/写调用':>16}{'峰值RSS(KiB)':>14}"]
+    for phase in phase_names(report):
+        r = report['phases'].get(phase)
+        if r is None:
+            continue
+        lines.append(
+            f"{phase:<20}{r['items']:>10}{r['seconds']:>10.3f}{r['files_per_sec'] or 0:>12.0f}"
+            f"{r['read_syscalls']:>8}/{r['write_syscalls']:<7}{r['peak_rss_kib']:>14}"
+        )
+    memory = report['phases'].get('memory')
+    if memory and memory['files']:
+        files = memory['files']
+        lines.append("")
+        lines.append(f"保存 {files} 个文件的扫描结果占用的内存:")
+        for label, key in (("路径字符串列表", 'paths_bytes'), ("(路径, 大小, mtime, 分类) 元组列表", 'records_bytes'),
+                           ("FileTable", 'table_bytes')):
+            lines.append(f"  {label:<32}{memory[key] / 1048576:>10.1f} MiB{memory[key] / files:>10.1f} 字节/文件")
+        lines.append(f"  FileTable 比路径列表减少 {memory['reduction_vs_paths']:.0%}")
+    return '\n'.join(lines)
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="organizer.bench", description="文件整理性能基准")
+    parser.add_argument("--files", type=int, default=10000, help="文件数（默认 10000）")
+    parser.add_argument("--depth", type=int, default=2, help="目录深度（默认 2）")
+    parser.add_argument("--fanout", type=int, default=8, help="每层子目录数（默认 8）")
+    parser.add_argument("--ext-mix", type=_parse_ext_mix, default=None, metavar="MIX",
+                        help="扩展名分布，如 jpg=3,pdf=1,=1（空扩展名表示没有扩展名）")
+    parser.add_argument("--size-median", type=int, default=4096, metavar="BYTES",
+                        help="文件大小中位数（默认 4096）")
+    parser.add_argument("--size-max", type=int, default=1024 * 1024, metavar="BYTES",
+                        help="文件大小上限（默认 1 MiB）")
+    parser.add_argument("--collisions", type=float, default=0.1, metavar="RATIO",
+                        help="同名文件比例（默认 0.1）")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子（默认 1）")
+    parser.add_argument("-j", "--workers", type=int, default=1, metavar="N",
+                        help="完整流程使用的移动线程数")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N",
+                        help="重复次数，每个阶段取中位数")
+    parser.add_argument("--root", help="生成测试树的位置（默认 /dev/shm 或临时目录）")
+    parser.add_argument("--save", metavar="FILE", help="把结果保存为 JSON 基线")
+    parser.add_argument("--compare", metavar="FILE", help="与 JSON 基线比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="比较时视为退化的吞吐量下降比例（默认 0.1）")
+    parser.add_argument("--memory", action="store_true",
+                        help="同时比较路径列表与 FileTable 保存扫描结果的内存占用")
+    parser.add_argument("--orders", type=_parse_orders, default=(), metavar="MODES",
+                        help="另外用这些移动顺序各完整运行一次，如 scan,locality,inode,extent")
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="每次完整运行前清空页缓存（需要 root 权限）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 格式输出结果")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    spec = TreeSpec(
+        files=args.files, depth=args.depth, fanout=args.fanout, ext_mix=args.ext_mix,
+        size_median=args.size_median, size_max=args.size_max,
+        collisions=args.collisions, seed=args.seed,
+    )
+    report = run_benchmark(spec, root=args.root, repeat=args.repeat, workers=max(1, args.workers),
+                           memory=args.memory, orders=args.orders, cold=args.drop_caches)
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(format_results(report))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('spec') != report['spec']:
+            print("注意: 基线使用的树参数不同，结果不可直接比较", file=sys.stderr)
+        for phase, old, new, change, regressed in compare(report, baseline, args.threshold):
+            mark = "  <-- 退化" if regressed else ""
+            print(f"{phase:<20}{old:>12.0f} -> {new:>12.0f} 文件/秒 ({change:+.1%}){mark}",
+                  file=sys.stderr)
+            if regressed:
+                exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
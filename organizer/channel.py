@@ -0,0 +1,49 @@
+"""工作线程到界面线程的合并更新通道"""
+import collections
+import threading
+import time
+
+# 等待界面取走的日志行数上限（超出时丢弃最旧的行）
+LOG_RING_SIZE = 500
+
+
+class UpdateChannel:
+    """线程安全的界面更新通道
+
+    进度、状态、统计这类“只关心最新值”的消息只保留最后一个，日志放进固定
+    大小的环形缓冲区。界面线程每个周期调用一次 drain() 批量取走，
+    因此不论整理多少文件，队列占用和界面开销都有上限。
+    """
+
+    def __init__(self, max_log_lines=LOG_RING_SIZE):
+        self._lock = threading.Lock()
+        self._logs = collections.deque(maxlen=max_log_lines)
+        self._latest = {}
+        self._dropped = 0
+
+    def log(self, message):
+        """追加一行日志（带时间戳）"""
+        line = f"[{time.strftime('%H:%M:%S')}] {message}"
+        with self._lock:
+            if len(self._logs) == self._logs.maxlen:
+                self._dropped += 1
+            self._logs.append(line)
+
+    def put(self, kind, value):
+        """设置某类消息的最新值（覆盖尚未取走的旧值）"""
+        with self._lock:
+            self._latest[kind] = value
+
+    def qsize(self):
+        """尚未取走的消息数"""
+        with self._lock:
+            return len(self._logs) + len(self._latest)
+
+    def drain(self):
+        """取走全部待处理消息，返回 (日志行列表, {类型: 最新值}, 丢弃的日志行数)"""
+        with self._lock:
+            logs = list(self._logs)
+            self._logs.clear()
+            latest, self._latest = self._latest, {}
+            dropped, self._dropped = self._dropped, 0
+        return logs, latest, dropped
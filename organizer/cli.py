@@ -0,0 +1,476 @@
+"""命令行入口（供 python -m organizer 或 console_scripts 使用）"""
+import sys
+import time
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="organizer",
+        description="自动将文件按类型分类到相应文件夹中",
+    )
+    parser.add_argument("paths", nargs="*", help="要整理的文件夹")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="同时整理子文件夹中的文件")
+    parser.add_argument("--no-skip-errors", dest="skip_errors", action="store_false",
+                        help="遇到错误时立即停止（默认跳过并继续）")
+    parser.add_argument("--rules", metavar="FILE",
+                        help="JSON 格式的自定义分类规则文件")
+    parser.add_argument("-j", "--workers", type=int, default=1, metavar="N",
+                        help="并行移动的线程数（默认 1，即逐个移动）")
+    parser.add_argument("--device-limit", type=int, default=None, metavar="N",
+                        help="每个设备同时进行的移动数上限")
+    parser.add_argument("--journal", action="store_true",
+                        help="记录移动日志（保存在目标文件夹的 .file_organizer 中），可用于续做和撤销")
+    parser.add_argument("--resume", action="store_true",
+                        help="先完成上次中断的整理，再继续整理（隐含 --journal）")
+    parser.add_argument("--undo", action="store_true",
+                        help="撤销最近一次记录了日志的整理")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量整理：跳过上次整理后没有变化的目录和文件")
+    parser.add_argument("--sniff", nargs="?", const="unknown", choices=("unknown", "all"),
+                        help="按文件内容识别类型：unknown（默认）只识别扩展名不认识的文件，"
+                             "all 在内容与扩展名不符时以内容为准")
+    parser.add_argument("--exclude", dest="filters", action="append", metavar="PATTERN",
+                        help="不整理匹配 gitignore 风格规则的文件或文件夹（可重复，例如 node_modules/、*.tmp）")
+    parser.add_argument("--include", dest="filters", action="append", metavar="PATTERN", type=lambda p: "!" + p,
+                        help="重新包含被前面的 --exclude 排除的文件（相当于 !PATTERN）")
+    parser.add_argument("--ignore-file", metavar="FILE",
+                        help="从 gitignore 格式的文件读取排除规则")
+    parser.add_argument("--exclude-common", action="store_true",
+                        help="排除 .git、node_modules、快照目录等常见的不需要整理的文件夹")
+    parser.add_argument("--max-depth", type=int, default=None, metavar="N",
+                        help="递归时最多进入 N 层子文件夹")
+    parser.add_argument("-x", "--one-file-system", action="store_true",
+                        help="递归时不进入其他文件系统的挂载点")
+    parser.add_argument("--symlinks", choices=("move", "skip", "follow"), default="move",
+                        help="符号链接：move 把链接本身移动（默认），skip 忽略，follow 同时进入指向文件夹的链接")
+    parser.add_argument("--order", choices=("scan", "locality", "inode", "extent"), default="scan",
+                        help="移动顺序：scan 按扫描顺序（默认），locality 按目标分类和源目录分组，"
+                             "inode 按 inode 号，extent 按数据在磁盘上的物理位置（机械硬盘、NFS 上减少寻道）")
+    parser.add_argument("--order-window", type=int, default=None, metavar="N",
+                        help="每 N 个文件排序一次（默认 4096）")
+    parser.add_argument("--dedupe", choices=("skip", "hardlink", "folder"),
+                        help="检测与分类文件夹中已有文件内容相同的文件：skip 留在原处，"
+                             "hardlink 改为硬链接，folder 移到“重复文件”文件夹")
+    parser.add_argument("--watch", action="store_true",
+                        help="整理后继续监视文件夹，自动整理新出现并已写完的文件（按 Ctrl+C 停止）")
+    parser.add_argument("--settle", type=float, default=None, metavar="SECONDS",
+                        help="监视模式下文件最后一次写入后等待多少秒再整理（默认 2）")
+    parser.add_argument("--poll", action="store_true",
+                        help="监视模式下使用定时轮询代替 inotify")
+    parser.add_argument("--plan", metavar="FILE",
+                        help="只制定整理方案并保存到 FILE，不移动文件（可用 python -m organizer.plan 查看和比较）")
+    parser.add_argument("--apply", metavar="FILE",
+                        help="执行 --plan 保存的方案（跳过制定方案后有变化的文件）")
+    parser.add_argument("--metrics-json", metavar="FILE",
+                        help="把各阶段耗时、调用次数和移动延迟写入 JSON 文件")
+    parser.add_argument("--metrics-prom", metavar="FILE",
+                        help="把指标写入 Prometheus 文本格式文件（供 node exporter 的 textfile collector 读取）")
+    parser.add_argument("--report", metavar="FILE",
+                        help="把每个文件的结果（源、目标、分类、大小、状态、错误）写入 CSV，扩展名为 .jsonl 时写 JSON Lines")
+    parser.add_argument("--shard", choices=("month", "hash", "count"),
+                        help="把分类文件夹再分成子文件夹：month 按修改时间的年/月，hash 按文件名哈希（256 个），"
+                             "count 按顺序装满编号子文件夹")
+    parser.add_argument("--shard-size", type=int, default=None, metavar="N",
+                        help="--shard count 时每个子文件夹最多的条目数（默认 10000）")
+    parser.add_argument("--pack", nargs="?", const="tar", choices=("tar", "zip"),
+                        help="把小文件写入每个分类的归档（默认 tar）而不是逐个移动，归档校验通过后才删除源文件")
+    parser.add_argument("--pack-threshold", type=_size, default=None, metavar="SIZE",
+                        help="--pack 时小于 SIZE 的文件被打包（默认 4K）")
+    parser.add_argument("--pack-max-size", type=_size, default=None, metavar="SIZE",
+                        help="每个归档最多的数据量（默认 256M）")
+    parser.add_argument("--pack-max-files", type=int, default=None, metavar="N",
+                        help="每个归档最多的文件数（默认 10000）")
+    parser.add_argument("--verify", nargs="?", const="blake2b", metavar="ALGO",
+                        help="跨设备复制后读回目标文件校验，一致才删除源文件（默认算法 blake2b）")
+    parser.add_argument("--max-ops", type=float, default=None, metavar="N",
+                        help="每秒最多移动 N 个文件")
+    parser.add_argument("--max-bandwidth", type=_size, default=None, metavar="SIZE",
+                        help="跨设备复制每秒最多的数据量（例如 50M、1G）")
+    parser.add_argument("--latency-target", type=float, default=None, metavar="MS",
+                        help="移动延迟目标（毫秒），平均延迟超过时自动降速，恢复后逐步提速")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="批量整理：从 FILE 读取目标文件夹列表（每行一个，- 表示标准输入）")
+    parser.add_argument("-P", "--processes", type=int, default=None, metavar="N",
+                        help="批量整理：用 N 个进程同时整理多个文件夹（默认 CPU 核数）")
+    parser.add_argument("--per-device", type=int, default=None, metavar="N",
+                        help="批量整理：每块物理磁盘上同时整理的文件夹数（默认 1）")
+    parser.add_argument("--json", action="store_true",
+                        help="以 JSON 格式输出统计结果")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="不输出逐个文件的日志")
+    return parser
+
+
+def _size(text):
+    from argparse import ArgumentTypeError
+
+    from .throttle import parse_size
+
+    try:
+        return parse_size(text)
+    except ValueError:
+        raise ArgumentTypeError(f"无效的数据量: {text}")
+
+
+def _stderr_log(message):
+    timestamp = time.strftime("%H:%M:%S")
+    print(f"[{timestamp}] {message}", file=sys.stderr)
+
+
+def main(argv=None):
+    """命令行主函数，返回进程退出码"""
+    from pathlib import Path
+
+    from .engine import OrganizerEngine
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.paths and not args.manifest:
+        parser.error("请指定要整理的文件夹或 --manifest")
+    if (args.max_ops is not None and args.max_ops <= 0) or (
+            args.latency_target is not None and args.latency_target <= 0):
+        parser.error("--max-ops 和 --latency-target 必须大于 0")
+    if args.verify:
+        import hashlib
+
+        if args.verify not in hashlib.algorithms_available:
+            parser.error(f"不支持的校验算法: {args.verify}")
+
+    classifier = None
+    if args.rules:
+        from .rules import RuleError, load_rules
+
+        try:
+            classifier = load_rules(args.rules)
+        except RuleError as e:
+            _stderr_log(str(e))
+            return 2
+
+    try:
+        path_filter = _path_filter(args)
+    except (OSError, ValueError) as e:
+        _stderr_log(f"无法读取排除规则: {e}")
+        return 2
+
+    engine = OrganizerEngine(
+        on_log=None if args.quiet else _stderr_log,
+        classifier=classifier,
+        workers=max(1, args.workers),
+        journal=args.journal,
+        incremental=args.incremental,
+        sniff=args.sniff,
+        dedupe=args.dedupe,
+        metrics=bool(args.metrics_json or args.metrics_prom),
+        max_ops=args.max_ops,
+        max_bandwidth=args.max_bandwidth,
+        latency_target=args.latency_target / 1000 if args.latency_target else None,
+        run_table=bool(args.report),
+        shard=args.shard,
+        verify=args.verify,
+        path_filter=path_filter,
+        order=args.order,
+        pack=args.pack,
+    )
+    if args.pack_threshold:
+        engine.pack_threshold = args.pack_threshold
+    if args.pack_max_size:
+        engine.pack_max_bytes = args.pack_max_size
+    if args.pack_max_files:
+        engine.pack_max_files = args.pack_max_files
+    if args.order_window:
+        engine.order_window = args.order_window
+    if args.shard_size:
+        engine.shard_size = args.shard_size
+    if args.device_limit:
+        engine.device_limit = args.device_limit
+
+    if args.manifest or args.processes or args.per_device:
+        return _batch(args, path_filter)
+    if args.watch:
+        return _watch(engine, args)
+    if args.plan or args.apply:
+        return _plan(engine, args)
+
+    results = []
+    exit_code = 0
+    for folder in args.paths:
+        path = Path(folder)
+        if not path.is_dir():
+            _stderr_log(f"路径不是有效的文件夹: {folder}")
+            exit_code = 2
+            continue
+
+        try:
+            if args.undo:
+                result = engine.undo(path)
+            else:
+                result = engine.organize(path, args.recursive, args.skip_errors, resume=args.resume)
+        except KeyboardInterrupt:
+            _stderr_log("用户中断整理操作")
+            return 130
+        except Exception as e:
+            _stderr_log(f"整理 {folder} 时发生严重错误: {e}")
+            exit_code = 1
+            continue
+
+        results.append(result)
+        if result.error_files and exit_code == 0:
+            exit_code = 1
+
+    _write_metrics(args, results)
+    _write_report(args, results)
+
+    if args.json:
+        import json
+
+        summary = {
+            'results': [r.to_dict() for r in results],
+            'moved_files': sum(r.moved_files for r in results),
+            'error_files': sum(r.error_files for r in results),
+        }
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for r in results:
+            print(f"{r.target_folder}: 成功 {r.moved_files} | 跳过 {r.skipped_files} | 错误 {r.error_files}")
+
+    return exit_code
+
+
+def _watch(engine, args):
+    """监视模式：只支持一个文件夹，按 Ctrl+C 停止"""
+    from pathlib import Path
+
+    from .watch import DEFAULT_SETTLE, FolderWatcher
+
+    if len(args.paths) != 1 or args.undo or args.report:
+        _stderr_log("监视模式只能指定一个文件夹，且不能与 --undo 或 --report 同时使用")
+        return 2
+    folder = args.paths[0]
+    if not Path(folder).is_dir():
+        _stderr_log(f"路径不是有效的文件夹: {folder}")
+        return 2
+
+    watcher = FolderWatcher(
+        engine, folder,
+        recursive=args.recursive,
+        skip_errors=args.skip_errors,
+        settle=DEFAULT_SETTLE if args.settle is None else max(0.0, args.settle),
+        poll=args.poll,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+        _stderr_log("停止监视")
+    except Exception as e:
+        _stderr_log(f"监视 {folder} 时发生严重错误: {e}")
+        return 1
+
+    if args.json:
+        import json
+
+        summary = {
+            'target_folder': watcher.folder,
+            'batches': watcher.batches,
+            'moved_files': watcher.moved_files,
+            'skipped_files': watcher.skipped_files,
+            'error_files': watcher.error_files,
+        }
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(f"{watcher.folder}: 成功 {watcher.moved_files} | 跳过 {watcher.skipped_files} "
+              f"| 错误 {watcher.error_files}")
+    return 1 if watcher.error_files else 0
+
+
+def _plan(engine, args):
+    """制定方案（--plan）或执行方案（--apply）：只支持一个文件夹"""
+    import os
+
+    from .plan import PlanError, read_plan
+
+    if len(args.paths) != 1 or args.undo or args.watch or args.dedupe or args.pack or (args.plan and args.apply):
+        _stderr_log("--plan / --apply 只能指定一个文件夹，且不能与 --undo、--watch、--dedupe、--pack 或彼此同时使用")
+        return 2
+    folder = args.paths[0]
+    if not os.path.isdir(folder):
+        _stderr_log(f"路径不是有效的文件夹: {folder}")
+        return 2
+
+    try:
+        if args.plan:
+            summary = engine.plan(folder, args.plan, args.recursive)
+            if args.json:
+                import json
+
+                json.dump({'target_folder': os.path.abspath(folder), 'plan': args.plan, **summary.to_dict()},
+                          sys.stdout, ensure_ascii=False, indent=2)
+                sys.stdout.write("\n")
+            else:
+                print(f"{os.path.abspath(folder)}: 方案 {summary.files} 个文件 -> {args.plan}")
+            return 130 if summary.stopped else 0
+
+        target = read_plan(args.apply).target
+        if os.path.realpath(target) != os.path.realpath(folder):
+            _stderr_log(f"方案是为 {target} 制定的，与指定的文件夹不符")
+            return 2
+        result = engine.apply_plan(args.apply, args.skip_errors)
+    except KeyboardInterrupt:
+        _stderr_log("用户中断整理操作")
+        return 130
+    except (OSError, PlanError) as e:
+        _stderr_log(f"处理整理方案时出错: {e}")
+        return 1
+
+    _write_metrics(args, [result])
+    _write_report(args, [result])
+    if args.json:
+        import json
+
+        json.dump(result.to_dict(), sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(f"{result.target_folder}: 成功 {result.moved_files} | 跳过 {result.skipped_files} "
+              f"| 错误 {result.error_files}")
+    return 1 if result.error_files else 0
+
+
+def _path_filter(args):
+    """按命令行参数编译扫描过滤条件（没有设置时为 None）"""
+    from .pathfilter import COMMON_EXCLUDES, PathFilter
+
+    patterns = [*(COMMON_EXCLUDES if args.exclude_common else ()), *(args.filters or ())]
+    options = {'max_depth': args.max_depth, 'one_file_system': args.one_file_system, 'symlinks': args.symlinks}
+    if args.ignore_file:
+        path_filter = PathFilter.from_file(args.ignore_file, patterns, **options)
+    else:
+        path_filter = PathFilter(patterns, **options)
+    return path_filter if path_filter.active else None
+
+
+def _batch(args, path_filter=None):
+    """批量整理：多个文件夹分配到进程池中，输出汇总报告"""
+    from .batch import DEFAULT_ROOTS_PER_DEVICE, read_manifest, run_batch
+
+    if args.watch or args.plan or args.apply or args.report:
+        _stderr_log("批量整理不能与 --watch、--plan、--apply 或 --report 同时使用")
+        return 2
+    roots = list(args.paths)
+    if args.manifest:
+        try:
+            roots.extend(read_manifest(args.manifest))
+        except OSError as e:
+            _stderr_log(f"无法读取文件夹清单: {e}")
+            return 2
+
+    options = {
+        'recursive': args.recursive,
+        'skip_errors': args.skip_errors,
+        'rules': args.rules,
+        'workers': max(1, args.workers),
+        'device_limit': args.device_limit,
+        'journal': args.journal,
+        'resume': args.resume,
+        'undo': args.undo,
+        'incremental': args.incremental,
+        'sniff': args.sniff,
+        'dedupe': args.dedupe,
+        'metrics': bool(args.metrics_json or args.metrics_prom),
+        'max_ops': args.max_ops,
+        'max_bandwidth': args.max_bandwidth,
+        'latency_target': args.latency_target / 1000 if args.latency_target else None,
+        'shard': args.shard,
+        'shard_size': args.shard_size,
+        'verify': args.verify,
+        'path_filter': path_filter,
+        'order': args.order,
+        'order_window': args.order_window,
+        'pack': args.pack,
+        'pack_threshold': args.pack_threshold,
+        'pack_max_bytes': args.pack_max_size,
+        'pack_max_files': args.pack_max_files,
+        'log': not args.quiet,
+    }
+
+    def on_result(entry):
+        if entry.get('error'):
+            _stderr_log(f"整理 {entry['target_folder']} 失败: {entry['error']}")
+        else:
+            _stderr_log(f"已完成 {entry['target_folder']}: 成功 {entry['moved_files']} | "
+                        f"跳过 {entry['skipped_files']} | 错误 {entry['error_files']}")
+
+    try:
+        report = run_batch(roots, options, processes=args.processes,
+                           per_device=args.per_device or DEFAULT_ROOTS_PER_DEVICE, on_result=on_result)
+    except KeyboardInterrupt:
+        _stderr_log("用户中断整理操作")
+        return 130
+
+    _write_metrics(args, report.roots)
+    summary = report.to_dict()
+    if args.json:
+        import json
+
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for entry in report.roots:
+            if entry.get('error'):
+                print(f"{entry['target_folder']}: 失败 ({entry['error']})")
+            else:
+                print(f"{entry['target_folder']}: 成功 {entry['moved_files']} | 跳过 {entry['skipped_files']} "
+                      f"| 错误 {entry['error_files']} | {entry['elapsed']:.1f}s")
+        print(f"共 {summary['roots']} 个文件夹（失败 {summary['failed_roots']}）: 成功 {summary['moved_files']} | "
+              f"跳过 {summary['skipped_files']} | 错误 {summary['error_files']} | {summary['elapsed']:.1f}s")
+    if summary['failed_roots']:
+        return 1
+    return 1 if summary['error_files'] else 0
+
+
+def _write_report(args, results):
+    """按命令行参数导出每个文件的结果（多个文件夹写入同一个文件）"""
+    if not args.report:
+        return
+    try:
+        append = False
+        for r in results:
+            if r.run_table is not None:
+                r.run_table.export(args.report, append=append)
+                append = True
+    except OSError as e:
+        _stderr_log(f"无法写入结果报告: {e}")
+
+
+def _write_metrics(args, results):
+    """按命令行参数导出指标（results 为 OrganizeResult 或批量整理的结果字典）"""
+    runs = []
+    for r in results:
+        if isinstance(r, dict):
+            if r.get('metrics') is not None:
+                runs.append((r['metrics'], {'target': r['target_folder']}))
+        elif r.metrics is not None:
+            runs.append((r.metrics, {'target': r.target_folder}))
+    if not runs:
+        return
+    try:
+        if args.metrics_json:
+            import json
+
+            report = [
+                {'target_folder': labels['target'], **(metrics if isinstance(metrics, dict) else metrics.to_dict())}
+                for metrics, labels in runs
+            ]
+            with open(args.metrics_json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if args.metrics_prom:
+            from .metrics import write_prometheus
+
+            write_prometheus(args.metrics_prom, runs)
+    except OSError as e:
+        _stderr_log(f"无法写入指标文件: {e}")
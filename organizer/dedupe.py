@@ -0,0 +1,207 @@
+"""重复文件检测：大小 → 首尾块哈希 → 完整哈希 逐级比较
+
+每个分类文件夹维护一张 大小 -> 文件 的表（第一次用到时 scandir 一次；
+分片整理时包括各级分片子文件夹和分片前留在分类文件夹中的文件），
+本次整理移入的文件也登记进去。新文件只有遇到大小相同的文件时才读取内容：
+先比较开头和结尾各 PARTIAL_BLOCK 字节的哈希，仍然相同时才计算完整哈希。
+哈希结果缓存在记录上，同一个文件最多读取一次。
+
+并行移动时哈希在移动线程中进行；与还在移动中的文件比较前，先等待它移动完成
+（只会等待更早提交的任务，不会互相等待）。
+"""
+import hashlib
+import os
+import stat
+import threading
+
+# 识别到重复文件时的处理方式
+DEDUPE_SKIP = 'skip'          # 留在原处不移动
+DEDUPE_HARDLINK = 'hardlink'  # 在分类文件夹中创建指向已有文件的硬链接，删除源文件
+DEDUPE_FOLDER = 'folder'      # 移动到重复文件夹
+DEDUPE_MODES = (DEDUPE_SKIP, DEDUPE_HARDLINK, DEDUPE_FOLDER)
+
+# 重复文件夹（位于目标文件夹中，扫描时跳过）
+DUPLICATES_FOLDER = '重复文件'
+
+# 首尾块的大小；不超过两块的文件，首尾块哈希相同即内容相同
+PARTIAL_BLOCK = 64 * 1024
+
+# 计算完整哈希时每次读取的字节数
+HASH_BUFFER_SIZE = 4 * 1024 * 1024
+
+HASH_NAME = 'sha256'
+
+
+def partial_digest(path, size):
+    """文件开头和结尾各 PARTIAL_BLOCK 字节的哈希"""
+    digest = hashlib.new(HASH_NAME)
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+    try:
+        if size <= 2 * PARTIAL_BLOCK:
+            digest.update(os.pread(fd, 2 * PARTIAL_BLOCK, 0))
+        else:
+            digest.update(os.pread(fd, PARTIAL_BLOCK, 0))
+            digest.update(os.pread(fd, PARTIAL_BLOCK, size - PARTIAL_BLOCK))
+    finally:
+        os.close(fd)
+    return digest.digest()
+
+
+def full_digest(path):
+    """流式计算完整哈希（大块读取，哈希计算时释放 GIL，可在多个线程中并行）"""
+    digest = hashlib.new(HASH_NAME)
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.digest()
+
+
+class FileRecord:
+    """分类文件夹中（或正在移入）的一个文件"""
+
+    __slots__ = ('path', 'size', 'dev', 'ino', 'partial', 'full', 'ready', 'gone')
+
+    def __init__(self, path, st, ready=None):
+        self.path = path
+        self.size = st.st_size
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        self.partial = None
+        self.full = None
+        # 正在移入的文件在移动结束后 set；已有文件为 None
+        self.ready = ready
+        self.gone = False
+
+    def partial_digest(self):
+        if self.partial is None:
+            self.partial = partial_digest(self.path, self.size)
+        return self.partial
+
+    def full_digest(self):
+        if self.size <= 2 * PARTIAL_BLOCK:
+            return self.partial_digest()
+        if self.full is None:
+            self.full = full_digest(self.path)
+        return self.full
+
+
+class DuplicateIndex:
+    """按分类文件夹组织的 大小 -> [FileRecord] 索引，可以在多个线程中使用
+
+    recursive 为 True 时（分片整理）读取分类文件夹下的全部子文件夹，
+    新文件与整个分类中的文件比较，而不只是它所在的分片。
+    """
+
+    def __init__(self, recursive=False):
+        self.recursive = recursive
+        self._folders = {}
+        self._lock = threading.Lock()
+
+        # 统计
+        self.partial_hashes = 0
+        self.full_hashes = 0
+
+    def _sizes_for(self, folder):
+        sizes = self._folders.get(folder)
+        if sizes is None:
+            sizes = {}
+            pending = [folder]
+            while pending:
+                path = pending.pop()
+                try:
+                    with os.scandir(path) as it:
+                        for entry in it:
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            if stat.S_ISREG(st.st_mode) and st.st_size:
+                                sizes.setdefault(st.st_size, []).append(FileRecord(entry.path, st))
+                            elif self.recursive and stat.S_ISDIR(st.st_mode):
+                                pending.append(entry.path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # 无法读取的分片子文件夹不参与比较
+                    if path == folder:
+                        raise
+            self._folders[folder] = sizes
+        return sizes
+
+    def register(self, folder, path, st):
+        """登记一个即将移入 folder 的文件，返回 (记录, 大小相同的候选文件列表)
+
+        在分派线程中按提交顺序调用；候选列表为空时不需要读取文件内容。
+        """
+        record = FileRecord(path, st, threading.Event())
+        with self._lock:
+            group = self._sizes_for(folder).setdefault(st.st_size, [])
+            candidates = list(group)
+            group.append(record)
+        return record, candidates
+
+    def finish(self, folder, record, path=None):
+        """文件移入完成（path 为最终路径）或没有移入（path 为 None）"""
+        if path is not None:
+            record.path = path
+        else:
+            record.gone = True
+            with self._lock:
+                group = self._folders.get(folder, {}).get(record.size)
+                if group is not None:
+                    try:
+                        group.remove(record)
+                    except ValueError:
+                        pass
+        record.ready.set()
+
+    @staticmethod
+    def wait(candidates):
+        """等待还在移动中的候选文件（在获取设备并发名额之前调用）"""
+        for candidate in candidates:
+            if candidate.ready is not None:
+                candidate.ready.wait()
+
+    def find_duplicate(self, record, candidates):
+        """在候选文件中查找与 record 内容相同的文件，没有时返回 None"""
+        self.wait(candidates)
+        live = [c for c in candidates if not c.gone]
+        for candidate in live:
+            if candidate.dev == record.dev and candidate.ino == record.ino:
+                return candidate
+        if not live:
+            return None
+
+        # 第二级：首尾块
+        with self._lock:
+            self.partial_hashes += 1
+        partial = record.partial_digest()
+        matched = []
+        for candidate in live:
+            try:
+                if candidate.partial_digest() == partial:
+                    matched.append(candidate)
+            except OSError:
+                continue
+        if not matched:
+            return None
+
+        # 第三级：完整内容（小文件的首尾块已经覆盖全部内容）
+        if record.size > 2 * PARTIAL_BLOCK:
+            with self._lock:
+                self.full_hashes += 1
+        full = record.full_digest()
+        for candidate in matched:
+            try:
+                if candidate.full_digest() == full:
+                    return candidate
+            except OSError:
+                continue
+        return None
@@ -0,0 +1,77 @@
+"""目标文件夹的文件名索引，用于 O(1) 处理重名"""
+import os
+import threading
+from pathlib import PurePath
+
+
+def split_numbered_name(filename):
+    """拆分文件名为 (基础名, 后缀)，去掉已有的 _N 序号"""
+    path = PurePath(filename)
+    stem = path.stem
+    name_parts = stem.split('_')
+    if len(name_parts) > 1 and name_parts[-1].isdigit():
+        stem = '_'.join(name_parts[:-1])
+    return stem, path.suffix
+
+
+class DestinationIndex:
+    """每个分类文件夹已有文件名的内存索引
+
+    每个文件夹只在第一次用到时 scandir 一次，之后的重名检查都在内存中完成；
+    (文件夹, 基础名, 后缀) -> 下一个可用序号 的计数表避免从 _1 开始逐个尝试。
+    并行移动时各方法可以在多个线程中调用。
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _names_for(self, folder):
+        names = self._names.get(folder)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        names.add(entry.name)
+            except FileNotFoundError:
+                pass
+            self._names[folder] = names
+        return names
+
+    def reserve(self, folder, filename):
+        """为 filename 在 folder 中选择一个未占用的名称并登记，返回该名称"""
+        folder = str(folder)
+        with self._lock:
+            return self._reserve(folder, filename)
+
+    def _reserve(self, folder, filename):
+        names = self._names_for(folder)
+        if filename not in names:
+            names.add(filename)
+            return filename
+
+        # 如果目标文件已存在，添加序号
+        base_name, suffix = split_numbered_name(filename)
+        key = (folder, base_name, suffix)
+        counter = self._counters.get(key, 1)
+        candidate = f"{base_name}_{counter}{suffix}"
+        while candidate in names:
+            counter += 1
+            candidate = f"{base_name}_{counter}{suffix}"
+        self._counters[key] = counter + 1
+        names.add(candidate)
+        return candidate
+
+    def release(self, folder, filename):
+        """移动失败时撤销登记"""
+        with self._lock:
+            names = self._names.get(str(folder))
+            if names is not None:
+                names.discard(filename)
+
+    def mark_taken(self, folder, filename):
+        """登记一个被外部写入占用的名称（移动时发现目标已存在）"""
+        with self._lock:
+            self._names_for(str(folder)).add(filename)
@@ -0,0 +1,1410 @@
+"""文件整理引擎：扫描、分类、移动（不依赖 tkinter，可在无显示环境中运行）"""
+import filecmp
+import os
+import queue
+import stat
+import threading
+import time
+from pathlib import Path
+
+from .dedupe import DEDUPE_FOLDER, DEDUPE_HARDLINK, DEDUPE_SKIP, DUPLICATES_FOLDER, DuplicateIndex
+from .destination import DestinationIndex
+from .executor import DEFAULT_DEVICE_LIMIT, MoveExecutor
+from .filetable import FileTable, RunTable
+from .journal import MoveJournal, latest_journal, read_journal
+from .metrics import Metrics
+from .order import DEFAULT_ORDER_WINDOW, ordered
+from .rules import DEFAULT_CATEGORY, FILE_CATEGORIES, compile_rules
+from .scanner import Scanner, iter_paths, iter_table
+from .shard import DEFAULT_SHARD_SIZE, ShardLayout, sharded_categories
+from .sniff import ContentSniffer, FingerprintCache
+from .snapshot import SnapshotIndex
+from .state import STATE_DIR_NAME
+from .throttle import IOThrottle
+from .transfer import Transfer, TransferInterrupted, clean_transfer_files
+
+# 目标名称被外部进程抢占时的最大重试次数
+MAX_NAME_RETRIES = 100
+
+# 扫描线程与整理线程之间的队列长度（限制内存占用）
+SCAN_QUEUE_SIZE = 1024
+
+# 连续批次（监视模式）最多共用多少批目标名索引和查重索引，之后（或日志换新时）从磁盘重新读取
+KEPT_INDEX_BATCHES = 256
+
+# 扫描结束标记
+_SCAN_DONE = object()
+
+
+class OrganizeResult:
+    """一次整理的结果统计"""
+
+    def __init__(self, target_folder):
+        self.target_folder = str(target_folder)
+        self.total_files = 0
+        self.moved_files = 0
+        self.skipped_files = 0
+        self.error_files = 0
+        self.processed_files = 0
+        # 同设备 rename 与跨设备复制的次数
+        self.renamed_files = 0
+        self.copied_files = 0
+        self.bytes_copied = 0
+        # 续做时完成的上次中断的移动数
+        self.resumed_files = 0
+        # 增量整理时跳过的未变化目录和文件数
+        self.unchanged_dirs = 0
+        self.unchanged_files = 0
+        # 按内容识别的文件数（读取了文件头的）和识别出分类的文件数
+        self.sniffed_files = 0
+        self.recognized_files = 0
+        # 发现的重复文件数及其总大小
+        self.duplicate_files = 0
+        self.duplicate_bytes = 0
+        # 打包进归档的小文件数和写入的归档数
+        self.packed_files = 0
+        self.archives_written = 0
+        self.stopped = False
+        # 启用指标时为 metrics.Metrics
+        self.metrics = None
+        # 启用运行结果表时为 filetable.RunTable（每个文件一行，不包含在 to_dict() 中）
+        self.run_table = None
+        self.categories = {}
+        self.elapsed = 0.0
+
+    def to_dict(self):
+        """转换为可序列化的字典（用于 JSON 输出）"""
+        data = {
+            'target_folder': self.target_folder,
+            'total_files': self.total_files,
+            'moved_files': self.moved_files,
+            'skipped_files': self.skipped_files,
+            'error_files': self.error_files,
+            'processed_files': self.processed_files,
+            'renamed_files': self.renamed_files,
+            'copied_files': self.copied_files,
+            'bytes_copied': self.bytes_copied,
+            'resumed_files': self.resumed_files,
+            'unchanged_dirs': self.unchanged_dirs,
+            'unchanged_files': self.unchanged_files,
+            'sniffed_files': self.sniffed_files,
+            'recognized_files': self.recognized_files,
+            'duplicate_files': self.duplicate_files,
+            'duplicate_bytes': self.duplicate_bytes,
+            'packed_files': self.packed_files,
+            'archives_written': self.archives_written,
+            'stopped': self.stopped,
+            'categories': dict(self.categories),
+            'elapsed': round(self.elapsed, 3),
+        }
+        if self.metrics is not None:
+            data['metrics'] = self.metrics.to_dict()
+        return data
+
+
+class MoveTask:
+    """一个已确定目标名称、等待执行的移动"""
+
+    __slots__ = ('src', 'folder', 'name', 'category', 'same_device', 'journal_id',
+                 'record', 'candidates', 'dedupe_folder', 'size', 'mtime_ns')
+
+    def __init__(self, src, folder, name, category, same_device=None, journal_id=None, size=0, mtime_ns=0):
+        self.src = src
+        self.folder = folder
+        self.name = name
+        self.category = category
+        self.same_device = same_device
+        self.journal_id = journal_id
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # 查重时的 dedupe.FileRecord、需要比较内容的候选文件和登记所在的分类文件夹
+        self.record = None
+        self.candidates = None
+        self.dedupe_folder = None
+
+
+class _KeptBatches:
+    """organize_paths(keep_open=True) 的连续批次之间保留的状态（同一个目标文件夹）
+
+    batches 为索引已经用过的批数，0 表示索引已丢弃、下一批重新建立。
+    """
+
+    __slots__ = ('target', 'destinations', 'duplicates', 'folder_devices', 'journal', 'batches')
+
+    def __init__(self, target, destinations, duplicates, folder_devices, journal, batches):
+        self.target = target
+        self.destinations = destinations
+        self.duplicates = duplicates
+        self.folder_devices = folder_devices
+        self.journal = journal
+        self.batches = batches
+
+
+class OrganizerEngine:
+    """文件整理引擎
+
+    通过回调函数汇报日志、进度和状态，图形界面和命令行共用同一套逻辑。
+    on_progress 的参数为 (已处理数, 总数)，扫描未结束时总数为已发现的文件数。
+    classifier 为 rules.compile_rules() / rules.load_rules() 编译的分类器，
+    默认使用 FILE_CATEGORIES。
+    workers 大于 1 时启用并行移动（见 executor.MoveExecutor）。
+    journal 为 True 时记录移动日志，用于崩溃后续做（organize(resume=True)）和撤销（undo）。
+    incremental 为 True 时使用目录快照（见 snapshot.SnapshotIndex）跳过没有变化的目录和文件。
+    sniff 为 'unknown' 时按文件内容识别扩展名不认识的文件，为 'all' 时内容优先于扩展名
+    （见 sniff.ContentSniffer）。
+    dedupe 为 'skip' / 'hardlink' / 'folder' 时检测与分类文件夹中已有文件内容相同的文件，
+    分别留在原处、改为硬链接、移到重复文件夹（见 dedupe.DuplicateIndex）。
+    metrics 为 True 时统计各阶段耗时、调用次数和移动延迟（见 metrics.Metrics），
+    结果在 OrganizeResult.metrics 中。
+    run_table 为 True 时把每个文件的结果（目标、状态、错误）记入 filetable.RunTable，
+    结果在 OrganizeResult.run_table 中，整理进行中也可以从 engine.run_table 读取。
+    max_ops（每秒移动数）、max_bandwidth（每秒跨设备复制字节数）和 latency_target
+    （秒，移动延迟超过时自动降速）限制整理对存储的压力（见 throttle.IOThrottle）。
+    shard 为 'month' / 'hash' / 'count' 时把分类文件夹再分成子文件夹，count 方式每个
+    子文件夹最多 shard_size 个条目（见 shard.ShardLayout）。
+    跨设备复制按块进行，停止请求在当前块完成后生效，大文件下次整理时从断点继续；
+    verify 为 hashlib 算法名时在删除源文件前校验复制结果（见 transfer.Transfer）。
+    path_filter 为 pathfilter.PathFilter 时按其中的排除规则、深度、挂载点和符号链接策略扫描。
+    order 为 'locality' / 'inode' / 'extent' 时每 order_window 个文件按局部性排序后再移动
+    （见 order.ordered），默认按扫描顺序。
+    pack 为 'tar' / 'zip' 时小于 pack_threshold 字节的普通文件不逐个移动，而是写入每个分类的
+    滚动归档（每个最多 pack_max_bytes 字节、pack_max_files 个文件，None 为默认值），归档校验
+    通过后才删除源文件；打包的文件不记入移动日志，也不查重（见 pack.Packer）。
+    除了边扫描边移动的 organize()，也可以先用 plan() 制定方案、审阅后再用
+    apply_plan() 执行（见 plan.py）。
+    """
+
+    def __init__(self, on_log=None, on_progress=None, on_status=None, classifier=None,
+                 workers=1, device_limit=DEFAULT_DEVICE_LIMIT, device_limits=None,
+                 journal=False, incremental=False, sniff=None, dedupe=None, metrics=False,
+                 max_ops=None, max_bandwidth=None, latency_target=None, run_table=False,
+                 shard=None, shard_size=DEFAULT_SHARD_SIZE, verify=None, path_filter=None,
+                 order='scan', order_window=DEFAULT_ORDER_WINDOW,
+                 pack=None, pack_threshold=None, pack_max_bytes=None, pack_max_files=None):
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.on_status = on_status
+        self.classifier = classifier or compile_rules()
+
+        # 并行移动设置：线程数、每个设备默认并发数、按 st_dev 指定的并发数
+        self.workers = workers
+        self.device_limit = device_limit
+        self.device_limits = device_limits
+        self.journal = journal
+        self.incremental = incremental
+        self.sniff = sniff
+        self.dedupe = dedupe
+        self.collect_metrics = metrics
+        self.collect_run_table = run_table
+        self.max_ops = max_ops
+        self.max_bandwidth = max_bandwidth
+        self.latency_target = latency_target
+        self.shard = shard
+        self.shard_size = shard_size
+        self.verify = verify
+        self.path_filter = path_filter
+        self.order = order
+        self.order_window = order_window
+        self.pack = pack
+        self.pack_threshold = pack_threshold
+        self.pack_max_bytes = pack_max_bytes
+        self.pack_max_files = pack_max_files
+
+        # 状态变量
+        self.is_running = False
+        self._target_folder = None
+        self._destinations = DestinationIndex()
+        self._transfer = Transfer()
+        self._folder_devices = {}
+        self._failure = None
+        self._journal = None
+        self._snapshot = None
+        self._sniffer = None
+        self._content_categories = {}
+        self._duplicates = None
+        self._throttle = None
+        self._shards = None
+        self._packer = None
+        self._table_source = False
+        self._table_stats = False
+        self._kept = None
+        self._lock = threading.Lock()
+        # 最近一次整理的指标和运行结果表（没有启用时为 None）
+        self.metrics = None
+        self.run_table = None
+
+    def _callback(self, callback, *args):
+        """调用界面回调；启用指标时计入 callbacks 阶段"""
+        if self.metrics is None:
+            callback(*args)
+        else:
+            with self.metrics.timer('callbacks'):
+                callback(*args)
+
+    def log(self, message):
+        if self.on_log:
+            self._callback(self.on_log, message)
+
+    def update_progress(self, processed, total):
+        if self.on_progress:
+            self._callback(self.on_progress, processed, total)
+
+    def update_status(self, status):
+        if self.on_status:
+            self._callback(self.on_status, status)
+
+    def stop(self):
+        """请求停止整理（正在进行的移动完成后生效，排队中的移动会被取消）"""
+        self.is_running = False
+
+    def make_scanner(self, snapshot=None, sort=False, folder=None):
+        """创建扫描器（跳过分类文件夹、重复文件夹和状态目录）
+
+        给出 folder 时同时跳过该文件夹中以前分片整理过的分类（规则改变后也不会重新整理）。
+        """
+        skip_names = [*self.classifier.categories, DUPLICATES_FOLDER, STATE_DIR_NAME]
+        if folder is not None:
+            skip_names.extend(sharded_categories(folder))
+        return Scanner(
+            skip_names=skip_names,
+            on_error=self.log,
+            snapshot=snapshot,
+            sort=sort,
+            path_filter=self.path_filter
+        )
+
+    def collect_files(self, folder_path, recursive=False):
+        """收集要整理的文件列表（文件很多时 collect_table 占用的内存少得多）"""
+        return [entry.path for entry in self.make_scanner(folder=folder_path).scan(folder_path, recursive)]
+
+    def collect_table(self, folder_path, recursive=False, classify=True):
+        """把要整理的文件收集到 filetable.FileTable（大小、mtime，classify 为 True 时包括分类）
+
+        表可以直接传给 organize_paths()，或用 category_totals() 统计。
+        """
+        table = FileTable()
+        for entry in self.make_scanner(folder=folder_path).scan(folder_path, recursive):
+            try:
+                table.add_entry(entry, self._classify(entry) if classify else None)
+            except OSError as e:
+                self.log(f"无法读取文件 {entry.name}: {e}")
+        return table
+
+    def _produce(self, source, channel, scan_state):
+        """扫描线程：把扫描到的文件放入有界队列"""
+        metrics = self.metrics
+        started = time.perf_counter()
+        blocked = 0.0
+        try:
+            for entry in source:
+                scan_state['found'] += 1
+                try:
+                    channel.put_nowait(entry)
+                    continue
+                except queue.Full:
+                    pass
+                # 队列已满：整理跟不上扫描
+                wait_started = time.perf_counter()
+                while True:
+                    if not self.is_running:
+                        return
+                    try:
+                        channel.put(entry, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                blocked += time.perf_counter() - wait_started
+        finally:
+            if metrics is not None:
+                metrics.add_time('scan', time.perf_counter() - started - blocked)
+                metrics.add_time('scan_blocked', blocked)
+            scan_state['done'] = True
+            # 结束标记（消费者已停止时不需要等待）
+            while self.is_running:
+                try:
+                    channel.put(_SCAN_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def _consume(self, channel, scan_state):
+        """生成器：从扫描队列中逐个取出文件，直到扫描结束或停止"""
+        metrics = self.metrics
+        while self.is_running:
+            try:
+                entry = channel.get_nowait()
+            except queue.Empty:
+                wait_started = time.perf_counter()
+                try:
+                    entry = channel.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                finally:
+                    if metrics is not None:
+                        metrics.add_time('wait_scan', time.perf_counter() - wait_started)
+            if entry is _SCAN_DONE:
+                return
+            if metrics is not None and scan_state['found'] & 63 == 0:
+                metrics.gauge('scan_queue_depth', channel.qsize())
+            yield entry
+
+    def _classified(self, entries):
+        """生成器：排序前先分类，产出 (文件项, 分类)；分类出错的文件分类为 None，由 _dispatch 记录错误"""
+        metrics = self.metrics
+        for entry in entries:
+            started = time.perf_counter() if metrics is not None else 0.0
+            try:
+                category = self._classify(entry)
+            except OSError:
+                category = None
+            if metrics is not None:
+                metrics.add_time('classify', time.perf_counter() - started)
+            yield entry, category
+
+    def organize(self, target_folder, recursive=False, skip_errors=True, resume=False):
+        """整理文件的主要逻辑，返回 OrganizeResult
+
+        扫描在后台线程中进行，通过有界队列边扫描边移动；扫描结束前
+        总数是目前已发现的文件数（进度回调的 total 为估计值）。
+        workers 大于 1 时移动在线程池中并行执行，分类和目标文件名仍在本线程中
+        按扫描顺序依次确定，因此重名序号与单线程时一致。
+        skip_errors 为 False 时，第一个出错的文件会使异常向上抛出。
+        resume 为 True 时先完成上次中断的整理中未完成的移动，并继续写入它的日志。
+        """
+        return self._run(target_folder, skip_errors, resume, recursive=recursive)
+
+    def organize_paths(self, target_folder, paths, skip_errors=True, keep_open=False):
+        """只整理 paths 中列出的文件（监视模式使用），返回 OrganizeResult
+
+        paths 可以是路径列表或 collect_table() 得到的 FileTable；已经不存在的路径会被忽略。
+        FileTable 直接按列读取：使用表中记录的分类、大小和修改时间，不再逐个 lstat 和分类
+        （启用打包或查重时仍需 lstat 得到文件类型和 inode）；表中的文件在移动时已经不存在的
+        计为跳过。
+        keep_open 为 True 时（连续的多批）目标名索引、查重索引和移动日志在本次结束后保留，
+        下一次对同一目标文件夹的 organize_paths(keep_open=True) 继续使用，不再重新读取
+        分类文件夹、也不为每批新建日志（日志超过 journal.JOURNAL_ROTATE_BYTES 或
+        JOURNAL_ROTATE_SECONDS 后换新的）；最后一批之后调用 close_batches()。
+        索引每 KEPT_INDEX_BATCHES 批或日志换新时丢弃重建，长时间监视时内存不会一直增长。
+        """
+        return self._run(target_folder, skip_errors, False, paths=paths, keep_open=keep_open)
+
+    def close_batches(self):
+        """结束 organize_paths(keep_open=True) 的连续批次：结束保留的移动日志，释放索引"""
+        kept, self._kept = self._kept, None
+        if kept is None or kept.journal is None:
+            return
+        self._journal = kept.journal
+        self._close_journal(True, False)
+
+    def _run(self, target_folder, skip_errors, resume, recursive=False, paths=None, keep_open=False):
+        """一次整理：paths 为 None 时扫描目标文件夹，否则只处理给定的文件"""
+        target_folder = os.path.normpath(os.fspath(target_folder))
+        kept = self._kept if keep_open and self._kept is not None and self._kept.target == target_folder else None
+        if kept is None:
+            self.close_batches()
+        self._kept = None
+        # 保留的索引（已丢弃时为 None，本批重新建立）
+        indexes = kept if kept is not None and kept.batches else None
+        result = OrganizeResult(target_folder)
+        started = time.monotonic()
+        self.is_running = True
+        self._target_folder = target_folder
+        self._destinations = indexes.destinations if indexes is not None else DestinationIndex()
+        self._throttle = self._new_throttle()
+        self._transfer = self._new_transfer()
+        self._shards = ShardLayout(self.shard, self.shard_size) if self.shard else None
+        self._folder_devices = indexes.folder_devices if indexes is not None else {}
+        self._failure = None
+        self._lock = threading.Lock()
+        self._journal = kept.journal if kept is not None else None
+        self._snapshot = None
+        self._sniffer = None
+        self._content_categories = {}
+        self._duplicates = indexes.duplicates if indexes is not None else self._new_duplicates(target_folder)
+        if indexes is not None and self._duplicates is not None:
+            # 哈希次数按批统计
+            self._duplicates.partial_hashes = self._duplicates.full_hashes = 0
+        self._packer = self._new_packer(target_folder)
+        self._table_source = isinstance(paths, FileTable)
+        self._table_stats = self._table_source and self._packer is None and self._duplicates is None
+        self.metrics = result.metrics = Metrics() if self.collect_metrics else None
+        self.run_table = result.run_table = RunTable() if self.collect_run_table else None
+        metrics = self.metrics
+        finished = False
+
+        if self._table_source:
+            source = iter_table(paths)
+        elif paths is not None:
+            source = iter_paths(paths)
+        else:
+            if self.incremental:
+                self._snapshot = SnapshotIndex(target_folder)
+            source = self.make_scanner(self._snapshot, folder=target_folder).scan(target_folder, recursive)
+        if self.sniff:
+            self._sniffer = ContentSniffer(self.classifier, self.sniff,
+                                           cache=FingerprintCache(target_folder))
+            source = self._sniffer.stream(source, self._content_categories)
+
+        channel = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+        scan_state = {'found': 0, 'done': False}
+        producer = threading.Thread(
+            target=self._produce,
+            args=(source, channel, scan_state),
+            daemon=True
+        )
+        executor = None
+        if self.workers > 1:
+            executor = MoveExecutor(
+                self.workers,
+                device_limit=self.device_limit,
+                device_limits=self.device_limits,
+                keep_running=lambda: self.is_running
+            )
+
+        try:
+            if self._journal is None:
+                self._open_journal(target_folder, resume, result)
+
+            self.update_status("正在扫描文件...")
+            if paths is None:
+                self.log("开始扫描文件...")
+            producer.start()
+
+            pending = self._consume(channel, scan_state)
+            if self.order and self.order != 'scan':
+                pending = ordered(self._classified(pending), self.order, self.order_window)
+            else:
+                pending = ((entry, None) for entry in pending)
+
+            folders_ready = False
+            for entry, category in pending:
+                if not self.is_running:
+                    break
+                if not folders_ready:
+                    self.log("开始整理...")
+                    self._prepare_folders(target_folder)
+                    folders_ready = True
+
+                self._dispatch(entry, target_folder, skip_errors, result, scan_state, executor, category)
+                if self._failure is not None:
+                    raise self._failure
+
+            if self._packer is not None:
+                # 封存没有装满的归档（停止时也封存，已写入的文件不必下次重新打包）
+                for archive in self._packer.drain():
+                    self._seal(archive, skip_errors, result)
+                if self._failure is not None:
+                    raise self._failure
+
+            if executor is not None:
+                # 等待已提交的移动完成；停止时取消还没开始的任务
+                executor.shutdown(cancel=not self.is_running)
+                executor = None
+                if self._failure is not None:
+                    raise self._failure
+
+            result.total_files = scan_state['found']
+            result.renamed_files = self._transfer.renamed
+            result.copied_files = self._transfer.copied
+            result.bytes_copied = self._transfer.bytes_copied
+            result.stopped = not self.is_running
+            if self._snapshot is not None:
+                result.unchanged_dirs = self._snapshot.dirs_skipped
+                result.unchanged_files = self._snapshot.files_skipped
+                self.log(f"增量扫描: 跳过 {result.unchanged_dirs} 个未变化的目录、"
+                         f"{result.unchanged_files} 个未变化的文件")
+            if self._sniffer is not None:
+                result.sniffed_files = self._sniffer.sniffed
+                result.recognized_files = self._sniffer.recognized
+                self.log(f"内容识别: 读取 {result.sniffed_files} 个文件头，"
+                         f"识别出 {result.recognized_files} 个文件的类型")
+            if self._duplicates is not None:
+                self.log(f"查重: 发现 {result.duplicate_files} 个重复文件（共 {result.duplicate_bytes} 字节），"
+                         f"计算了 {self._duplicates.partial_hashes} 次首尾块哈希、"
+                         f"{self._duplicates.full_hashes} 次完整哈希")
+            if self._packer is not None and result.archives_written:
+                self.log(f"打包: {result.packed_files} 个小文件写入了 {result.archives_written} 个归档")
+            if result.stopped:
+                self.update_status("整理已停止")
+            elif result.total_files == 0:
+                self.log("目标文件夹中没有找到可整理的文件。")
+                self.update_status("没有找到文件")
+            else:
+                self.log(f"共找到 {result.total_files} 个文件")
+                self.update_status("整理完成")
+            finished = True
+            return result
+
+        finally:
+            self.is_running = False
+            if executor is not None:
+                executor.shutdown(cancel=True)
+            if producer.is_alive():
+                producer.join()
+            self._table_source = self._table_stats = False
+            self._transfer.close()
+            self._close_packer()
+            self._close_throttle()
+            self._close_shards(target_folder)
+            journal = self._close_journal(finished, result.stopped, keep=keep_open)
+            if keep_open and finished and not result.stopped:
+                batches = indexes.batches + 1 if indexes is not None else 1
+                if (self.journal and journal is None) or batches >= KEPT_INDEX_BATCHES:
+                    # 日志换新或用了足够多批：丢弃索引，下一批从磁盘重新读取
+                    self._kept = _KeptBatches(target_folder, None, None, None, journal, 0)
+                else:
+                    self._kept = _KeptBatches(target_folder, self._destinations, self._duplicates,
+                                              self._folder_devices, journal, batches)
+            self._close_snapshot(finished and not result.stopped)
+            if self._sniffer is not None:
+                self._sniffer.close()
+                self._sniffer = None
+            result.elapsed = time.monotonic() - started
+            if metrics is not None:
+                self._finish_metrics(metrics, result)
+
+    def plan(self, target_folder, plan_path, recursive=False):
+        """制定整理方案并写入 plan_path，不移动任何文件，返回 plan.PlanSummary
+
+        分类和重名处理都在内存中完成（分类文件夹中已有的文件名只读取一次），
+        方案边制定边写出，内存占用只与目标文件名的数量有关。
+        按内容识别（sniff）同样生效；查重（dedupe）需要比较文件内容，不包含在方案中。
+        """
+        from .plan import PLAN_BATCH_SIZE, PlanWriter
+
+        target_folder = os.path.normpath(os.fspath(target_folder))
+        self.is_running = True
+        self._destinations = DestinationIndex()
+        self._sniffer = None
+        self._content_categories = {}
+        self.metrics = None
+
+        self._shards = ShardLayout(self.shard, self.shard_size) if self.shard else None
+        source = self.make_scanner(sort=True, folder=target_folder).scan(target_folder, recursive)
+        if self.sniff:
+            self._sniffer = ContentSniffer(self.classifier, self.sniff,
+                                           cache=FingerprintCache(target_folder))
+            source = self._sniffer.stream(source, self._content_categories, ordered=True)
+
+        writer = PlanWriter(plan_path, target_folder, recursive, self.shard)
+        summary = writer.summary
+        folders = {}
+        try:
+            self.update_status("正在制定整理方案...")
+            self.log("开始制定整理方案...")
+            for entry in source:
+                if not self.is_running:
+                    summary.stopped = True
+                    break
+                try:
+                    category = self._classify(entry)
+                    st = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    summary.errors += 1
+                    self.log(f"无法读取文件 {entry.name}: {e}")
+                    continue
+                shard = None
+                folder = folders.get(category)
+                if folder is None:
+                    folder = folders[category] = os.path.join(target_folder, category)
+                if self._shards is not None:
+                    shard = self._shards.shard(folder, entry.name, st)
+                    folder = os.path.join(folder, shard)
+                name = self._destinations.reserve(folder, entry.name)
+                writer.add(entry.path, entry.name, category, name, st, shard)
+                if summary.files % PLAN_BATCH_SIZE == 0:
+                    self.update_status(f"正在制定整理方案 ({summary.files} 个文件)")
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            self.is_running = False
+            self._shards = None
+            if self._sniffer is not None:
+                self._sniffer.close()
+                self._sniffer = None
+
+        self.log(f"整理方案已保存: {writer.path}")
+        self.log(summary.format())
+        self.update_status("方案已中断" if summary.stopped else "方案已制定")
+        return summary
+
+    def apply_plan(self, plan_path, skip_errors=True):
+        """按 plan() 保存的方案分批移动，返回 OrganizeResult
+
+        每批先 lstat 检查源文件，大小、修改时间或 inode 与方案不符（或已经不存在）
+        的文件跳过；目标名在执行时被占用的，与 organize() 一样重新分配序号。
+        """
+        from .plan import read_plan
+
+        reader = read_plan(plan_path)
+        summary = reader.summary
+        target_folder = os.path.normpath(reader.target)
+        result = OrganizeResult(target_folder)
+        result.total_files = summary.files
+        started = time.monotonic()
+        self.is_running = True
+        self._target_folder = target_folder
+        self._destinations = DestinationIndex()
+        self._throttle = self._new_throttle()
+        self._transfer = self._new_transfer()
+        # 方案中记录了分片子文件夹时按制定方案时的分片方式登记
+        shard_mode = reader.shard or self.shard
+        self._shards = ShardLayout(shard_mode, self.shard_size) if shard_mode else None
+        self._folder_devices = {}
+        self._failure = None
+        self._lock = threading.Lock()
+        self._journal = None
+        self._snapshot = None
+        self._duplicates = None
+        self.metrics = result.metrics = Metrics() if self.collect_metrics else None
+        self.run_table = result.run_table = RunTable() if self.collect_run_table else None
+        scan_state = {'found': summary.files, 'done': True}
+        finished = False
+
+        executor = None
+        if self.workers > 1:
+            executor = MoveExecutor(
+                self.workers,
+                device_limit=self.device_limit,
+                device_limits=self.device_limits,
+                keep_running=lambda: self.is_running
+            )
+
+        try:
+            if not os.path.isdir(target_folder):
+                raise FileNotFoundError(f"方案的目标文件夹不存在: {target_folder}")
+            self._open_journal(target_folder, False, result)
+            self.log(f"开始执行整理方案: {summary.files} 个文件")
+            self._prepare_folders(target_folder, summary.categories)
+
+            for batch in reader.batches():
+                if not self.is_running:
+                    break
+                for entry, src, st in self._check_batch(reader, batch, result, scan_state):
+                    if not self.is_running:
+                        break
+                    self._dispatch_planned(entry, src, st, target_folder, skip_errors, result,
+                                           scan_state, executor)
+                    if self._failure is not None:
+                        raise self._failure
+
+            if executor is not None:
+                executor.shutdown(cancel=not self.is_running)
+                executor = None
+                if self._failure is not None:
+                    raise self._failure
+
+            result.renamed_files = self._transfer.renamed
+            result.copied_files = self._transfer.copied
+            result.bytes_copied = self._transfer.bytes_copied
+            result.stopped = not self.is_running
+            if result.stopped:
+                self.update_status("整理已停止")
+            else:
+                self.log(f"方案执行完成: 移动 {result.moved_files} 个，跳过 {result.skipped_files} 个")
+                self.update_status("整理完成")
+            finished = True
+            return result
+
+        finally:
+            self.is_running = False
+            if executor is not None:
+                executor.shutdown(cancel=True)
+            self._transfer.close()
+            self._close_throttle()
+            self._close_shards(target_folder)
+            self._close_journal(finished, result.stopped)
+            result.elapsed = time.monotonic() - started
+            if self.metrics is not None:
+                self._finish_metrics(self.metrics, result)
+
+    def _check_batch(self, reader, batch, result, scan_state):
+        """检查一批源文件是否与方案一致，返回可以移动的 [(项, 源路径, lstat)]"""
+        ready = []
+        for entry in batch:
+            src = reader.source_path(entry)
+            try:
+                st = os.lstat(src)
+            except FileNotFoundError:
+                reason = "源文件已不存在"
+            except OSError as e:
+                reason = str(e)
+            else:
+                if entry.matches(st):
+                    ready.append((entry, src, st))
+                    continue
+                reason = "源文件在制定方案后已变化"
+            self.log(f"跳过: {entry.src}（{reason}）")
+            self._record(src, None, entry.category, entry.size, 'skipped', reason, entry.mtime_ns)
+            with self._lock:
+                result.skipped_files += 1
+            self._file_done(result, scan_state)
+        return ready
+
+    def _dispatch_planned(self, entry, src, st, target_folder, skip_errors, result, scan_state, executor):
+        """按方案中的分类、分片子文件夹和目标名执行（或提交）一个移动
+
+        没有记录分片子文件夹的旧方案按当前的分片设置重新计算。
+        """
+        name = entry.target_name
+        try:
+            if entry.shard is not None:
+                category_folder = self._shards.use(target_folder, entry.category,
+                                                   os.path.join(*entry.shard.split('/')))
+            else:
+                category_folder = self._category_folder(target_folder, entry.category, os.path.basename(src), st)
+            # 登记方案分配的名称；执行时被占用会在移动前发现并重新分配
+            self._destinations.mark_taken(category_folder, name)
+            devices = (st.st_dev, self._folder_device(category_folder))
+            task = MoveTask(src, category_folder, name, entry.category,
+                            devices[0] == devices[1], size=st.st_size, mtime_ns=st.st_mtime_ns)
+            if self._journal is not None:
+                task.journal_id = self._journal.plan(task.src, os.path.join(category_folder, name))
+        except (OSError, ValueError) as e:
+            self._record_error(os.path.basename(src), e, result)
+            self._record(src, None, entry.category, st.st_size, 'error', e, st.st_mtime_ns)
+            self._file_done(result, scan_state)
+            if not skip_errors:
+                raise
+            return
+
+        self._submit_task(task, devices, skip_errors, result, scan_state, executor)
+
+    def _new_throttle(self):
+        """按限速设置创建本次整理的 IOThrottle（没有设置时为 None）"""
+        if not (self.max_ops or self.max_bandwidth or self.latency_target):
+            return None
+        return IOThrottle(self.max_ops, self.max_bandwidth, self.latency_target,
+                          keep_running=lambda: self.is_running)
+
+    def _new_transfer(self):
+        """创建本次整理的 Transfer（按块检查停止请求，按设置限速和校验）"""
+        return Transfer(self._throttle, keep_running=lambda: self.is_running, verify=self.verify)
+
+    def _new_duplicates(self, target_folder):
+        """按查重设置创建本次整理的 DuplicateIndex（没有设置时为 None）
+
+        分片整理（本次或以前）的分类文件夹按整个目录树建索引，
+        内容相同的文件不论在哪个分片中都能找到。
+        """
+        if not self.dedupe:
+            return None
+        return DuplicateIndex(recursive=bool(self.shard or sharded_categories(target_folder)))
+
+    def _new_packer(self, target_folder):
+        """按打包设置创建本次整理的 Packer（没有设置时为 None）"""
+        if not self.pack:
+            return None
+        from .pack import Packer
+
+        return Packer(target_folder, self.pack, self.pack_threshold, self.pack_max_bytes,
+                      self.pack_max_files, throttle=self._throttle)
+
+    def _close_packer(self):
+        """异常结束时放弃没有封存的归档（源文件都还在原处）"""
+        packer, self._packer = self._packer, None
+        if packer is not None:
+            packer.abort()
+
+    def _close_throttle(self):
+        throttle, self._throttle = self._throttle, None
+        if throttle is not None:
+            self.log(f"限速: {throttle.summary()}")
+
+    def _finish_metrics(self, metrics, result):
+        """把整理结果中的计数汇总到指标中"""
+        metrics.add_time('total', result.elapsed)
+        metrics.count('files_found', result.total_files)
+        metrics.count('files_moved', result.moved_files)
+        metrics.count('files_skipped', result.skipped_files)
+        metrics.count('files_failed', result.error_files)
+        metrics.count('rename_calls', self._transfer.renamed)
+        metrics.count('copy_calls', self._transfer.copied)
+        metrics.count('bytes_copied', self._transfer.bytes_copied)
+        metrics.count('copies_resumed', self._transfer.resumed)
+        metrics.count('bytes_resumed', self._transfer.bytes_resumed)
+
+    def _open_journal(self, target_folder, resume, result):
+        """打开移动日志；续做时先完成上次中断的移动"""
+        if resume:
+            state = latest_journal(target_folder, finished=False)
+            if state is None:
+                self.log("没有找到中断的整理，按正常方式整理")
+            else:
+                self.log(f"继续上次中断的整理: {os.path.basename(state.path)}")
+                self._journal = MoveJournal.reopen(state)
+                self._resume_pending(target_folder, state, result)
+                return
+
+        if self.journal or resume:
+            self._journal = MoveJournal.create(target_folder)
+
+    def _resume_pending(self, target_folder, state, result):
+        """完成日志中已计划但没有完成记录的移动"""
+        self._clean_transfer_files(target_folder)
+
+        journal = self._journal
+        for move_id, src, dst in state.pending():
+            src_exists = os.path.lexists(src)
+            dst_exists = os.path.lexists(dst)
+            try:
+                if dst_exists and not src_exists:
+                    # 移动已完成，只是完成记录没来得及写入
+                    journal.done(move_id, 'resumed')
+                elif src_exists and not dst_exists:
+                    mode = self._transfer.move(src, os.path.dirname(dst), os.path.basename(dst))
+                    journal.done(move_id, mode)
+                    result.moved_files += 1
+                    result.resumed_files += 1
+                    self.log(f"已续做: {os.path.basename(src)} -> {os.path.basename(os.path.dirname(dst))}/")
+                elif src_exists and self._same_file(src, dst):
+                    # 跨设备复制已经原子替换到位，但还没删除源文件
+                    os.unlink(src)
+                    journal.done(move_id, 'copy')
+                    result.resumed_files += 1
+                else:
+                    journal.fail(move_id)
+                    self.log(f"无法续做 {src} -> {dst}：源文件或目标文件状态不一致")
+            except TransferInterrupted:
+                # 停止请求：这一项保持未完成，下次续做
+                break
+            except OSError as e:
+                journal.fail(move_id)
+                self._record_error(os.path.basename(src), e, result)
+        journal.flush(sync=True)
+
+    def _clean_transfer_files(self, target_folder):
+        """清理中断的跨设备复制留下的临时文件和失效的 .part 文件（包括分片子文件夹）"""
+        sharded = set(sharded_categories(target_folder))
+        if self.shard:
+            sharded.update(self.classifier.categories)
+        removed = 0
+        for category in dict.fromkeys([*self.classifier.categories, *sharded, DUPLICATES_FOLDER]):
+            removed += clean_transfer_files(os.path.join(target_folder, category), category in sharded)
+        if removed:
+            self.log(f"清理了 {removed} 个中断的复制留下的临时文件")
+
+    @staticmethod
+    def _same_file(src, dst):
+        """dst 是否就是 src 的完整副本：同一个 inode，或者类型相同且内容逐字节相同
+
+        只有这时才能删除源文件；目标被其他文件占用、或者复制没有完成时返回 False。
+        """
+        src_st = os.lstat(src)
+        dst_st = os.lstat(dst)
+        if (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino):
+            return True
+        if stat.S_ISLNK(src_st.st_mode) and stat.S_ISLNK(dst_st.st_mode):
+            return os.readlink(src) == os.readlink(dst)
+        if not (stat.S_ISREG(src_st.st_mode) and stat.S_ISREG(dst_st.st_mode)):
+            return False
+        return src_st.st_size == dst_st.st_size and filecmp.cmp(src, dst, shallow=False)
+
+    def _close_journal(self, finished, stopped, keep=False):
+        """正常结束（包括用户停止）时写入结束记录并压缩日志；异常退出时保留续做的机会
+
+        keep 为 True 时（连续的多批）正常结束的日志只写入磁盘、不结束，返回它供下一批继续
+        使用；日志已经太大或打开太久时照常结束，返回 None。
+        """
+        journal, self._journal = self._journal, None
+        if journal is None:
+            return None
+        if not finished:
+            journal.abandon()
+            return None
+        if keep and not stopped and not journal.should_rotate():
+            journal.flush(sync=True)
+            return journal
+        journal.close(stopped)
+        try:
+            journal.compact()
+        except OSError as e:
+            self.log(f"压缩移动日志失败: {e}")
+        return None
+
+    def undo(self, target_folder, journal_path=None):
+        """按移动日志倒序把文件移回原位置，返回 OrganizeResult
+
+        默认撤销最近一次已结束的整理；撤销完成后日志改名为 .undone，不会被重复撤销。
+        """
+        # 监视模式还开着的日志先结束，才能被撤销
+        self.close_batches()
+        result = OrganizeResult(target_folder)
+        started = time.monotonic()
+        self.is_running = True
+        self._throttle = None
+        self._transfer = self._new_transfer()
+
+        try:
+            if journal_path:
+                state = read_journal(journal_path)
+            else:
+                state = latest_journal(target_folder, finished=True)
+            if state is None:
+                self.log("没有可撤销的整理记录")
+                self.update_status("没有可撤销的整理")
+                return result
+
+            moves = state.completed()
+            result.total_files = len(moves)
+            self.update_status(f"正在撤销整理 (0/{result.total_files})")
+
+            for src, dst in reversed(moves):
+                if not self.is_running:
+                    break
+                try:
+                    if not os.path.lexists(dst) or os.path.lexists(src):
+                        result.skipped_files += 1
+                        self.log(f"跳过: {dst}（文件已不在原处或原位置已被占用）")
+                    else:
+                        os.makedirs(os.path.dirname(src), exist_ok=True)
+                        self._transfer.move(dst, os.path.dirname(src), os.path.basename(src))
+                        result.moved_files += 1
+                except TransferInterrupted:
+                    break
+                except OSError as e:
+                    self._record_error(os.path.basename(dst), e, result)
+
+                result.processed_files += 1
+                self.update_progress(result.processed_files, result.total_files)
+                self.update_status(f"正在撤销整理 ({result.processed_files}/{result.total_files})")
+
+            result.renamed_files = self._transfer.renamed
+            result.copied_files = self._transfer.copied
+            result.bytes_copied = self._transfer.bytes_copied
+            result.stopped = not self.is_running
+            if result.stopped:
+                self.update_status("撤销已停止")
+            else:
+                if result.error_files == 0:
+                    os.replace(state.path, state.path + '.undone')
+                self.log(f"已撤销 {result.moved_files} 个文件的移动")
+                self.update_status("撤销完成")
+            return result
+
+        finally:
+            self.is_running = False
+            self._transfer.close()
+            result.elapsed = time.monotonic() - started
+
+    def _close_snapshot(self, commit):
+        """整理完整结束时提交快照，否则丢弃本次的修改"""
+        snapshot, self._snapshot = self._snapshot, None
+        if snapshot is None:
+            return
+        try:
+            if commit:
+                snapshot.commit()
+        finally:
+            snapshot.close()
+
+    def _prepare_folders(self, target_folder, categories=None):
+        """预创建分类文件夹（默认为分类器中的全部分类）"""
+        for category in self.classifier.categories if categories is None else categories:
+            category_folder = Path(target_folder) / category
+            try:
+                if not category_folder.exists():
+                    category_folder.mkdir(exist_ok=True)
+                    self.log(f"创建文件夹: {category}")
+            except Exception as e:
+                self.log(f"创建文件夹 {category} 失败: {e}")
+
+    def _category_folder(self, target_folder, category, filename, st):
+        """文件的目标文件夹：分类文件夹，启用分片时为其中的分片子文件夹"""
+        if self._shards is None:
+            return os.path.join(target_folder, category)
+        return self._shards.folder(target_folder, category, filename, st)
+
+    def _close_shards(self, target_folder):
+        """记录本次用过分片的分类，之后扫描时跳过"""
+        shards, self._shards = self._shards, None
+        if shards is None:
+            return
+        try:
+            shards.save(target_folder)
+        except OSError as e:
+            self.log(f"保存分片记录失败: {e}")
+
+    def _folder_device(self, folder):
+        """分类文件夹所在设备（每个文件夹只 stat 一次）"""
+        dev = self._folder_devices.get(folder)
+        if dev is None:
+            dev = self._folder_devices[folder] = os.stat(folder).st_dev
+        return dev
+
+    def _classify(self, entry):
+        """根据规则找到对应的分类（只有规则用到大小/时间时才 stat，结果由 DirEntry 缓存）"""
+        if self._content_categories:
+            category = self._content_categories.pop(entry.path, None)
+            if category is not None:
+                return category
+        if self._table_source:
+            # FileTable 中已经分类的行
+            if entry.category is not None:
+                return entry.category
+            if self.classifier.needs_stat:
+                st = entry.table_stat
+                return self.classifier.classify(entry.name, st.st_size, st.st_mtime)
+        if self.classifier.needs_stat:
+            st = entry.stat()
+            return self.classifier.classify(entry.name, st.st_size, st.st_mtime)
+        return self.classifier.classify(entry.name)
+
+    def _dispatch(self, entry, target_folder, skip_errors, result, scan_state, executor, category=None):
+        """分类单个文件（已经分类时使用 category）并确定目标名称，然后执行（或提交）移动"""
+        filename = entry.name
+        metrics = self.metrics
+        found_category = category
+        st = None
+        new_filename = None
+        try:
+            started = time.perf_counter() if metrics is not None else 0.0
+            if found_category is None:
+                found_category = self._classify(entry)
+            if metrics is not None:
+                classified = time.perf_counter()
+            # FileTable 的行使用表中的大小、修改时间（不需要文件类型和 inode 时）
+            st = entry.table_stat if self._table_stats else entry.stat(follow_symlinks=False)
+            if self._packer is not None and self._packer.accepts(st):
+                if metrics is not None:
+                    metrics.add_time('classify', classified - started)
+                if self._pack_file(entry, found_category, skip_errors, result, scan_state):
+                    return
+            category_folder = self._category_folder(target_folder, found_category, filename, st)
+            new_filename = self._destinations.reserve(category_folder, filename)
+            # 提前判断是否同一设备：同设备直接 rename，跨设备走复制
+            devices = (st.st_dev, self._folder_device(category_folder))
+            if metrics is not None:
+                metrics.record(
+                    phases=(('classify', classified - started), ('resolve', time.perf_counter() - classified)),
+                    counters=(('stat_calls', 0 if self._table_stats else 2 if self.classifier.needs_stat else 1),)
+                )
+            task = MoveTask(entry.path, category_folder, new_filename, found_category,
+                            devices[0] == devices[1], size=st.st_size, mtime_ns=st.st_mtime_ns)
+            if self._journal is not None:
+                if metrics is None:
+                    task.journal_id = self._journal.plan(task.src, os.path.join(category_folder, new_filename))
+                else:
+                    with metrics.timer('journal'):
+                        task.journal_id = self._journal.plan(task.src, os.path.join(category_folder, new_filename))
+        except Exception as e:
+            if new_filename is not None:
+                self._destinations.release(category_folder, new_filename)
+            self._record_error(filename, e, result)
+            self._record(entry.path, None, found_category, 0 if st is None else st.st_size, 'error', e,
+                         0 if st is None else st.st_mtime_ns)
+            self._retry_in_snapshot(entry.path)
+            self._file_done(result, scan_state)
+            if not skip_errors:
+                raise
+            return
+
+        if self._duplicates is not None and stat.S_ISREG(st.st_mode) and st.st_size:
+            # 按提交顺序登记在分类文件夹（而不是分片子文件夹）下，后面内容相同的文件能找到它
+            task.dedupe_folder = os.path.join(target_folder, found_category)
+            task.record, candidates = self._duplicates.register(task.dedupe_folder, task.src, st)
+            task.candidates = candidates or None
+        self._submit_task(task, devices, skip_errors, result, scan_state, executor)
+
+    def _pack_file(self, entry, category, skip_errors, result, scan_state):
+        """把小文件追加到分类的当前归档，归档装满时封存；返回 False 时按正常方式移动
+
+        读取源文件出错时抛出 OSError（由 _dispatch 记录），源文件在归档封存后才删除。
+        """
+        metrics = self.metrics
+        started = time.perf_counter() if metrics is not None else 0.0
+        archive = self._packer.add(category, entry.path)
+        if archive is False:
+            # 扫描后文件变大或变成了链接
+            return False
+        if metrics is not None:
+            metrics.add_time('pack', time.perf_counter() - started)
+        self._file_done(result, scan_state)
+        if archive is not None:
+            self._seal(archive, skip_errors, result)
+        return True
+
+    def _seal(self, archive, skip_errors, result):
+        """封存一个归档：校验通过后删除源文件并计入结果，失败时源文件全部留在原处"""
+        metrics = self.metrics
+        started = time.perf_counter() if metrics is not None else 0.0
+        try:
+            removed, kept = archive.seal()
+        except Exception as e:
+            self.log(f"打包 {archive.category}/{archive.name} 失败，{len(archive.members)} 个文件保留在原处: {e}")
+            with self._lock:
+                result.error_files += len(archive.members)
+            for member in archive.members:
+                self._record(member.src, None, archive.category, member.size, 'error', e, member.st.st_mtime_ns)
+                self._retry_in_snapshot(member.src)
+            if not skip_errors and self._failure is None:
+                self._failure = e
+            return
+        finally:
+            if metrics is not None:
+                metrics.add_time('pack', time.perf_counter() - started)
+
+        for member in removed:
+            # 目标记为归档中的路径：归档/文件名
+            self._record(member.src, os.path.join(archive.path, os.path.basename(member.src)),
+                         archive.category, member.size, 'packed', mtime_ns=member.st.st_mtime_ns)
+        for member in kept:
+            self.log(f"跳过: {os.path.basename(member.src)}（打包后源文件有变化，保留在原处）")
+            self._record(member.src, None, archive.category, member.size, 'skipped', "打包后源文件有变化",
+                         member.st.st_mtime_ns)
+            self._retry_in_snapshot(member.src)
+        self.log(f"已打包: {len(removed)} 个文件 -> {archive.category}/{archive.name}")
+        with self._lock:
+            result.moved_files += len(removed)
+            result.skipped_files += len(kept)
+            result.packed_files += len(removed)
+            result.archives_written += 1
+            result.categories[archive.category] = result.categories.get(archive.category, 0) + len(removed)
+        if metrics is not None:
+            metrics.record(counters=(('files_packed', len(removed)), ('archives_written', 1),
+                                     ('bytes_packed', archive.bytes)))
+
+    def _submit_task(self, task, devices, skip_errors, result, scan_state, executor):
+        """直接执行移动，或提交给并行执行器"""
+        if executor is None:
+            self._run_move(task, skip_errors, result, scan_state)
+            return
+
+        def cancel():
+            self._destinations.release(task.folder, task.name)
+            if task.journal_id is not None:
+                self._journal.fail(task.journal_id)
+            if task.record is not None:
+                self._duplicates.finish(task.dedupe_folder, task.record)
+
+        def on_done(future):
+            if future.cancelled():
+                cancel()
+            elif future.exception() is not None and self._failure is None:
+                self._failure = future.exception()
+
+        future = executor.submit(
+            lambda: self._run_move(task, skip_errors, result, scan_state),
+            devices,
+            on_done,
+            # 等待内容可能相同的、更早提交的文件移动完成（不占用设备名额）
+            before=(lambda: DuplicateIndex.wait(task.candidates)) if task.candidates else None
+        )
+        if future is None:
+            cancel()
+
+    def _run_move(self, task, skip_errors, result, scan_state):
+        """执行一个移动任务并记录结果（可能在工作线程中运行）"""
+        filename = os.path.basename(task.src)
+        metrics = self.metrics
+        throttle = self._throttle
+        kept_path = None
+        try:
+            started = moving = time.perf_counter() if metrics is not None or throttle is not None else 0.0
+            waited = 0.0
+            outcome = None
+            if task.candidates:
+                duplicate = self._find_duplicate(task)
+                if duplicate is not None:
+                    outcome = self._handle_duplicate(task, duplicate, result)
+                if metrics is not None:
+                    moving = time.perf_counter()
+
+            if outcome is None:
+                if throttle is None:
+                    target_path, mode = self._move_to_folder(task.src, task.folder, task.name, task.same_device)
+                else:
+                    # 限速等待（包括复制过程中按字节预算的等待）不计入移动延迟
+                    waited_before = throttle.thread_waited()
+                    throttle.acquire_op()
+                    move_started = time.perf_counter()
+                    move_waited = throttle.thread_waited()
+                    target_path, mode = self._move_to_folder(task.src, task.folder, task.name, task.same_device)
+                    waited = throttle.thread_waited() - waited_before
+                    throttle.observe(time.perf_counter() - move_started - (throttle.thread_waited() - move_waited),
+                                     task.size, mode == 'copy')
+                kept_path = target_path
+                if mode == 'copy' and task.record is not None:
+                    self._refresh_record(task.record, target_path)
+            else:
+                target_path, mode = outcome
+            if metrics is not None:
+                finished = time.perf_counter()
+                metrics.record(
+                    phases=(('dedupe', moving - started), ('move', finished - moving - waited), ('throttle', waited)),
+                    counters=(('bytes_renamed', task.size if mode == 'rename' else 0),),
+                    latency=finished - started - waited
+                )
+
+            if task.journal_id is not None:
+                if target_path is None:
+                    self._journal.fail(task.journal_id)
+                else:
+                    changed = target_path != os.path.join(task.folder, task.name)
+                    self._journal.done(task.journal_id, mode, target_path if changed else None)
+            if outcome is None:
+                self.log(f"已移动: {filename} -> {task.category}/")
+                with self._lock:
+                    result.moved_files += 1
+                    result.categories[task.category] = result.categories.get(task.category, 0) + 1
+            self._record(task.src, target_path, task.category, task.size,
+                         'moved' if outcome is None else 'duplicate', mtime_ns=task.mtime_ns)
+        except TransferInterrupted as e:
+            # 停止请求打断了跨设备复制：文件留在原处，大文件下次从断点继续
+            if task.journal_id is not None:
+                self._journal.fail(task.journal_id)
+            if e.resumable:
+                self.log(f"已暂停: {filename}（已复制 {e.copied // 1048576} / {e.size // 1048576} MB，"
+                         f"下次整理时继续）")
+            else:
+                self.log(f"已暂停: {filename}")
+            with self._lock:
+                result.skipped_files += 1
+            self._record(task.src, None, task.category, task.size, 'paused', mtime_ns=task.mtime_ns)
+            self._retry_in_snapshot(task.src)
+        except Exception as e:
+            if task.journal_id is not None:
+                self._journal.fail(task.journal_id)
+            if self._table_source and isinstance(e, FileNotFoundError) and not os.path.lexists(task.src):
+                # FileTable 中的文件在整理前已被删除或移走（没有逐个 lstat 检查）
+                self.log(f"跳过: {filename}（源文件已不存在）")
+                with self._lock:
+                    result.skipped_files += 1
+                self._record(task.src, None, task.category, task.size, 'skipped', "源文件已不存在", task.mtime_ns)
+                return
+            self._record_error(filename, e, result)
+            self._record(task.src, None, task.category, task.size, 'error', e, task.mtime_ns)
+            self._retry_in_snapshot(task.src)
+            if not skip_errors:
+                raise
+        finally:
+            if task.record is not None:
+                # 只有正常移入的文件留在索引中，供后面的文件比较
+                self._duplicates.finish(task.dedupe_folder, task.record, kept_path)
+            self._file_done(result, scan_state)
+
+    def _find_duplicate(self, task):
+        """比较内容，返回内容相同的已有文件记录（读取失败时按不重复处理）"""
+        try:
+            return self._duplicates.find_duplicate(task.record, task.candidates)
+        except OSError as e:
+            self.log(f"无法比较文件内容 {os.path.basename(task.src)}: {e}")
+            return None
+
+    @staticmethod
+    def _refresh_record(record, path):
+        """跨设备复制后文件的设备号和 inode 已经改变"""
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return
+        record.dev = st.st_dev
+        record.ino = st.st_ino
+
+    def _handle_duplicate(self, task, duplicate, result):
+        """按 dedupe 设置处理重复文件，返回 (目标路径或 None, 方式)；需要改为正常移动时返回 None"""
+        filename = os.path.basename(task.src)
+        # task.folder 在分片整理时是分类文件夹下的分片子文件夹，重复文件夹总在目标文件夹中
+        target_folder = self._target_folder
+        original = os.path.relpath(duplicate.path, target_folder)
+
+        if self.dedupe == DEDUPE_HARDLINK:
+            target_path = os.path.join(task.folder, task.name)
+            try:
+                if os.path.lexists(target_path):
+                    raise FileExistsError(target_path)
+                os.link(duplicate.path, target_path)
+            except OSError as e:
+                # 跨设备、文件系统不支持或目标被占用：按正常方式移动
+                self.log(f"无法为重复文件 {filename} 创建硬链接（{e}），改为正常移动")
+                return None
+            os.unlink(task.src)
+            self.log(f"重复文件: {filename} 与 {original} 相同，已改为硬链接 -> {task.category}/")
+            category, mode = task.category, 'link'
+        elif self.dedupe == DEDUPE_FOLDER:
+            self._destinations.release(task.folder, task.name)
+            folder = os.path.join(target_folder, DUPLICATES_FOLDER)
+            os.makedirs(folder, exist_ok=True)
+            name = self._destinations.reserve(folder, filename)
+            target_path, mode = self._move_to_folder(task.src, folder, name)
+            self.log(f"重复文件: {filename} 与 {original} 相同，已移动到 {DUPLICATES_FOLDER}/")
+            category = DUPLICATES_FOLDER
+        else:
+            self._destinations.release(task.folder, task.name)
+            self._keep_in_snapshot(task.src)
+            self.log(f"跳过重复文件: {filename}（与 {original} 相同）")
+            with self._lock:
+                result.skipped_files += 1
+                result.duplicate_files += 1
+                result.duplicate_bytes += task.record.size
+            return None, DEDUPE_SKIP
+
+        with self._lock:
+            result.moved_files += 1
+            result.categories[category] = result.categories.get(category, 0) + 1
+            result.duplicate_files += 1
+            result.duplicate_bytes += task.record.size
+        return target_path, mode
+
+    def _move_to_folder(self, file_path, category_folder, new_filename, same_device=None):
+        """把文件移动到分类文件夹中已分配的名称，返回 (目标路径, 'rename' 或 'copy')
+
+        名称由 DestinationIndex 在内存中分配；移动本身不会覆盖已有文件（见
+        transfer.rename_noreplace），如果名称被外部进程抢先占用，则登记该名称并重新分配。
+        """
+        destinations = self._destinations
+        for attempt in range(MAX_NAME_RETRIES):
+            try:
+                mode = self._transfer.move(file_path, category_folder, new_filename, same_device)
+            except FileExistsError:
+                destinations.mark_taken(category_folder, new_filename)
+                new_filename = destinations.reserve(category_folder, os.path.basename(file_path))
+                continue
+            except BaseException:
+                destinations.release(category_folder, new_filename)
+                raise
+            if attempt and self.metrics is not None:
+                self.metrics.record(counters=(('name_retries', attempt),))
+            return os.path.join(category_folder, new_filename), mode
+        destinations.release(category_folder, new_filename)
+        raise FileExistsError(f"无法为 {os.path.basename(file_path)} 找到可用的文件名")
+
+    def _keep_in_snapshot(self, path):
+        """文件有意留在了原处：记入快照，下次增量整理时如果没有变化就跳过"""
+        if self._snapshot is not None:
+            self._snapshot.record_file(path)
+
+    def _retry_in_snapshot(self, path):
+        """文件因出错或中断留在了原处：下次增量整理时重新读取它所在的目录并重试"""
+        if self._snapshot is not None:
+            self._snapshot.retry_file(path)
+
+    def _record(self, src, dest, category, size, status, error=None, mtime_ns=0):
+        """把一个文件的结果记入运行结果表（启用时），大小和 mtime_ns 取自已有的 stat 结果"""
+        if self.run_table is not None:
+            self.run_table.record(src, dest, category, size, status, error, mtime_ns)
+
+    def _record_error(self, filename, error, result):
+        """记录单个文件的错误"""
+        if isinstance(error, PermissionError):
+            self.log(f"权限错误，无法移动文件 {filename}: {error}")
+        elif isinstance(error, OSError):
+            self.log(f"移动文件 {filename} 时出错: {error}")
+        else:
+            self.log(f"处理文件 {filename} 时出错: {error}")
+        with self._lock:
+            result.error_files += 1
+
+    def _file_done(self, result, scan_state):
+        """更新进度（扫描未结束时总数为估计值）"""
+        with self._lock:
+            result.processed_files += 1
+            processed = result.processed_files
+        total = max(scan_state['found'], processed)
+        self.update_progress(processed, total)
+        if scan_state['done']:
+            self.update_status(f"正在整理文件 ({processed}/{total})")
+        else:
+            self.update_status(f"正在整理文件 ({processed}/{total}+，仍在扫描)")
@@ -0,0 +1,73 @@
+"""并行移动执行器：线程池 + 按设备限制并发"""
+import threading
+
+# 每个设备（st_dev）默认允许的并发移动数
+DEFAULT_DEVICE_LIMIT = 4
+
+
+class MoveExecutor:
+    """按源/目标设备调度移动任务的线程池
+
+    每个任务声明它涉及的设备（源文件和目标文件夹的 st_dev），执行前按设备号
+    顺序获取各设备的并发名额，避免死锁；同设备移动只占一个名额。
+    同时在途的任务数有上限，提交方会在队列满时等待，内存占用不随文件数增长。
+    """
+
+    def __init__(self, workers, device_limit=DEFAULT_DEVICE_LIMIT, device_limits=None,
+                 keep_running=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.workers = workers
+        self.device_limit = device_limit
+        self.device_limits = dict(device_limits or {})
+        self.keep_running = keep_running
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="organizer-move")
+        self._in_flight = threading.Semaphore(workers * 4)
+        self._device_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _device_semaphore(self, dev):
+        with self._lock:
+            semaphore = self._device_semaphores.get(dev)
+            if semaphore is None:
+                limit = self.device_limits.get(dev, self.device_limit)
+                semaphore = threading.Semaphore(max(1, limit))
+                self._device_semaphores[dev] = semaphore
+            return semaphore
+
+    def _run(self, fn, devices, before):
+        if before is not None:
+            before()
+        semaphores = [self._device_semaphore(dev) for dev in sorted(set(devices))]
+        for semaphore in semaphores:
+            semaphore.acquire()
+        try:
+            return fn()
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+    def submit(self, fn, devices, on_done=None, before=None):
+        """提交一个移动任务，返回 Future；停止整理时返回 None
+
+        on_done(future) 在任务完成或被取消后调用（可能在工作线程中）。
+        before() 在获取设备名额之前调用，用于等待更早提交的任务，
+        等待期间不占用任何设备名额。
+        """
+        while not self._in_flight.acquire(timeout=0.1):
+            if self.keep_running and not self.keep_running():
+                return None
+
+        future = self._pool.submit(self._run, fn, devices, before)
+
+        def done(f):
+            self._in_flight.release()
+            if on_done:
+                on_done(f)
+
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self, cancel=False):
+        """等待在途任务结束；cancel 为 True 时取消尚未开始的任务"""
+        self._pool.shutdown(wait=True, cancel_futures=cancel)
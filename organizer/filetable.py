@@ -0,0 +1,329 @@
+"""紧凑的列式文件表，用于需要在内存中保存大量文件信息的场合
+
+每个文件保存为几个并行的定长数组中的一项，而不是一个 str 路径或一个对象：
+
+- 目录路径去重后存一次，文件只记录目录 id（array 'I'）；
+- 文件名按文件系统编码拼接在一个 bytearray 中，另有结束偏移数组；
+- 大小、mtime_ns（array 'q'）和分类 id（array 'H'，分类名同样去重）。
+
+每个文件约占 30 字节加上文件名的字节数，而 list[str] 中每个完整路径就要
+50 多字节的对象头加上完整路径。按下标读取时才临时构造名称和路径字符串。
+
+RunTable 在同样的列上增加目标和状态，记录一次整理中每个文件的结果，
+可以筛选、排序（只得到下标数组）并逐行导出为 CSV 或 JSON Lines。
+"""
+import itertools
+import os
+import sys
+import threading
+from array import array
+
+# 没有分类的文件的分类 id
+NO_CATEGORY = 0xFFFF
+
+# 没有目标的行（出错、跳过等）的目标目录 id
+NO_DIR = 0xFFFFFFFF
+
+# 运行结果表中的状态（按 id 顺序）及界面上的说明
+RUN_STATUSES = ('moved', 'packed', 'duplicate', 'skipped', 'paused', 'error')
+STATUS_LABELS = {
+    'moved': '已移动',
+    'packed': '已打包',
+    'duplicate': '重复文件',
+    'skipped': '跳过',
+    'paused': '已暂停',
+    'error': '错误',
+}
+_STATUS_IDS = {status: i for i, status in enumerate(RUN_STATUSES)}
+
+# 可以排序的列和导出的字段
+RUN_SORT_KEYS = ('source', 'category', 'size', 'status', 'error')
+EXPORT_FIELDS = ('source', 'destination', 'category', 'size', 'status', 'error')
+
+_ENCODING = sys.getfilesystemencoding()
+_ERRORS = sys.getfilesystemencodeerrors()
+
+
+def _csv_text(value):
+    """CSV 中的字段：文件名中无法解码的字节写为 \\xff 形式（Excel 只能打开有效的 UTF-8）"""
+    if isinstance(value, str) and not value.isascii():
+        return value.encode(_ENCODING, _ERRORS).decode(_ENCODING, 'backslashreplace')
+    return value
+
+
+class FileTable:
+    """按追加顺序编号的文件表（下标 0 .. len-1）"""
+
+    def __init__(self):
+        # id -> 目录路径 / 分类名，以及反查表
+        self.dirs = []
+        self._dir_ids = {}
+        self.categories = []
+        self._category_ids = {}
+        self._last_dir = None
+        self._last_dir_id = 0
+
+        self._names = bytearray()
+        self._name_ends = array('Q')
+        self.dir_ids = array('I')
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.category_ids = array('H')
+
+    def __len__(self):
+        return len(self.dir_ids)
+
+    def dir_id(self, directory):
+        """目录路径对应的 id（第一次出现时登记）"""
+        if directory == self._last_dir:
+            return self._last_dir_id
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self.dirs)
+            self.dirs.append(directory)
+        self._last_dir = directory
+        self._last_dir_id = dir_id
+        return dir_id
+
+    def category_id(self, category):
+        """分类名对应的 id（None 为 NO_CATEGORY）"""
+        if category is None:
+            return NO_CATEGORY
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            category_id = len(self.categories)
+            if category_id >= NO_CATEGORY:
+                raise ValueError("分类数量超出上限")
+            self._category_ids[category] = category_id
+            self.categories.append(category)
+        return category_id
+
+    def append(self, directory, name, size=0, mtime_ns=0, category=None):
+        """追加一个文件，返回它的下标"""
+        index = len(self.dir_ids)
+        self._names += name.encode(_ENCODING, _ERRORS)
+        self._name_ends.append(len(self._names))
+        self.dir_ids.append(self.dir_id(directory))
+        self.sizes.append(size)
+        self.mtimes.append(mtime_ns)
+        self.category_ids.append(self.category_id(category))
+        return index
+
+    def add_entry(self, entry, category=None):
+        """追加一个 DirEntry（或 scanner.FileEntry），使用它缓存的 lstat 结果"""
+        st = entry.stat(follow_symlinks=False)
+        return self.append(os.path.dirname(entry.path), entry.name, st.st_size, st.st_mtime_ns, category)
+
+    def set_category(self, index, category):
+        self.category_ids[index] = self.category_id(category)
+
+    def name(self, index):
+        ends = self._name_ends
+        start = ends[index - 1] if index else 0
+        return self._names[start:ends[index]].decode(_ENCODING, _ERRORS)
+
+    def directory(self, index):
+        return self.dirs[self.dir_ids[index]]
+
+    def path(self, index):
+        return os.path.join(self.dirs[self.dir_ids[index]], self.name(index))
+
+    def category(self, index):
+        category_id = self.category_ids[index]
+        return None if category_id == NO_CATEGORY else self.categories[category_id]
+
+    def __iter__(self):
+        """按顺序产出完整路径（逐个临时构造，可直接传给 organize_paths）"""
+        names = self._names
+        ends = self._name_ends
+        dirs = self.dirs
+        join = os.path.join
+        start = 0
+        for end, dir_id in zip(ends, self.dir_ids):
+            yield join(dirs[dir_id], names[start:end].decode(_ENCODING, _ERRORS))
+            start = end
+
+    def rows(self):
+        """按顺序产出 (目录 id, 文件名, 大小, mtime_ns, 分类)，直接遍历各列"""
+        names = self._names
+        categories = self.categories
+        start = 0
+        for end, dir_id, size, mtime_ns, category_id in zip(
+                self._name_ends, self.dir_ids, self.sizes, self.mtimes, self.category_ids):
+            yield (dir_id, names[start:end].decode(_ENCODING, _ERRORS), size, mtime_ns,
+                   None if category_id == NO_CATEGORY else categories[category_id])
+            start = end
+
+    def category_totals(self):
+        """按分类统计 {分类: [文件数, 字节数]}（没有分类的文件记在 None 下），只遍历数组"""
+        counts = {}
+        for category_id, size in zip(self.category_ids, self.sizes):
+            item = counts.get(category_id)
+            if item is None:
+                counts[category_id] = [1, size]
+            else:
+                item[0] += 1
+                item[1] += size
+        return {
+            (None if category_id == NO_CATEGORY else self.categories[category_id]): item
+            for category_id, item in counts.items()
+        }
+
+    def memory_usage(self):
+        """表本身占用的字节数（数组缓冲区、去重后的目录和分类字符串，不含字典的开销）"""
+        total = sys.getsizeof(self._names)
+        for column in (self._name_ends, self.dir_ids, self.sizes, self.mtimes, self.category_ids):
+            total += column.buffer_info()[1] * column.itemsize
+        total += sum(sys.getsizeof(s) for s in self.dirs)
+        total += sum(sys.getsizeof(s) for s in self.categories)
+        return total
+
+
+class RunTable(FileTable):
+    """一次整理中每个文件的结果：源路径、目标路径、分类、大小、状态和错误信息
+
+    在 FileTable 的列之外增加目标目录 id（与源目录共用去重表）和状态两个定长列；
+    目标文件名只在与源文件名不同（重名改名）时记录，错误信息只有出错、跳过的行才有，
+    都存在稀疏字典中。record() 可以在多个线程中调用；len() 只计入已完整写入的行，
+    界面线程可以在整理进行中读取。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.dest_dir_ids = array('I')
+        self.statuses = array('B')
+        self._dest_names = {}
+        self.errors = {}
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._rows
+
+    def record(self, src, dest, category, size, status, error=None, mtime_ns=0):
+        """追加一个文件的结果（dest 为 None 表示没有移动），返回它的下标"""
+        directory, name = os.path.split(src)
+        with self._lock:
+            index = self.append(directory, name, size, mtime_ns, category)
+            if dest is None:
+                self.dest_dir_ids.append(NO_DIR)
+            else:
+                dest_dir, dest_name = os.path.split(dest)
+                self.dest_dir_ids.append(self.dir_id(dest_dir))
+                if dest_name != name:
+                    self._dest_names[index] = dest_name
+            self.statuses.append(_STATUS_IDS[status])
+            if error is not None:
+                self.errors[index] = str(error)
+            self._rows = index + 1
+        return index
+
+    def destination(self, index):
+        dir_id = self.dest_dir_ids[index]
+        if dir_id == NO_DIR:
+            return None
+        name = self._dest_names.get(index)
+        return os.path.join(self.dirs[dir_id], self.name(index) if name is None else name)
+
+    def status(self, index):
+        return RUN_STATUSES[self.statuses[index]]
+
+    def error(self, index):
+        return self.errors.get(index)
+
+    def row(self, index):
+        """一行的全部字段（导出用）"""
+        return {
+            'source': self.path(index),
+            'destination': self.destination(index),
+            'category': self.category(index),
+            'size': self.sizes[index],
+            'status': self.status(index),
+            'error': self.errors.get(index),
+        }
+
+    def status_totals(self):
+        """{状态: 行数}"""
+        counts = {}
+        for status_id in self.statuses[:len(self)]:
+            counts[status_id] = counts.get(status_id, 0) + 1
+        return {RUN_STATUSES[status_id]: n for status_id, n in counts.items()}
+
+    def view(self, categories=None, statuses=None, sort=None, reverse=False):
+        """筛选并排序，返回行下标数组（array 'I'），表本身不变
+
+        categories / statuses 为要保留的分类名（None 表示没有分类）和状态集合，None 为不筛选；
+        sort 为 RUN_SORT_KEYS 之一，None 为记录顺序。筛选和按数值列排序都在 C 层完成，
+        只有按源路径和错误信息排序时才逐行构造字符串。
+        """
+        count = len(self)
+        rows = range(count)
+        if categories is not None:
+            wanted = {self._category_ids.get(c, -1) if c is not None else NO_CATEGORY for c in categories}
+            rows = itertools.compress(rows, map(wanted.__contains__, self.category_ids[:count]))
+        if statuses is not None:
+            wanted = {_STATUS_IDS[s] for s in statuses}
+            selected = array('I', rows)
+            rows = itertools.compress(selected, map(wanted.__contains__, map(self.statuses.__getitem__, selected)))
+
+        if sort is None:
+            return array('I', reversed(array('I', rows)) if reverse else rows)
+        if sort == 'category':
+            # 分类按名称排序（没有分类的排在最后），先把每行映射为名称的名次
+            names = sorted(range(len(self.categories)), key=self.categories.__getitem__)
+            ranks = {category_id: rank for rank, category_id in enumerate(names)}
+            ranks[NO_CATEGORY] = len(names)
+            keys = list(map(ranks.__getitem__, self.category_ids[:count]))
+            key = keys.__getitem__
+        elif sort == 'size':
+            key = self.sizes.__getitem__
+        elif sort == 'status':
+            key = self.statuses.__getitem__
+        elif sort == 'error':
+            errors = self.errors
+
+            def key(index):
+                return errors.get(index, '')
+        elif sort == 'source':
+            key = self.path
+        else:
+            raise ValueError(f"不能按 {sort} 排序")
+        return array('I', sorted(rows, key=key, reverse=reverse))
+
+    def export(self, path, rows=None, append=False):
+        """把 rows（默认全部行）逐行写入 CSV，扩展名为 .jsonl / .json 时写 JSON Lines，返回行数
+
+        逐行构造和写出，不在内存中生成整个文件。append 为 True 时追加到已有文件（CSV 不再写表头）。
+        不是有效 UTF-8 的文件名在 JSON Lines 中按原始字节写出，在 CSV 中写为 \\xff 形式的转义。
+        """
+        rows = range(len(self)) if rows is None else rows
+        mode = 'a' if append else 'w'
+        count = 0
+        if path.lower().endswith(('.jsonl', '.json')):
+            import json
+
+            with open(path, mode, encoding='utf-8', errors=_ERRORS) as f:
+                for index in rows:
+                    f.write(json.dumps(self.row(index), ensure_ascii=False) + '\n')
+                    count += 1
+        else:
+            import csv
+
+            # utf-8-sig：Excel 按 UTF-8 打开中文路径（追加时不再写 BOM）
+            with open(path, mode, encoding='utf-8' if append else 'utf-8-sig', newline='') as f:
+                writer = csv.writer(f)
+                if not append:
+                    writer.writerow(EXPORT_FIELDS)
+                for index in rows:
+                    row = self.row(index)
+                    writer.writerow([_csv_text(row[field]) for field in EXPORT_FIELDS])
+                    count += 1
+        return count
+
+    def memory_usage(self):
+        total = super().memory_usage()
+        for column in (self.dest_dir_ids, self.statuses):
+            total += column.buffer_info()[1] * column.itemsize
+        total += sum(sys.getsizeof(s) for s in self._dest_names.values())
+        total += sum(sys.getsizeof(s) for s in self.errors.values())
+        return total
@@ -0,0 +1,310 @@
+"""移动日志（journal）：崩溃后续做、撤销整理
+
+每次整理在状态目录中写一个只追加的 JSON Lines 文件::
+
+    {"op": "begin", "target": ..., "time": ...}
+    {"op": "plan", "id": 1, "src": ..., "dst": ...}    # 移动前写入
+    {"op": "done", "id": 1, "mode": "rename"}          # 移动完成（目标名变化时带 dst）
+    {"op": "fail", "id": 2}
+    {"op": "end", "stopped": false}
+
+plan 记录在移动前写入操作系统（进程崩溃不会丢失），done 记录先缓存，
+随下一条 plan 一起写出；fsync 按条数/时间批量进行。整理结束后日志被压缩为
+只含已完成移动的 {"op": "move", "src", "dst"} 记录，用于撤销。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from json.encoder import encode_basestring as _quote
+
+from .state import state_dir
+
+# 每写入多少条记录 fsync 一次
+JOURNAL_FSYNC_EVERY = 256
+
+# 距离上次 fsync 超过多少秒时强制 fsync
+JOURNAL_FSYNC_INTERVAL = 1.0
+
+JOURNAL_PREFIX = 'journal-'
+JOURNAL_SUFFIX = '.jsonl'
+
+# 同一秒内创建的日志用序号区分（文件名按创建顺序排序）
+MAX_JOURNALS_PER_SECOND = 1000
+
+# 连续多批整理（监视模式）共用一个日志时，超过这个大小或打开时间就换新的
+JOURNAL_ROTATE_BYTES = 64 * 1024 * 1024
+JOURNAL_ROTATE_SECONDS = 3600
+
+_PLAN_PREFIX = '{"op": "plan", "id": '
+
+# 文件名不是有效 UTF-8 时（os.fsdecode 得到的代理字符）按原始字节写入和读回
+_ERRORS = sys.getfilesystemencodeerrors()
+
+
+class JournalState:
+    """读取日志文件得到的状态"""
+
+    def __init__(self, path):
+        self.path = path
+        self.target = None
+        self.finished = False
+        self.compacted = False
+        # id -> [src, dst, 状态]，状态为 'plan' / 'done' / 'fail'
+        self.entries = {}
+        self.last_id = 0
+
+    def pending(self):
+        """已计划但没有完成记录的移动，按计划顺序返回 [(id, src, dst)]"""
+        return [(i, e[0], e[1]) for i, e in self.entries.items() if e[2] == 'plan']
+
+    def completed(self):
+        """已完成的移动，按完成顺序返回 [(src, dst)]"""
+        return [(e[0], e[1]) for e in self.entries.values() if e[2] == 'done']
+
+
+def read_journal(path):
+    """解析日志文件（忽略崩溃时写了一半的最后一行）"""
+    state = JournalState(path)
+    entries = state.entries
+    move_id = 0
+    with open(path, 'r', encoding='utf-8', errors=_ERRORS) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            op = record.get('op')
+            if op == 'plan':
+                entries[record['id']] = [record['src'], record['dst'], 'plan']
+                state.last_id = max(state.last_id, record['id'])
+            elif op == 'done':
+                entry = entries.pop(record['id'], None)
+                if entry is not None:
+                    # 按完成顺序重新插入，撤销时倒序回放
+                    entries[record['id']] = [entry[0], record.get('dst', entry[1]), 'done']
+            elif op == 'fail':
+                if record['id'] in entries:
+                    entries[record['id']][2] = 'fail'
+            elif op == 'move':
+                move_id -= 1
+                entries[move_id] = [record['src'], record['dst'], 'done']
+            elif op == 'begin':
+                state.target = record.get('target')
+                state.compacted = bool(record.get('compacted'))
+            elif op == 'end':
+                state.finished = True
+    return state
+
+
+def find_journals(target_folder):
+    """按时间顺序列出目标文件夹的所有日志文件"""
+    folder = state_dir(target_folder)
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(folder, name) for name in sorted(names)
+        if name.startswith(JOURNAL_PREFIX) and name.endswith(JOURNAL_SUFFIX)
+    ]
+
+
+def latest_journal(target_folder, finished):
+    """最近一次已结束（finished=True）或中断（False）的整理日志，没有时返回 None"""
+    for path in reversed(find_journals(target_folder)):
+        state = read_journal(path)
+        if state.finished == finished:
+            return state
+    return None
+
+
+class MoveJournal:
+    """只追加的移动日志，可以在多个线程中使用"""
+
+    def __init__(self, path, next_id=1, fsync_every=JOURNAL_FSYNC_EVERY,
+                 fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = open(path, 'a', encoding='utf-8', errors=_ERRORS)
+        self._next_id = next_id
+        # 本次写入的记录中哪些已完成（按 id 的位图），以及目标名有变化的移动
+        self._first_id = next_id
+        self._done_bits = bytearray()
+        self._changed_dst = {}
+        self.target = None
+        self._pending = []
+        self._unsynced = 0
+        self._last_sync = self.opened = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, target_folder):
+        """为一次新的整理创建日志
+
+        文件用 O_EXCL 创建：同一秒内的多次整理（监视模式、图形界面、其他进程）
+        各自得到新的序号，不会写进同一个日志。
+        """
+        folder = state_dir(target_folder, create=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        for seq in range(MAX_JOURNALS_PER_SECOND):
+            path = os.path.join(folder, f"{JOURNAL_PREFIX}{stamp}-{seq:03d}{JOURNAL_SUFFIX}")
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            except FileExistsError:
+                continue
+            os.close(fd)
+            break
+        else:
+            raise FileExistsError(f"无法创建移动日志: {folder} 中同一秒内的日志太多")
+        journal = cls(path)
+        journal.target = os.path.abspath(target_folder)
+        journal._write({'op': 'begin', 'target': os.path.abspath(target_folder), 'time': time.time()})
+        journal.flush(sync=True)
+        return journal
+
+    @classmethod
+    def reopen(cls, state):
+        """继续写入一次中断的整理的日志"""
+        journal = cls(state.path, next_id=state.last_id + 1)
+        journal.target = state.target
+        return journal
+
+    def _write(self, record):
+        self._pending.append(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self, sync=False):
+        """把缓存的记录写入文件，必要时 fsync"""
+        with self._lock:
+            self._flush(sync)
+
+    def _flush(self, sync=False):
+        if self._pending:
+            self._file.write(''.join(self._pending))
+            self._unsynced += len(self._pending)
+            self._pending.clear()
+        self._file.flush()
+        now = time.monotonic()
+        if self._unsynced and (sync or self._unsynced >= self.fsync_every
+                               or now - self._last_sync >= self.fsync_interval):
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = now
+
+    def plan(self, src, dst):
+        """记录一个即将进行的移动，返回记录 id（移动前调用）"""
+        with self._lock:
+            move_id = self._next_id
+            self._next_id += 1
+            # 热路径上直接拼接 JSON，避免每条记录调用 json.dumps
+            line = (f'{{"op": "plan", "id": {move_id}, "src": {_quote(os.fspath(src))}, '
+                    f'"dst": {_quote(os.fspath(dst))}}}\n')
+            self._pending.append(line)
+            try:
+                self._flush()
+            except BaseException:
+                # 写不进去的记录不留在缓存中，否则之后每次写入都会失败
+                if self._pending and self._pending[-1] is line:
+                    self._pending.pop()
+                raise
+        return move_id
+
+    def done(self, move_id, mode, dst=None):
+        """记录移动完成；dst 与计划不同时传入实际目标"""
+        if dst is None:
+            line = f'{{"op": "done", "id": {move_id}, "mode": "{mode}"}}\n'
+        else:
+            line = f'{{"op": "done", "id": {move_id}, "mode": "{mode}", "dst": {_quote(os.fspath(dst))}}}\n'
+        with self._lock:
+            self._pending.append(line)
+            index = move_id - self._first_id
+            if index >= 0:
+                if index >> 3 >= len(self._done_bits):
+                    self._done_bits.extend(bytes(max(1024, len(self._done_bits))))
+                self._done_bits[index >> 3] |= 1 << (index & 7)
+                if dst is not None:
+                    self._changed_dst[move_id] = os.fspath(dst)
+
+    def should_rotate(self, max_bytes=JOURNAL_ROTATE_BYTES, max_age=JOURNAL_ROTATE_SECONDS):
+        """连续写入的日志是否该结束并换新的（文件超过 max_bytes 字节或打开超过 max_age 秒）"""
+        with self._lock:
+            self._flush()
+            size = os.fstat(self._file.fileno()).st_size
+        return size >= max_bytes or time.monotonic() - self.opened >= max_age
+
+    def fail(self, move_id):
+        """记录移动失败（源文件保持不动）"""
+        with self._lock:
+            self._pending.append(f'{{"op": "fail", "id": {move_id}}}\n')
+
+    def close(self, stopped=False):
+        """写入结束记录并关闭"""
+        with self._lock:
+            self._write({'op': 'end', 'stopped': stopped})
+            self._flush(sync=True)
+            self._file.close()
+
+    def abandon(self):
+        """异常退出时关闭文件但不写结束记录（保留续做的机会）"""
+        with self._lock:
+            self._flush(sync=True)
+            self._file.close()
+
+    def _is_done(self, move_id):
+        index = move_id - self._first_id
+        if index < 0 or index >> 3 >= len(self._done_bits):
+            return False
+        return bool(self._done_bits[index >> 3] & (1 << (index & 7)))
+
+    def compact(self):
+        """关闭后压缩日志
+
+        新建的日志直接按内存中的完成位图过滤 plan 行，不需要解析 JSON；
+        续做的日志包含之前进程写入的记录，退回完整解析。
+        """
+        if self._first_id != 1:
+            compact_journal(self.path)
+            return
+
+        temp = self.path + '.tmp'
+        prefix_len = len(_PLAN_PREFIX)
+        with open(self.path, 'r', encoding='utf-8', errors=_ERRORS) as src, \
+                open(temp, 'w', encoding='utf-8', errors=_ERRORS) as f:
+            f.write(json.dumps({'op': 'begin', 'target': self.target, 'compacted': True},
+                               ensure_ascii=False) + '\n')
+            for line in src:
+                if not line.startswith(_PLAN_PREFIX):
+                    continue
+                comma = line.index(',', prefix_len)
+                move_id = int(line[prefix_len:comma])
+                if not self._is_done(move_id):
+                    continue
+                dst = self._changed_dst.get(move_id)
+                if dst is None:
+                    f.write('{"op": "move", ' + line[comma + 2:])
+                else:
+                    record = json.loads(line)
+                    f.write(f'{{"op": "move", "src": {_quote(record["src"])}, "dst": {_quote(dst)}}}\n')
+            f.write(json.dumps({'op': 'end'}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+
+def compact_journal(path):
+    """把已结束的日志压缩为只含已完成移动的记录（原子替换）"""
+    state = read_journal(path)
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8', errors=_ERRORS) as f:
+        f.write(json.dumps({'op': 'begin', 'target': state.target, 'compacted': True},
+                           ensure_ascii=False) + '\n')
+        for src, dst in state.completed():
+            f.write(f'{{"op": "move", "src": {_quote(src)}, "dst": {_quote(dst)}}}\n')
+        f.write(json.dumps({'op': 'end'}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+    return state
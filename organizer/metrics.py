@@ -0,0 +1,239 @@
+"""整理过程的分阶段计时、计数和移动延迟统计
+
+引擎只在启用时创建 Metrics（engine.metrics 否则为 None），热路径上的每个
+埋点只是一次 None 判断，关闭时几乎没有开销。
+
+结果可以导出为 JSON（to_dict）或 Prometheus 文本格式（write_prometheus，
+供 node exporter 的 textfile collector 读取）。
+"""
+import math
+import os
+import threading
+import time
+
+# 延迟直方图：从 1 微秒开始，每翻一倍分为 4 个桶（相邻边界相差约 19%）
+_BUCKETS_PER_OCTAVE = 4
+_MIN_LATENCY = 1e-6
+_LATENCY_BUCKETS = 32 * _BUCKETS_PER_OCTAVE
+
+PROMETHEUS_PREFIX = 'file_organizer'
+
+# 阶段名称（Prometheus 标签值）与界面上的说明
+PHASE_LABELS = {
+    'scan': '扫描',
+    'scan_blocked': '扫描等待',
+    'wait_scan': '等待扫描',
+    'classify': '分类',
+    'resolve': '重名处理',
+    'move': '移动',
+    'dedupe': '查重',
+    'throttle': '限速等待',
+    'pack': '打包',
+    'journal': '日志',
+    'callbacks': '界面回调',
+    'total': '总计',
+}
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图，内存占用固定，用于估计 p50 / p99"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * _LATENCY_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        if seconds <= _MIN_LATENCY:
+            index = 0
+        else:
+            index = min(_LATENCY_BUCKETS - 1,
+                        int(math.log2(seconds / _MIN_LATENCY) * _BUCKETS_PER_OCTAVE) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """估计分位数（取所在桶的几何中点），没有数据时返回 None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                if index == 0:
+                    return _MIN_LATENCY
+                low = _MIN_LATENCY * 2 ** ((index - 1) / _BUCKETS_PER_OCTAVE)
+                return min(self.max, low * 2 ** (0.5 / _BUCKETS_PER_OCTAVE))
+        return self.max
+
+
+class _PhaseTimer:
+    __slots__ = ('metrics', 'phase', 'start')
+
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.add_time(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """一次整理的指标，可以在多个线程中更新
+
+    阶段耗时为各线程在该阶段花费时间之和（并行移动时 move 可能大于总耗时）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        # 名称 -> [最近值, 最大值]
+        self.gauges = {}
+        self.move_latency = LatencyHistogram()
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def timer(self, phase):
+        """with metrics.timer('scan'): ... 累计一段代码的耗时"""
+        return _PhaseTimer(self, phase)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self._lock:
+            item = self.gauges.get(name)
+            if item is None:
+                self.gauges[name] = [value, value]
+            else:
+                item[0] = value
+                if value > item[1]:
+                    item[1] = value
+
+    def record(self, phases=(), counters=(), latency=None):
+        """一次加锁累计多个阶段耗时、计数和一次移动延迟（每个文件调用，减少加锁次数）"""
+        with self._lock:
+            for phase, seconds in phases:
+                self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            for name, n in counters:
+                self.counters[name] = self.counters.get(name, 0) + n
+            if latency is not None:
+                self.move_latency.observe(latency)
+
+    def latency_summary(self):
+        latency = self.move_latency
+        return {
+            'count': latency.count,
+            'sum': round(latency.total, 6),
+            'p50': latency.quantile(0.5),
+            'p90': latency.quantile(0.9),
+            'p99': latency.quantile(0.99),
+            'max': latency.max,
+        }
+
+    def to_dict(self):
+        """转换为可序列化的字典（JSON 报告）"""
+        with self._lock:
+            return {
+                'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                'counters': dict(self.counters),
+                'gauges': {name: {'last': last, 'max': peak} for name, (last, peak) in self.gauges.items()},
+                'move_latency': self.latency_summary(),
+            }
+
+    def summary(self):
+        """一行文字摘要（图形界面统计栏使用）"""
+        parts = []
+        for phase in ('scan', 'classify', 'resolve', 'move', 'pack', 'throttle'):
+            if phase in self.phases:
+                parts.append(f"{PHASE_LABELS[phase]} {self.phases[phase]:.2f}s")
+        latency = self.latency_summary()
+        if latency['count']:
+            parts.append(f"移动延迟 p50 {_format_seconds(latency['p50'])} / p99 {_format_seconds(latency['p99'])}")
+        copied = self.counters.get('bytes_copied', 0)
+        if copied:
+            parts.append(f"跨设备复制 {copied / 1048576:.1f} MB")
+        if 'message_queue_depth' in self.gauges:
+            parts.append(f"界面队列峰值 {self.gauges['message_queue_depth'][1]}")
+        return " | ".join(parts)
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f}µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, **extra):
+    items = {**(labels or {}), **extra}
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items.items()) + '}'
+
+
+def format_prometheus(runs, prefix=PROMETHEUS_PREFIX):
+    """把 [(Metrics 或 Metrics.to_dict() 的结果, 标签字典)] 格式化为 Prometheus 文本格式"""
+    families = {}
+
+    def add(name, kind, help_text, sample_labels, value):
+        family = families.setdefault(name, (kind, help_text, []))
+        family[2].append(f"{prefix}_{name}{sample_labels} {value}")
+
+    for metrics, labels in runs:
+        data = metrics if isinstance(metrics, dict) else metrics.to_dict()
+        for phase, seconds in data['phases'].items():
+            add('phase_seconds', 'gauge', '各阶段耗时（秒，并行时为各线程之和）',
+                _labels(labels, phase=phase), seconds)
+        for name, value in data['counters'].items():
+            add(f'{name}_total', 'counter', name, _labels(labels), value)
+        for name, gauge in data['gauges'].items():
+            add(name, 'gauge', f'{name}（最近值）', _labels(labels), gauge['last'])
+            add(f'{name}_max', 'gauge', f'{name}（最大值）', _labels(labels), gauge['max'])
+        latency = data['move_latency']
+        for quantile, key in (('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99')):
+            value = latency[key]
+            if value is not None:
+                add('move_latency_seconds', 'summary', '单个文件的移动延迟（秒）',
+                    _labels(labels, quantile=quantile), value)
+        add('move_latency_seconds_sum', 'summary', None, _labels(labels), latency['sum'])
+        add('move_latency_seconds_count', 'summary', None, _labels(labels), latency['count'])
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        if help_text is not None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, runs, prefix=PROMETHEUS_PREFIX):
+    """原子写入 Prometheus 文本文件（textfile collector 不会读到写了一半的文件）"""
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(format_prometheus(runs, prefix))
+    os.replace(temp, path)
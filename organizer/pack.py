@@ -0,0 +1,451 @@
+"""小文件打包：把很小的文件写入每个分类的滚动归档（tar 或 zip）
+
+几百万个几 KB 的文件逐个移动时，每个文件都是一次元数据操作，并各占一个 inode。
+打包模式下小于阈值的普通文件被读入内存、依次追加到所在分类的当前归档中，
+归档达到大小或文件数上限时封存，之后的文件写入新的归档：
+
+1. 写完临时归档（分类文件夹中的 .organizer-tmp- 文件）并 fsync；
+2. 丢弃页缓存后重新读取：按归档格式检查成员列表和数据位置，再按位置读回每个
+   成员，与打包时计算的哈希比较（zip 同时比较 CRC）；
+3. 写入旁路索引（归档名加 .index.jsonl），把归档和索引改为正式名称；
+4. 最后才删除源文件；打包后大小、修改时间或 inode 有变化的源文件保留在原处。
+
+归档中的数据不压缩（tar 本身不压缩，zip 使用 ZIP_STORED），索引记录每个成员
+数据在归档中的偏移和长度，read_member() 不需要扫描归档就能直接读出。成员名为
+源文件相对目标文件夹的路径。打包的文件不写入移动日志，撤销整理不会解包，
+可以用 extract() 按原路径解包。
+
+索引文件是 JSON Lines 文本::
+
+    {"archive": ..., "format": "tar", "category": ..., "members": 2, "bytes": ..., "hash": "blake2b-128", "created": ...}
+    {"name": "相对路径", "offset": 数据偏移, "size": 大小, "mtime": ..., "digest": ...}
+
+命令行: python -m organizer.pack list INDEX | cat INDEX NAME | extract INDEX [--to DIR]
+"""
+import hashlib
+import io
+import itertools
+import json
+import os
+import stat
+import struct
+import sys
+import tarfile
+import time
+import zipfile
+import zlib
+
+from .transfer import TEMP_PREFIX
+
+PACK_FORMATS = ('tar', 'zip')
+
+# 小于此大小的普通文件被打包
+DEFAULT_PACK_THRESHOLD = 4096
+
+# 每个归档的数据量和文件数上限，达到其一即封存
+DEFAULT_PACK_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_PACK_MAX_FILES = 10000
+
+# 归档文件名前缀和索引文件后缀
+ARCHIVE_PREFIX = '小文件-'
+INDEX_SUFFIX = '.index.jsonl'
+
+# 成员内容的哈希（记录在索引中，封存时校验）
+DIGEST_SIZE = 16
+HASH_LABEL = f'blake2b-{DIGEST_SIZE * 8}'
+
+# zip 本地文件头：签名、版本、标志、压缩方式、时间、日期、CRC、压缩后大小、大小、文件名长度、附加字段长度
+_ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+class PackError(OSError):
+    """归档校验失败（源文件保留在原处）"""
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+
+
+def _zip_date_time(mtime):
+    """zip 只能表示 1980 到 2107 年的时间"""
+    tm = time.localtime(mtime)
+    if tm.tm_year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    if tm.tm_year > 2107:
+        return (2107, 12, 31, 23, 59, 58)
+    return tm[:6]
+
+
+def read_small(path, size_limit):
+    """读取一个小文件，返回 (内容, 读取前的 fstat)；文件已变成链接或超过 size_limit 时返回 None"""
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_CLOEXEC', 0))
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or st.st_size >= size_limit:
+            return None
+        chunks = []
+        remaining = size_limit
+        while remaining > 0:
+            chunk = os.read(fd, remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        data = b''.join(chunks)
+    finally:
+        os.close(fd)
+    if len(data) >= size_limit:
+        return None
+    return data, st
+
+
+class PackedMember:
+    """归档中的一个成员"""
+
+    __slots__ = ('src', 'name', 'offset', 'size', 'mtime', 'digest', 'crc', 'st')
+
+    def __init__(self, src, name, offset, size, mtime, digest, crc, st):
+        self.src = src
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+        self.crc = crc
+        # 读取源文件时的 fstat，删除前用来确认源文件没有变化
+        self.st = st
+
+    def unchanged(self, st):
+        return (st.st_ino == self.st.st_ino and st.st_size == self.st.st_size
+                and st.st_mtime_ns == self.st.st_mtime_ns)
+
+    def to_record(self):
+        return {'name': self.name, 'offset': self.offset, 'size': self.size,
+                'mtime': self.mtime, 'digest': self.digest}
+
+
+class PackArchive:
+    """一个正在写入的归档（位于分类文件夹中，封存前是临时文件）"""
+
+    def __init__(self, folder, category, fmt, name):
+        self.folder = folder
+        self.category = category
+        self.format = fmt
+        self.name = name
+        self.temp_path = os.path.join(folder, TEMP_PREFIX + name)
+        self.path = None
+        self.index_path = None
+        self.members = []
+        self.bytes = 0
+        self._file = open(self.temp_path, 'xb')
+        try:
+            if fmt == 'tar':
+                self._writer = tarfile.open(fileobj=self._file, mode='w', format=tarfile.PAX_FORMAT)
+            else:
+                self._writer = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_STORED)
+        except BaseException:
+            self._file.close()
+            os.unlink(self.temp_path)
+            raise
+
+    def add(self, src, name, data, st):
+        """追加一个成员（数据直接跟在成员头之后，记录其偏移）"""
+        size = len(data)
+        if self.format == 'tar':
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = st.st_mtime
+            info.mode = stat.S_IMODE(st.st_mode)
+            self._writer.addfile(info, io.BytesIO(data))
+            # tar 数据按 512 字节块对齐
+            padded = (size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+            offset = self._file.tell() - padded
+        else:
+            info = zipfile.ZipInfo(name, _zip_date_time(st.st_mtime))
+            info.external_attr = (stat.S_IFREG | stat.S_IMODE(st.st_mode)) << 16
+            self._writer.writestr(info, data)
+            offset = self._file.tell() - size
+        self.members.append(PackedMember(src, name, offset, size, st.st_mtime, _digest(data),
+                                         zlib.crc32(data), st))
+        self.bytes += size
+
+    def seal(self):
+        """写完、校验并改为正式名称，然后删除源文件
+
+        返回 (已删除源文件的成员, 源文件有变化而保留的成员)。
+        校验或写入失败时删除临时文件、保留全部源文件并抛出异常。
+        """
+        try:
+            self._writer.close()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._verify()
+            self._publish()
+        except BaseException:
+            self.discard()
+            raise
+        removed = []
+        kept = []
+        for member in self.members:
+            try:
+                if member.unchanged(os.lstat(member.src)):
+                    os.unlink(member.src)
+                    removed.append(member)
+                    continue
+            except FileNotFoundError:
+                pass
+            kept.append(member)
+        return removed, kept
+
+    def discard(self):
+        """放弃归档，源文件保持不动"""
+        for close in (self._writer.close, self._file.close):
+            try:
+                close()
+            except (OSError, ValueError):
+                pass
+        paths = [self.temp_path, self.temp_path + INDEX_SUFFIX]
+        if self.path is not None:
+            # 改名进行到一半：没有索引的归档也不保留
+            paths.extend((self.path, self.index_path))
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _verify(self):
+        """从磁盘读回归档：成员列表和数据位置与索引一致，每个成员的内容与打包时相同"""
+        fd = os.open(self.temp_path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            expected = [(m.name, m.offset, m.size) for m in self.members]
+            if self._layout(fd) != expected:
+                raise PackError(f"归档的成员列表与索引不一致: {self.name}")
+            for member in self.members:
+                data = os.pread(fd, member.size, member.offset)
+                if _digest(data) != member.digest or zlib.crc32(data) != member.crc:
+                    raise PackError(f"归档中 {member.name} 的内容与源文件不一致: {self.name}")
+        finally:
+            os.close(fd)
+
+    def _layout(self, fd):
+        """按归档格式解析出 [(成员名, 数据偏移, 大小)]"""
+        with open(fd, 'rb', closefd=False) as f:
+            if self.format == 'tar':
+                with tarfile.open(fileobj=f, mode='r:') as tar:
+                    return [(info.name, info.offset_data, info.size) for info in tar]
+            with zipfile.ZipFile(f) as archive:
+                layout = []
+                for info in archive.infolist():
+                    header = _ZIP_LOCAL_HEADER.unpack(os.pread(fd, _ZIP_LOCAL_HEADER.size, info.header_offset))
+                    if header[0] != b'PK\x03\x04' or info.compress_type != zipfile.ZIP_STORED:
+                        raise PackError(f"归档中 {info.filename} 的文件头无效: {self.name}")
+                    offset = info.header_offset + _ZIP_LOCAL_HEADER.size + header[9] + header[10]
+                    layout.append((info.filename, offset, info.file_size))
+                return layout
+
+    def _publish(self):
+        """写入索引，把归档和索引改为正式名称（不覆盖已有文件）"""
+        name = self.name
+        stem, suffix = os.path.splitext(name)
+        for n in itertools.count(1):
+            if not (os.path.lexists(os.path.join(self.folder, name))
+                    or os.path.lexists(os.path.join(self.folder, name + INDEX_SUFFIX))):
+                break
+            name = f"{stem}_{n}{suffix}"
+        self.name = name
+        self.path = os.path.join(self.folder, name)
+        self.index_path = self.path + INDEX_SUFFIX
+
+        temp_index = self.temp_path + INDEX_SUFFIX
+        header = {'archive': name, 'format': self.format, 'category': self.category,
+                  'members': len(self.members), 'bytes': self.bytes, 'hash': HASH_LABEL,
+                  'created': time.time()}
+        with open(temp_index, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + '\n')
+            for member in self.members:
+                f.write(json.dumps(member.to_record(), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(self.temp_path, self.path)
+        os.rename(temp_index, self.index_path)
+
+
+class Packer:
+    """把小文件写入每个分类的当前归档（只在整理线程中使用）
+
+    threshold、max_bytes、max_files 为 None 时使用默认值。add() 在归档达到上限时
+    返回这个归档，由调用方 seal()；drain() 取出全部未封存的归档，abort() 放弃它们。
+    throttle 为 throttle.IOThrottle 时，写入的数据计入它的字节预算。
+    """
+
+    def __init__(self, target_folder, fmt='tar', threshold=None, max_bytes=None, max_files=None,
+                 throttle=None):
+        if fmt not in PACK_FORMATS:
+            raise ValueError(f"未知的归档格式: {fmt}")
+        self.target_folder = target_folder
+        self.format = fmt
+        self.threshold = threshold or DEFAULT_PACK_THRESHOLD
+        self.max_bytes = max(1, max_bytes or DEFAULT_PACK_MAX_BYTES)
+        self.max_files = max(1, max_files or DEFAULT_PACK_MAX_FILES)
+        self.throttle = throttle
+        self._archives = {}
+        self._stamp = time.strftime('%Y%m%d-%H%M%S')
+        self._serial = itertools.count(1)
+
+    def accepts(self, st):
+        """是否打包这个文件（按 lstat 结果判断：小于阈值的普通文件）"""
+        return stat.S_ISREG(st.st_mode) and st.st_size < self.threshold
+
+    def add(self, category, src):
+        """读取 src 并追加到 category 的归档，返回达到上限的归档或 None
+
+        源文件读取失败时抛出 OSError，归档不受影响；源文件在扫描后变大
+        或变成了链接时返回 False，由调用方按正常方式移动。
+        """
+        loaded = read_small(src, self.threshold)
+        if loaded is None:
+            return False
+        data, st = loaded
+        archive = self._archives.get(category)
+        if archive is None:
+            name = f"{ARCHIVE_PREFIX}{self._stamp}-{os.getpid()}-{next(self._serial):04d}.{self.format}"
+            archive = self._archives[category] = PackArchive(
+                os.path.join(self.target_folder, category), category, self.format, name)
+        name = os.path.relpath(src, self.target_folder).replace(os.sep, '/')
+        archive.add(src, name, data, st)
+        if self.throttle is not None:
+            self.throttle.acquire_bytes(len(data))
+        if archive.bytes >= self.max_bytes or len(archive.members) >= self.max_files:
+            return self._archives.pop(category)
+        return None
+
+    def drain(self):
+        """取出全部未封存的归档"""
+        archives = list(self._archives.values())
+        self._archives.clear()
+        return archives
+
+    def abort(self):
+        """放弃全部未封存的归档"""
+        for archive in self.drain():
+            archive.discard()
+
+
+def read_index(index_path):
+    """读取旁路索引，返回 (头部, [成员记录])"""
+    with open(index_path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        members = [json.loads(line) for line in f if line.strip()]
+    return header, members
+
+
+def read_member(index_path, name):
+    """按索引中的偏移直接读出一个成员的内容（校验哈希），找不到时抛出 KeyError"""
+    header, members = read_index(index_path)
+    for record in members:
+        if record['name'] == name:
+            break
+    else:
+        raise KeyError(name)
+    archive = os.path.join(os.path.dirname(index_path), header['archive'])
+    fd = os.open(archive, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+    try:
+        data = os.pread(fd, record['size'], record['offset'])
+    finally:
+        os.close(fd)
+    if _digest(data) != record['digest']:
+        raise PackError(f"归档中 {name} 的内容与索引不一致: {archive}")
+    return data
+
+
+def _member_path(root, name):
+    """成员名对应的解包路径；名称为绝对路径或规范化后不在 root 之下时抛出 PackError"""
+    parts = name.split('/')
+    if (not name or os.path.isabs(name) or os.path.splitdrive(name)[0]
+            or any(part in ('', '.', '..') for part in parts)
+            or (os.sep != '/' and any(os.sep in part or (os.altsep and os.altsep in part) for part in parts))):
+        raise PackError(f"归档成员名不安全，拒绝解包: {name!r}")
+    path = os.path.normpath(os.path.join(root, *parts))
+    if os.path.commonpath((root, path)) != root or path == root:
+        raise PackError(f"归档成员名不安全，拒绝解包: {name!r}")
+    return path
+
+
+def extract(index_path, root=None):
+    """把归档中的成员按原路径解包到 root（默认为归档所在分类文件夹的上一级，即目标文件夹）
+
+    已存在的文件不会被覆盖，返回 (解包的文件数, 跳过的文件数)。成员名为绝对路径或
+    含有 .. 等会解包到 root 之外时抛出 PackError，此时不会解包任何文件。
+    """
+    header, members = read_index(index_path)
+    folder = os.path.dirname(os.path.abspath(index_path))
+    root = os.path.normpath(os.path.abspath(root or os.path.dirname(folder)))
+    paths = [_member_path(root, record['name']) for record in members]
+    extracted = skipped = 0
+    fd = os.open(os.path.join(folder, header['archive']), os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+    try:
+        for record, path in zip(members, paths):
+            data = os.pread(fd, record['size'], record['offset'])
+            if _digest(data) != record['digest']:
+                raise PackError(f"归档中 {record['name']} 的内容与索引不一致: {header['archive']}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with open(path, 'xb') as f:
+                    f.write(data)
+            except FileExistsError:
+                skipped += 1
+                continue
+            os.utime(path, (record['mtime'], record['mtime']))
+            extracted += 1
+    finally:
+        os.close(fd)
+    return extracted, skipped
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="organizer.pack",
+        description="查看或解包小文件归档（python -m organizer <文件夹> --pack 生成）",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="按索引列出归档中的文件")
+    listing.add_argument("index")
+    cat = commands.add_parser("cat", help="把归档中的一个文件输出到标准输出")
+    cat.add_argument("index")
+    cat.add_argument("name", help="成员名（相对目标文件夹的路径）")
+    unpack = commands.add_parser("extract", help="按原路径解包（不覆盖已有文件）")
+    unpack.add_argument("index")
+    unpack.add_argument("--to", metavar="DIR", help="解包到 DIR（默认为原来的目标文件夹）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "list":
+            header, members = read_index(args.index)
+            for record in members:
+                print(f"{record['size']:>10}  {record['name']}")
+            print(f"{header['archive']}: {header['members']} 个文件，{header['bytes']} 字节", file=sys.stderr)
+        elif args.command == "cat":
+            sys.stdout.buffer.write(read_member(args.index, args.name))
+        else:
+            extracted, skipped = extract(args.index, args.to)
+            print(f"解包 {extracted} 个文件，跳过 {skipped} 个已存在的文件", file=sys.stderr)
+        return 0
+    except KeyError as e:
+        print(f"归档中没有 {e.args[0]}", file=sys.stderr)
+        return 1
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""扫描过滤：gitignore 风格的排除规则、最大深度、不跨文件系统和符号链接策略
+
+规则语法与 .gitignore 相同：
+
+- 空行和 # 开头的行被忽略；! 开头表示重新包含，后出现的规则优先；
+- 以 / 结尾的规则只匹配目录；
+- 规则中（除结尾外）含有 / 时相对扫描的根文件夹匹配，否则匹配任意层级的名称；
+- * 和 ? 不匹配 /，** 匹配任意层目录（**/a、a/**、a/**/b），[...] 为字符集合。
+
+全部规则编译为两个组合正则（目录一个、文件一个），每个条目只匹配一次；
+规则中的先后顺序通过倒序排列分支实现，命中的第一个分支就是最后一条匹配的规则。
+被排除的目录在 scandir 时直接跳过，其中的内容不会被读取（与 git 相同，
+目录被排除后其中的文件不能再被 ! 规则包含）。
+"""
+import re
+
+# 符号链接策略：move 把指向文件的链接当作文件移动、不进入指向目录的链接（默认）；
+# skip 完全忽略符号链接；follow 还会进入指向目录的链接（同一目录只进入一次）
+SYMLINK_POLICIES = ('move', 'skip', 'follow')
+
+# 开发者共享盘上常见的、不需要整理的目录（--exclude-common）
+COMMON_EXCLUDES = (
+    '.git/', '.svn/', '.hg/', 'node_modules/', '__pycache__/', '.venv/', '.tox/',
+    '.snapshot/', '.snapshots/', '.zfs/', '.Trash-*/', 'lost+found/',
+)
+
+
+class FilterError(ValueError):
+    """排除规则无效"""
+
+
+def _glob_to_regex(glob):
+    """把一条规则的路径部分转换为正则（不含锚定）"""
+    out = []
+    i = 0
+    n = len(glob)
+    while i < n:
+        c = glob[i]
+        if c == '*':
+            if glob.startswith('**', i) and (i == 0 or glob[i - 1] == '/') and (i + 2 == n or glob[i + 2] == '/'):
+                if i + 2 == n:
+                    # a/** 匹配 a 中的全部内容
+                    out.append('.*')
+                    i += 2
+                else:
+                    # **/ 匹配零层或多层目录
+                    out.append('(?:.*/)?')
+                    i += 3
+                continue
+            out.append('[^/]*')
+            while i < n and glob[i] == '*':
+                i += 1
+            continue
+        if c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            k = i + 1
+            if k < n and glob[k] in '!^':
+                k += 1
+            if k < n and glob[k] == ']':
+                k += 1
+            j = glob.find(']', k)
+            if j < 0:
+                out.append(re.escape(c))
+            else:
+                content = glob[i + 1:j].replace('\\', '\\\\')
+                if content[0] in '!^':
+                    content = '^' + content[1:]
+                out.append(f'(?!/)[{content}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(glob[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def translate(pattern):
+    """把一行规则转换为 (正则, 是否为 ! 规则, 是否只匹配目录)，空行和注释返回 None"""
+    line = pattern.rstrip('\r\n')
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    anchored = '/' in line
+    body = _glob_to_regex(line.lstrip('/'))
+    if not anchored:
+        body = '(?:.*/)?' + body
+    try:
+        re.compile(body)
+    except re.error as e:
+        raise FilterError(f"无效的排除规则 {pattern!r}: {e}") from None
+    return body, negated, dir_only
+
+
+def _combine(rules):
+    """把 [(正则, 是否为 ! 规则)] 合并为一个正则；有 ! 规则时返回各分支对应的组名集合"""
+    if not rules:
+        return None, None
+    if not any(negated for _, negated in rules):
+        return re.compile('|'.join(f'(?:{body})' for body, _ in rules), re.DOTALL), None
+    parts = []
+    included = set()
+    # 倒序：最后一条规则的分支最先尝试
+    for index in range(len(rules) - 1, -1, -1):
+        body, negated = rules[index]
+        parts.append(f'(?P<r{index}>{body})')
+        if negated:
+            included.add(f'r{index}')
+    return re.compile('|'.join(parts), re.DOTALL), included
+
+
+class PathFilter:
+    """编译好的扫描过滤条件，可以在多次扫描之间复用
+
+    max_depth 为最多进入的子文件夹层数（0 只处理根文件夹中的文件）；
+    one_file_system 为 True 时不进入其他文件系统的挂载点。
+    """
+
+    def __init__(self, patterns=(), max_depth=None, one_file_system=False, symlinks='move'):
+        if symlinks not in SYMLINK_POLICIES:
+            raise FilterError(f"未知的符号链接策略: {symlinks}")
+        self.patterns = list(patterns)
+        self.max_depth = max_depth
+        self.one_file_system = one_file_system
+        self.symlinks = symlinks
+
+        rules = [rule for rule in map(translate, self.patterns) if rule is not None]
+        self._dir_regex, self._dir_included = _combine([(body, negated) for body, negated, _ in rules])
+        self._file_regex, self._file_included = _combine(
+            [(body, negated) for body, negated, dir_only in rules if not dir_only])
+
+    @classmethod
+    def from_file(cls, path, patterns=(), **options):
+        """读取 gitignore 格式的规则文件（追加在 patterns 之后）"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls([*patterns, *f.read().splitlines()], **options)
+
+    @property
+    def filters_files(self):
+        """是否需要逐个检查文件（只有目录规则时不需要）"""
+        return self._file_regex is not None or self.symlinks == 'skip'
+
+    @property
+    def active(self):
+        return (self._dir_regex is not None or self.max_depth is not None
+                or self.one_file_system or self.symlinks != 'move')
+
+    def excluded(self, relpath, is_dir):
+        """relpath（相对根文件夹、以 / 分隔）是否被规则排除"""
+        if is_dir:
+            regex, included = self._dir_regex, self._dir_included
+        else:
+            regex, included = self._file_regex, self._file_included
+        if regex is None:
+            return False
+        match = regex.fullmatch(relpath)
+        if match is None:
+            return False
+        return included is None or match.lastgroup not in included
+
+    def excludes_path(self, relpath, is_dir):
+        """与 excluded 相同，但同时检查各级上层目录和深度（用于单独给出的路径）"""
+        parts = relpath.split('/')
+        depth = len(parts) if is_dir else len(parts) - 1
+        if self.max_depth is not None and depth > self.max_depth:
+            return True
+        for end in range(1, len(parts)):
+            if self.excluded('/'.join(parts[:end]), True):
+                return True
+        return self.excluded(relpath, is_dir)
@@ -0,0 +1,377 @@
+"""整理方案：先计算、保存和审阅，再分批执行
+
+方案文件是 JSON Lines 文本::
+
+    {"format": "file-organizer-plan", "version": 1, "target": ..., "recursive": false, "shard": null, "created": ...}
+    ["相对路径", "分类", 大小, mtime_ns, inode]                  # 目标名与源文件名相同
+    ["相对路径", "分类", 大小, mtime_ns, inode, "目标名"]        # 重名时分配的新名称
+    ["相对路径", "分类", 大小, mtime_ns, inode, 目标名, "分片"]  # 分片时的子文件夹（如 "2024/05"），目标名可为 null
+    {"summary": {...}}                                           # 写完整个方案后才写入
+
+源路径相对于目标文件夹。制定方案时按名称排序遍历目录（先文件、后子目录），
+同一棵树两次制定的方案顺序相同，可以直接用 diff 比较，也可以用 diff_plans()
+按顺序归并比较而不把方案读入内存。大小、mtime 和 inode 用于执行前确认源文件
+没有变化。制定方案时启用了分片的，每项记录分配的分片子文件夹（以 / 分隔），
+执行时直接使用，不再重新计算（count 分片的编号与制定时的顺序有关）。
+
+命令行: python -m organizer.plan summary PLAN | diff OLD NEW
+"""
+import json
+import os
+import sys
+import time
+from json.encoder import encode_basestring as _quote
+
+PLAN_FORMAT = 'file-organizer-plan'
+PLAN_VERSION = 1
+
+# 执行方案时每批检查和移动的文件数
+PLAN_BATCH_SIZE = 1024
+
+# 读取方案末尾摘要时最多读取的字节数
+_SUMMARY_TAIL = 1024 * 1024
+
+# 文件名不是有效 UTF-8 时（os.fsdecode 得到的代理字符）按原始字节写入和读回
+_ERRORS = sys.getfilesystemencodeerrors()
+
+
+class PlanError(ValueError):
+    """方案文件无效或不完整"""
+
+
+class PlanEntry:
+    """方案中的一个移动"""
+
+    __slots__ = ('src', 'category', 'size', 'mtime_ns', 'ino', 'name', 'shard')
+
+    def __init__(self, src, category, size, mtime_ns, ino, name=None, shard=None):
+        self.src = src
+        self.category = category
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+        # 目标文件名（与源文件名相同时为 None）
+        self.name = name
+        # 分类文件夹下的分片子文件夹（以 / 分隔，没有分片时为 None）
+        self.shard = shard
+
+    @property
+    def target_name(self):
+        return self.name or os.path.basename(self.src)
+
+    @property
+    def target_dir(self):
+        """目标文件夹相对目标根文件夹的路径（以 / 分隔）"""
+        return self.category if self.shard is None else f"{self.category}/{self.shard}"
+
+    def matches(self, st):
+        """源文件是否还是制定方案时的那个文件（大小、修改时间、inode 都没有变）"""
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime_ns and st.st_ino == self.ino
+
+    def __repr__(self):
+        return f"<PlanEntry {self.src!r} -> {self.target_dir}/{self.target_name}>"
+
+
+def order_key(src):
+    """方案中源路径的顺序：目录中的文件在子目录之前，同级按名称排序"""
+    parts = src.split(os.sep)
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+
+class PlanSummary:
+    """方案的统计：文件数、字节数、按分类的文件数和字节数"""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        # 因重名而改名的文件数
+        self.renamed = 0
+        # 制定方案时无法读取的文件数
+        self.errors = 0
+        self.stopped = False
+        # 分类 -> [文件数, 字节数]
+        self.categories = {}
+
+    def add(self, category, size, renamed=False):
+        self.files += 1
+        self.bytes += size
+        if renamed:
+            self.renamed += 1
+        item = self.categories.get(category)
+        if item is None:
+            self.categories[category] = [1, size]
+        else:
+            item[0] += 1
+            item[1] += size
+
+    def to_dict(self):
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'renamed': self.renamed,
+            'errors': self.errors,
+            'stopped': self.stopped,
+            'categories': {
+                category: {'files': files, 'bytes': size}
+                for category, (files, size) in self.categories.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.files = data.get('files', 0)
+        summary.bytes = data.get('bytes', 0)
+        summary.renamed = data.get('renamed', 0)
+        summary.errors = data.get('errors', 0)
+        summary.stopped = bool(data.get('stopped'))
+        summary.categories = {
+            category: [item['files'], item['bytes']]
+            for category, item in data.get('categories', {}).items()
+        }
+        return summary
+
+    def format(self):
+        """多行文字摘要（按字节数从大到小列出分类）"""
+        lines = [f"共 {self.files} 个文件，{_format_bytes(self.bytes)}，"
+                 f"其中 {self.renamed} 个因重名改名"]
+        for category, (files, size) in sorted(self.categories.items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {category:<12}{files:>10} 个{_format_bytes(size):>12}")
+        return "\n".join(lines)
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class PlanWriter:
+    """流式写出方案（先写临时文件，完整写完后原子替换）"""
+
+    def __init__(self, path, target, recursive=False, shard=None):
+        self.path = os.fspath(path)
+        self.target = target
+        self.summary = PlanSummary()
+        self._temp = f"{self.path}.{os.getpid()}.tmp"
+        self._file = open(self._temp, 'w', encoding='utf-8', errors=_ERRORS, buffering=1024 * 1024)
+        self._write = self._file.write
+        self._prefix = os.path.join(target, '')
+        self._prefix_len = len(self._prefix)
+        header = {
+            'format': PLAN_FORMAT, 'version': PLAN_VERSION, 'target': target,
+            'recursive': recursive, 'shard': shard, 'created': time.time(),
+        }
+        self._file.write(json.dumps(header, ensure_ascii=False) + '\n')
+
+    def add(self, path, filename, category, name, st, shard=None):
+        """记录一个移动：path 为源文件的完整路径，filename 为源文件名，name 为分配的目标名，
+        shard 为分类文件夹下的分片子文件夹（相对路径）"""
+        src = path[self._prefix_len:] if path.startswith(self._prefix) else path
+        renamed = name != filename
+        # 热路径上直接拼接 JSON（与移动日志相同）
+        if shard is not None:
+            if os.sep != '/':
+                shard = shard.replace(os.sep, '/')
+            self._write(f'[{_quote(src)}, {_quote(category)}, {st.st_size}, {st.st_mtime_ns}, {st.st_ino}, '
+                        f'{_quote(name) if renamed else "null"}, {_quote(shard)}]\n')
+        elif renamed:
+            self._write(f'[{_quote(src)}, {_quote(category)}, {st.st_size}, {st.st_mtime_ns}, '
+                        f'{st.st_ino}, {_quote(name)}]\n')
+        else:
+            self._write(f'[{_quote(src)}, {_quote(category)}, {st.st_size}, {st.st_mtime_ns}, {st.st_ino}]\n')
+        self.summary.add(category, st.st_size, renamed)
+
+    def close(self):
+        """写入摘要并替换为正式文件"""
+        self._file.write(json.dumps({'summary': self.summary.to_dict()}, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temp, self.path)
+
+    def abort(self):
+        """出错时丢弃写了一半的方案"""
+        self._file.close()
+        try:
+            os.unlink(self._temp)
+        except OSError:
+            pass
+
+
+class PlanReader:
+    """读取方案文件：header 在打开时解析，entries() 流式产出移动"""
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with open(self.path, 'r', encoding='utf-8', errors=_ERRORS) as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = None
+        if not isinstance(header, dict) or header.get('format') != PLAN_FORMAT:
+            raise PlanError(f"不是整理方案文件: {self.path}")
+        if header.get('version') != PLAN_VERSION:
+            raise PlanError(f"不支持的方案版本: {header.get('version')}")
+        self.target = header['target']
+        self.recursive = bool(header.get('recursive'))
+        # 制定方案时的分片方式（旧方案中没有这一项）
+        self.shard = header.get('shard')
+        self.created = header.get('created')
+        self._summary = None
+
+    @property
+    def summary(self):
+        """末尾的摘要（只读取文件结尾，方案不完整时抛出 PlanError）"""
+        if self._summary is None:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - _SUMMARY_TAIL))
+                tail = f.read().rstrip(b'\n')
+            last = tail[tail.rfind(b'\n') + 1:]
+            try:
+                data = json.loads(last)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict) or 'summary' not in data:
+                raise PlanError(f"方案文件不完整（没有摘要）: {self.path}")
+            self._summary = PlanSummary.from_dict(data['summary'])
+        return self._summary
+
+    def entries(self):
+        """按方案顺序产出 PlanEntry"""
+        with open(self.path, 'r', encoding='utf-8', errors=_ERRORS) as f:
+            f.readline()
+            for number, line in enumerate(f, 2):
+                if not line.startswith('['):
+                    continue
+                try:
+                    entry = PlanEntry(*json.loads(line))
+                except (ValueError, TypeError) as e:
+                    raise PlanError(f"方案文件第 {number} 行无效: {e}") from None
+                if not (_is_plain_name(entry.category) and _is_plain_name(entry.target_name)
+                        and (entry.shard is None or (isinstance(entry.shard, str)
+                                                     and all(map(_is_plain_name, entry.shard.split('/')))))):
+                    raise PlanError(f"方案文件第 {number} 行的分类、分片或目标名无效")
+                yield entry
+
+    def batches(self, size=PLAN_BATCH_SIZE):
+        """按批产出 [PlanEntry]"""
+        batch = []
+        for entry in self.entries():
+            batch.append(entry)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def source_path(self, entry):
+        return os.path.join(self.target, entry.src)
+
+
+def _is_plain_name(name):
+    """分类和目标名只能是一级名称，不能指向目标文件夹之外"""
+    return (isinstance(name, str) and name not in ('', '.', '..')
+            and os.sep not in name and not (os.altsep and os.altsep in name))
+
+
+def read_plan(path):
+    """打开方案文件，返回 PlanReader"""
+    return PlanReader(path)
+
+
+def _ordered(reader):
+    previous = None
+    for entry in reader.entries():
+        key = order_key(entry.src)
+        if previous is not None and key <= previous:
+            raise PlanError(f"方案文件没有按目录顺序排列（{entry.src}），无法逐行比较: {reader.path}")
+        previous = key
+        yield key, entry
+
+
+def diff_plans(old, new):
+    """按顺序归并比较两个方案，产出 (标记, 旧项, 新项)
+
+    标记为 '-'（只在旧方案中）、'+'（只在新方案中）或 '~'（目标不同）；
+    目标相同而大小等变化的项不产出。内存占用与方案大小无关。
+    """
+    old_items = _ordered(read_plan(old) if not isinstance(old, PlanReader) else old)
+    new_items = _ordered(read_plan(new) if not isinstance(new, PlanReader) else new)
+    old_item = next(old_items, None)
+    new_item = next(new_items, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield '-', old_item[1], None
+            old_item = next(old_items, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield '+', None, new_item[1]
+            new_item = next(new_items, None)
+        else:
+            a, b = old_item[1], new_item[1]
+            if a.target_dir != b.target_dir or a.target_name != b.target_name:
+                yield '~', a, b
+            old_item = next(old_items, None)
+            new_item = next(new_items, None)
+
+
+def _describe(entry):
+    return f"{entry.target_dir}/{entry.target_name}"
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="organizer.plan",
+        description="查看或比较整理方案（python -m organizer <文件夹> --plan FILE 生成）",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="显示方案的按分类统计")
+    summary.add_argument("plan")
+    summary.add_argument("--json", action="store_true", help="以 JSON 格式输出")
+    diff = commands.add_parser("diff", help="逐项比较两个方案")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "summary":
+            reader = read_plan(args.plan)
+            summary = reader.summary
+            if args.json:
+                json.dump({'target': reader.target, **summary.to_dict()}, sys.stdout,
+                          ensure_ascii=False, indent=2)
+                sys.stdout.write("\n")
+            else:
+                print(f"{reader.target}（{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reader.created))}）")
+                print(summary.format())
+                if summary.stopped:
+                    print("注意: 制定方案时被中断，方案只包含部分文件")
+            return 0
+
+        counts = {'-': 0, '+': 0, '~': 0}
+        for mark, a, b in diff_plans(args.old, args.new):
+            counts[mark] += 1
+            if mark == '-':
+                print(f"- {a.src} -> {_describe(a)}")
+            elif mark == '+':
+                print(f"+ {b.src} -> {_describe(b)}")
+            else:
+                print(f"~ {a.src}: {_describe(a)} -> {_describe(b)}")
+        print(f"删除 {counts['-']} 项，新增 {counts['+']} 项，目标变化 {counts['~']} 项", file=sys.stderr)
+        return 1 if any(counts.values()) else 0
+    except (OSError, PlanError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
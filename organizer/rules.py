@@ -0,0 +1,263 @@
+"""分类规则编译器
+
+把 FILE_CATEGORIES 以及用户配置编译成一个 Classifier：
+- 扩展名（包括 tar.gz 这样的多段后缀）放进一个 扩展名 -> 分类 的哈希表，常见情况 O(1)；
+- glob / 正则规则合并成一个组合正则，每个文件只匹配一次（含有分组或反向引用的
+  正则单独编译，组合后分组编号会改变）；
+- 规则可以附加大小和修改时间范围。
+
+配置文件为 JSON，格式示例::
+
+    {
+        "categories": {"电子书": ["epub", "mobi"], "压缩包": ["tar.gz", "tgz"]},
+        "rules": [
+            {"category": "截图", "glob": "screenshot*.png"},
+            {"category": "日志", "regex": "\\\\.log(\\\\.\\\\d+)?$"},
+            {"category": "大文件", "min_size": 1073741824},
+            {"category": "旧文档", "extensions": ["doc"], "max_mtime": "2015-01-01"}
+        ]
+    }
+
+规则按配置顺序匹配，先于扩展名表；都不匹配时归入默认分类。
+"""
+import fnmatch
+import re
+
+# 默认分类规则
+FILE_CATEGORIES = {
+    '图片': ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tiff', 'svg'],
+    '文档': ['pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'md', 'rtf', 'csv'],
+    '压缩包': ['zip', 'rar', '7z', 'tar', 'gz', 'bz2', 'xz'],
+    '视频': ['mp4', 'avi', 'mkv', 'mov', 'flv', 'wmv', 'mpeg', 'mpg', 'webm'],
+    '音频': ['mp3', 'wav', 'm4a', 'flac', 'aac', 'ogg', 'wma'],
+    '程序': ['py', 'js', 'java', 'cpp', 'c', 'html', 'css', 'php', 'json', 'xml'],
+    '可执行文件': ['exe', 'msi', 'bat', 'sh', 'app', 'dmg'],
+    '其他': []  # 默认分类
+}
+
+DEFAULT_CATEGORY = '其他'
+
+
+class RuleError(ValueError):
+    """规则配置无效"""
+
+
+def _normalize_ext(ext):
+    return ext.strip().lower().lstrip('.')
+
+
+def _parse_time(value, field):
+    """把配置里的时间（时间戳或 ISO 日期）转换为时间戳"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        from datetime import datetime
+
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise RuleError(f"{field} 不是有效的时间: {value!r}") from None
+
+
+class CategoryRule:
+    """一条分类规则：名称模式 + 可选的大小/时间范围"""
+
+    __slots__ = ('category', 'pattern', 'min_size', 'max_size', 'min_mtime', 'max_mtime', 'regex')
+
+    def __init__(self, category, pattern=None, min_size=None, max_size=None,
+                 min_mtime=None, max_mtime=None):
+        self.category = category
+        # 已转换为正则的名称模式，None 表示匹配任意名称
+        self.pattern = pattern
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_mtime = min_mtime
+        self.max_mtime = max_mtime
+        self.regex = re.compile(pattern if pattern is not None else r'(?s:.*)', re.IGNORECASE)
+
+    @property
+    def needs_stat(self):
+        return any(v is not None for v in (self.min_size, self.max_size, self.min_mtime, self.max_mtime))
+
+    def accepts(self, size, mtime):
+        """检查大小和修改时间范围（未知的值视为不满足有范围的条件）"""
+        if self.min_size is not None and (size is None or size < self.min_size):
+            return False
+        if self.max_size is not None and (size is None or size > self.max_size):
+            return False
+        if self.min_mtime is not None and (mtime is None or mtime < self.min_mtime):
+            return False
+        if self.max_mtime is not None and (mtime is None or mtime > self.max_mtime):
+            return False
+        return True
+
+    @classmethod
+    def from_config(cls, item):
+        """从配置字典创建规则"""
+        if not isinstance(item, dict) or not item.get('category'):
+            raise RuleError(f"规则缺少 category: {item!r}")
+
+        patterns = []
+        if item.get('glob'):
+            patterns.append(fnmatch.translate(str(item['glob']).casefold()))
+        if item.get('regex'):
+            regex = str(item['regex'])
+            # 所有模式都从开头匹配，保证组合正则按规则顺序选择
+            pattern = f"(?s:.*?)(?:{regex})"
+            try:
+                re.compile(regex)
+                # 单独有效的正则放进前缀后也可能无效（例如不在开头的全局标志）
+                re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise RuleError(f"无效的正则 {regex!r}: {e}") from None
+            patterns.append(pattern)
+        if item.get('extensions'):
+            exts = '|'.join(re.escape(_normalize_ext(e)) for e in item['extensions'])
+            patterns.append(rf"(?s:.+)\.(?:{exts})\Z")
+        if len(patterns) > 1:
+            raise RuleError(f"一条规则只能使用 glob、regex、extensions 中的一种: {item!r}")
+
+        return cls(
+            item['category'],
+            patterns[0] if patterns else None,
+            min_size=item.get('min_size'),
+            max_size=item.get('max_size'),
+            min_mtime=_parse_time(item.get('min_mtime'), 'min_mtime'),
+            max_mtime=_parse_time(item.get('max_mtime'), 'max_mtime'),
+        )
+
+
+class Classifier:
+    """编译好的分类器，每次整理前构建一次"""
+
+    def __init__(self, categories, rules=(), default_category=DEFAULT_CATEGORY):
+        self.default_category = default_category
+        self.rules = list(rules)
+
+        # 扩展名 -> 分类（同一扩展名以先定义的分类为准）
+        self.extension_index = {}
+        for category, exts in categories.items():
+            for ext in exts:
+                self.extension_index.setdefault(_normalize_ext(ext), category)
+        self.max_suffix_parts = max((ext.count('.') + 1 for ext in self.extension_index), default=0)
+
+        # 分类文件夹列表（保持定义顺序，默认分类放在最后）
+        names = list(categories)
+        for rule in self.rules:
+            if rule.category not in names:
+                names.append(rule.category)
+        if default_category in names:
+            names.remove(default_category)
+        names.append(default_category)
+        self.categories = names
+
+        self.needs_stat = any(rule.needs_stat for rule in self.rules)
+
+        # 按顺序把规则分段：连续的、不含分组的规则合并为一个组合正则（分组名即规则序号），
+        # 含有分组（包括反向引用）的规则单独匹配，保持它自己的分组编号
+        self._segments = []
+        parts = []
+        for i, rule in enumerate(self.rules):
+            if rule.regex.groups:
+                self._flush_segment(parts)
+                self._segments.append((rule.regex, i))
+            else:
+                pattern = rule.pattern if rule.pattern is not None else r'(?s:.*)'
+                parts.append(f"(?P<_rule{i}>{pattern})")
+        self._flush_segment(parts)
+
+    def _flush_segment(self, parts):
+        if not parts:
+            return
+        try:
+            combined = re.compile('|'.join(parts), re.IGNORECASE)
+        except re.error as e:
+            raise RuleError(f"无法合并分类规则: {e}") from None
+        self._segments.append((combined, None))
+        parts.clear()
+
+    def _match_rules(self, name, size, mtime):
+        for regex, index in self._segments:
+            match = regex.match(name)
+            if match is None:
+                continue
+            first = int(match.lastgroup[5:]) if index is None else index
+            rule = self.rules[first]
+            if rule.accepts(size, mtime):
+                return rule.category
+
+            # 范围条件不满足时，逐条检查后面的规则（较少见）
+            for rule in self.rules[first + 1:]:
+                if rule.regex.match(name) and rule.accepts(size, mtime):
+                    return rule.category
+            return None
+        return None
+
+    def lookup_extension(self, name):
+        """按后缀查找分类，多段后缀取最长的匹配；没有匹配时返回 None"""
+        lowered = name.lower()
+        index = self.extension_index
+        found = None
+        pos = len(lowered)
+        for _ in range(self.max_suffix_parts):
+            pos = lowered.rfind('.', 0, pos)
+            if pos <= 0:
+                break
+            category = index.get(lowered[pos + 1:])
+            if category is not None:
+                found = category
+        return found
+
+    def match_rules(self, name, size=None, mtime=None):
+        """只按配置的规则查找分类，没有匹配时返回 None"""
+        if not self._segments:
+            return None
+        return self._match_rules(name, size, mtime)
+
+    def match(self, name, size=None, mtime=None):
+        """按规则和扩展名查找分类，都不匹配时返回 None（而不是默认分类）"""
+        if self._segments:
+            category = self._match_rules(name, size, mtime)
+            if category is not None:
+                return category
+        return self.lookup_extension(name)
+
+    def classify(self, name, size=None, mtime=None):
+        """返回文件名对应的分类"""
+        return self.match(name, size, mtime) or self.default_category
+
+    def classify_many(self, items):
+        """批量分类，items 为 (文件名, 大小, 修改时间) 的可迭代对象"""
+        classify = self.classify
+        return [classify(name, size, mtime) for name, size, mtime in items]
+
+
+def compile_rules(categories=None, rules=None, default_category=DEFAULT_CATEGORY):
+    """编译分类规则
+
+    categories 会合并到 FILE_CATEGORIES 上（同名分类追加扩展名），
+    rules 为配置字典的列表。
+    """
+    merged = {name: list(exts) for name, exts in FILE_CATEGORIES.items()}
+    for name, exts in (categories or {}).items():
+        merged.setdefault(name, [])
+        merged[name].extend(e for e in exts if e not in merged[name])
+
+    compiled = [CategoryRule.from_config(item) for item in (rules or [])]
+    return Classifier(merged, compiled, default_category)
+
+
+def load_rules(path):
+    """从 JSON 配置文件加载并编译分类规则"""
+    import json
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RuleError(f"无法读取规则文件 {path}: {e}") from None
+
+    if not isinstance(config, dict):
+        raise RuleError(f"规则文件格式错误: {path}")
+    return compile_rules(config.get('categories'), config.get('rules'))
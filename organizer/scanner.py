@@ -0,0 +1,280 @@
+"""基于 os.scandir 的流式文件扫描"""
+import os
+import stat
+
+
+class FileEntry:
+    """按路径构造的、与 os.DirEntry 接口相同的文件项（stat 结果同样会缓存）"""
+
+    __slots__ = ('path', 'name', '_stat', '_lstat')
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.name = os.path.basename(self.path)
+        self._stat = None
+        self._lstat = None
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks:
+            if self._stat is None:
+                self._stat = os.stat(self.path)
+            return self._stat
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        return self._lstat
+
+    def inode(self):
+        return self.stat(follow_symlinks=False).st_ino
+
+    def is_symlink(self):
+        try:
+            return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"<FileEntry {self.name!r}>"
+
+
+class TableStat:
+    """FileTable 中一行记录的 stat 信息：扫描时的大小和修改时间，设备号取自所在目录"""
+
+    __slots__ = ('st_size', 'st_mtime_ns', 'st_dev')
+
+    def __init__(self, size, mtime_ns, dev):
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_dev = dev
+
+    @property
+    def st_mtime(self):
+        return self.st_mtime_ns / 1e9
+
+
+class TableEntry(FileEntry):
+    """FileTable 中的一行：category 和 table_stat 取自表中的列，stat() 仍然读取磁盘"""
+
+    __slots__ = ('category', 'table_stat')
+
+    def __init__(self, path, category, table_stat):
+        super().__init__(path)
+        self.category = category
+        self.table_stat = table_stat
+
+
+def iter_table(table):
+    """把 filetable.FileTable 的各行转换为 TableEntry，不逐个 stat 文件
+
+    每个目录只 stat 一次（得到设备号）；所在目录已经不存在的行被跳过。
+    """
+    dirs = table.dirs
+    devices = {}
+    join = os.path.join
+    for dir_id, name, size, mtime_ns, category in table.rows():
+        dev = devices.get(dir_id)
+        if dev is None:
+            try:
+                dev = os.stat(dirs[dir_id]).st_dev
+            except OSError:
+                dev = -1
+            devices[dir_id] = dev
+        if dev == -1:
+            continue
+        yield TableEntry(join(dirs[dir_id], name), category, TableStat(size, mtime_ns, dev))
+
+
+def iter_paths(paths):
+    """把路径列表转换为 FileEntry，跳过已经不存在的文件和目录"""
+    for path in paths:
+        entry = FileEntry(path)
+        try:
+            mode = entry.stat(follow_symlinks=False).st_mode
+        except OSError:
+            continue
+        if stat.S_ISREG(mode) or stat.S_ISLNK(mode):
+            yield entry
+
+
+def _entry_name(entry):
+    return entry.name
+
+
+class _Walk:
+    """一次扫描中按 PathFilter 判断的状态（根文件夹所在设备、跟随链接时已进入的目录）"""
+
+    def __init__(self, path_filter, root):
+        self.filter = path_filter
+        self.root_dev = os.stat(root).st_dev if path_filter.one_file_system else None
+        self.visited = None
+        if path_filter.symlinks == 'follow':
+            st = os.stat(root)
+            self.visited = {(st.st_dev, st.st_ino)}
+
+    def want_dir(self, entry, rel, depth):
+        """是否进入子目录 entry（rel 为它所在目录的相对路径前缀，depth 为所在目录的深度）"""
+        path_filter = self.filter
+        if path_filter.max_depth is not None and depth >= path_filter.max_depth:
+            return False
+        is_link = entry.is_symlink()
+        if is_link and self.visited is None:
+            return False
+        if path_filter.excluded(rel + entry.name, True):
+            return False
+        if self.root_dev is None and self.visited is None:
+            return True
+        try:
+            st = entry.stat()
+        except OSError:
+            return False
+        if self.root_dev is not None and st.st_dev != self.root_dev:
+            return False
+        if self.visited is not None:
+            # 跟随链接时同一个目录（或链接成环）只进入一次
+            key = (st.st_dev, st.st_ino)
+            if key in self.visited:
+                return False
+            self.visited.add(key)
+        return True
+
+    def skip_file(self, entry, rel):
+        if self.filter.symlinks == 'skip' and entry.is_symlink():
+            return True
+        return self.filter.excluded(rel + entry.name, False)
+
+
+class Scanner:
+    """逐个产出待整理文件的 os.DirEntry
+
+    DirEntry 自带的类型信息和 stat 缓存可以在分类和移动时直接复用，
+    不需要再为每个文件构造 Path 并重新 stat。
+    skip_names 中的目录（如分类文件夹）在递归时直接跳过，不会被读取。
+    提供 snapshot（snapshot.SnapshotIndex）时进行增量扫描：没有变化的目录
+    不再读取，与快照一致的文件不再产出。
+    sort 为 True 时每个目录中的文件和子目录按名称排序（需要先读完整个目录），
+    同一棵树的遍历顺序固定：目录中的文件在前，然后依次进入子目录。
+    path_filter（pathfilter.PathFilter）中的排除规则、深度、挂载点和符号链接策略
+    在读取目录项时就生效，被排除的子目录不会被读取。
+    """
+
+    def __init__(self, skip_names=(), on_error=None, snapshot=None, sort=False, path_filter=None):
+        self.skip_names = set(skip_names)
+        self.on_error = on_error
+        self.snapshot = snapshot
+        self.sort = sort
+        self.path_filter = path_filter if path_filter is not None and path_filter.active else None
+
+    def _error(self, message):
+        if self.on_error:
+            self.on_error(message)
+
+    def scan(self, folder, recursive=False):
+        """生成器：产出 folder 中（递归时包括子文件夹中）的文件"""
+        root = os.fspath(folder)
+        walk = None
+        if self.path_filter is not None:
+            try:
+                walk = _Walk(self.path_filter, root)
+            except OSError as e:
+                self._error(f"扫描文件时出错: {e}")
+                return
+        # (目录路径, 相对根文件夹的路径前缀, 深度)
+        stack = [(root, '', 0)]
+        while stack:
+            current, rel, depth = stack.pop()
+            subdirs = []
+            if self.sort:
+                files = sorted(self._scan_dir(current, recursive, subdirs, walk, rel, depth), key=_entry_name)
+                subdirs.sort()
+                yield from files
+            else:
+                yield from self._scan_dir(current, recursive, subdirs, walk, rel, depth)
+            if recursive:
+                # 倒序压栈，保持与 os.walk 相近的遍历顺序
+                stack.extend((os.path.join(current, name), f"{rel}{name}/", depth + 1)
+                             for name in reversed(subdirs))
+
+    def _scan_dir(self, current, recursive, subdirs, walk=None, rel='', depth=0):
+        """产出一个目录中的文件，并把要继续扫描的子目录名放入 subdirs"""
+        snapshot = self.snapshot
+        skip_names = self.skip_names
+        check_files = walk is not None and walk.filter.filters_files
+        known = None
+        if snapshot is not None:
+            try:
+                dir_stat = os.stat(current)
+            except OSError as e:
+                self._error(f"扫描文件时出错: {e}")
+                return
+            unchanged = snapshot.unchanged_subdirs(current, dir_stat)
+            if unchanged is not None:
+                subdirs.extend(
+                    name for name in unchanged
+                    if name not in skip_names and (
+                        walk is None or walk.want_dir(FileEntry(os.path.join(current, name)), rel, depth))
+                )
+                return
+            known = snapshot.take_known_files(current)
+        kept = {}
+
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+
+                    if is_dir:
+                        # 跳过已经创建的分类文件夹（与 os.walk 相同，默认不跟随目录符号链接）
+                        if entry.name in skip_names:
+                            continue
+                        if walk is None:
+                            if not entry.is_symlink():
+                                subdirs.append(entry.name)
+                        elif walk.want_dir(entry, rel, depth):
+                            subdirs.append(entry.name)
+                        continue
+
+                    if check_files and walk.skip_file(entry, rel):
+                        continue
+
+                    if not recursive:
+                        # 只收集当前文件夹中的文件（跟随符号链接判断）
+                        try:
+                            if not entry.is_file():
+                                continue
+                        except OSError:
+                            continue
+
+                    if known:
+                        info = known.get(entry.name)
+                        if info is not None:
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            if info == (st.st_size, st.st_mtime_ns, st.st_ino):
+                                # 上次已处理且没有变化
+                                kept[entry.name] = info
+                                snapshot.files_skipped += 1
+                                continue
+
+                    yield entry
+        except PermissionError as e:
+            self._error(f"权限错误，无法访问文件夹: {e}")
+            return
+        except OSError as e:
+            self._error(f"扫描文件时出错: {e}")
+            return
+
+        if snapshot is not None:
+            snapshot.record_dir(current, dir_stat, subdirs, kept)
@@ -0,0 +1,131 @@
+"""分片目标布局：把很大的分类文件夹再分成子文件夹
+
+一个分类文件夹中有几十万个文件时，列目录、查重名都会变慢（ext4 没有
+dir_index、SMB 共享尤其明显）。ShardLayout 在分类文件夹下再按以下方式分一层：
+
+- month：按文件的修改时间分到 年/月 子文件夹（例如 图片/2024/05）；
+- hash：按文件名的 CRC32 分到 256 个子文件夹（00 .. ff），同名文件总在同一个子文件夹；
+- count：按顺序装满编号子文件夹（0001、0002 ...），每个最多 max_entries 个条目。
+
+分片子文件夹在第一次用到时才创建，之后只在内存中查缓存。重名处理和查重
+以分片子文件夹为单位进行。用过分片的分类记录在状态目录的 shards.json 中，
+即使之后分类规则变了，扫描时也会跳过这些分类文件夹（见 engine.make_scanner）。
+"""
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+from .state import state_dir
+
+SHARD_MODES = ('month', 'hash', 'count')
+
+# count 分片时每个子文件夹默认的条目数上限
+DEFAULT_SHARD_SIZE = 10000
+
+# 记录用过分片的分类的文件（位于状态目录中）
+LAYOUT_FILE = 'shards.json'
+
+_ENCODING = sys.getfilesystemencoding()
+_ERRORS = sys.getfilesystemencodeerrors()
+
+
+def sharded_categories(target_folder):
+    """读取目标文件夹中用过分片的分类名（没有记录或无法读取时为空列表）"""
+    try:
+        with open(os.path.join(state_dir(target_folder), LAYOUT_FILE), 'r', encoding='utf-8') as f:
+            categories = json.load(f).get('categories', [])
+    except (OSError, ValueError, AttributeError):
+        return []
+    return [name for name in categories if isinstance(name, str)]
+
+
+class ShardLayout:
+    """为每个文件选择分类文件夹下的分片子文件夹，可以在多个线程中使用"""
+
+    def __init__(self, mode, max_entries=DEFAULT_SHARD_SIZE):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"未知的分片方式: {mode}")
+        self.mode = mode
+        self.max_entries = max(1, max_entries)
+        # 已确认存在的分片子文件夹
+        self._created = set()
+        # count 分片：分类文件夹 -> [当前编号, 已分配的条目数]
+        self._counts = {}
+        self.categories = set()
+        self._lock = threading.Lock()
+
+    def shard(self, category_folder, name, st):
+        """返回 name 应放入的分片子文件夹（相对分类文件夹的路径）"""
+        if self.mode == 'month':
+            tm = time.localtime(st.st_mtime)
+            return os.path.join(f"{tm.tm_year:04d}", f"{tm.tm_mon:02d}")
+        if self.mode == 'hash':
+            return f"{zlib.crc32(name.encode(_ENCODING, _ERRORS)) & 0xff:02x}"
+        with self._lock:
+            item = self._counts.get(category_folder)
+            if item is None:
+                item = self._counts[category_folder] = self._load_count(category_folder)
+            if item[1] >= self.max_entries:
+                item[0] += 1
+                item[1] = 0
+            item[1] += 1
+            return f"{item[0]:04d}"
+
+    def _load_count(self, category_folder):
+        """找到已有的最后一个编号子文件夹和其中的条目数（每个分类只读取一次）"""
+        last = 0
+        try:
+            with os.scandir(category_folder) as it:
+                for entry in it:
+                    if entry.name.isdigit() and entry.is_dir(follow_symlinks=False):
+                        last = max(last, int(entry.name))
+        except FileNotFoundError:
+            pass
+        if not last:
+            return [1, 0]
+        count = 0
+        try:
+            with os.scandir(os.path.join(category_folder, f"{last:04d}")) as it:
+                for _ in it:
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return [last, count]
+
+    def folder(self, target_folder, category, name, st, create=True):
+        """返回 name 的目标文件夹（分类文件夹下的分片子文件夹）
+
+        create 为 True 时确保子文件夹存在（每个子文件夹只创建一次）；
+        制定方案时传 False，不修改磁盘。
+        """
+        category_folder = os.path.join(target_folder, category)
+        subfolder = self.shard(category_folder, name, st)
+        if create:
+            return self.use(target_folder, category, subfolder)
+        return os.path.join(category_folder, subfolder)
+
+    def use(self, target_folder, category, subfolder):
+        """确保已经分配的分片子文件夹 subfolder（例如方案中记录的）存在，返回它的完整路径"""
+        folder = os.path.join(target_folder, category, subfolder)
+        if folder not in self._created:
+            os.makedirs(folder, exist_ok=True)
+            with self._lock:
+                self._created.add(folder)
+                self.categories.add(category)
+        return folder
+
+    def save(self, target_folder):
+        """把本次用过分片的分类合并写入 shards.json"""
+        if not self.categories:
+            return
+        categories = set(sharded_categories(target_folder))
+        if self.categories <= categories:
+            return
+        path = os.path.join(state_dir(target_folder, create=True), LAYOUT_FILE)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump({'categories': sorted(categories | self.categories)}, f, ensure_ascii=False)
+        os.replace(temp, path)
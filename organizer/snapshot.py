@@ -0,0 +1,156 @@
+"""增量整理用的目录快照索引（SQLite）
+
+记录每个已扫描目录扫描前的 (mtime_ns, inode) 和子目录列表，以及整理后有意留在
+原处的文件（如跳过的重复文件）的 (大小, mtime_ns, inode)。下次整理时：
+- 目录的 mtime 和 inode 都没变 → 不再读取它的内容，直接使用记录的子目录列表；
+- 目录有变化 → 重新读取，但与记录一致的文件会被跳过，只处理新增或修改过的文件。
+移动失败或被中断的文件不记录，它所在的目录在下次整理时一定重新读取（见 retry_file），
+这样临时性的错误（文件被占用、权限、磁盘已满）会被重试。
+
+快照在一次整理正常完成后才提交；中途停止或出错时丢弃本次的修改。
+"""
+import os
+import threading
+
+from .state import state_dir
+
+SNAPSHOT_NAME = 'snapshot.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    gen INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    PRIMARY KEY (dir, name)
+) WITHOUT ROWID;
+"""
+
+# 子目录名之间的分隔符（文件名中不可能出现）
+_SEP = '\0'
+
+
+class SnapshotIndex:
+    """一个目标文件夹的快照索引，路径均相对于目标文件夹保存"""
+
+    def __init__(self, root, db_path=None):
+        import sqlite3
+
+        self.root = os.fspath(root)
+        self.db_path = db_path or os.path.join(state_dir(root, create=True), SNAPSHOT_NAME)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+        row = self._conn.execute('SELECT MAX(gen) FROM dirs').fetchone()
+        self.generation = (row[0] or 0) + 1
+        self._conn.execute('BEGIN')
+        # 有文件需要重试的目录（相对路径）
+        self._retry_dirs = set()
+
+        # 统计
+        self.dirs_skipped = 0
+        self.dirs_scanned = 0
+        self.files_skipped = 0
+
+    def relative(self, path):
+        """把扫描得到的路径转换为相对路径（扫描路径都由根目录拼接而来）"""
+        path = os.fspath(path)
+        if path == self.root:
+            return ''
+        return path[len(self.root) + 1:]
+
+    def unchanged_subdirs(self, path, st):
+        """目录没有变化时返回记录的子目录名列表，否则返回 None"""
+        rel = self.relative(path)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT mtime_ns, ino, subdirs FROM dirs WHERE path = ?', (rel,)
+            ).fetchone()
+            if row is None or row[0] != st.st_mtime_ns or row[1] != st.st_ino:
+                return None
+            self._conn.execute('UPDATE dirs SET gen = ? WHERE path = ?', (self.generation, rel))
+            self.dirs_skipped += 1
+        return row[2].split(_SEP) if row[2] else []
+
+    def take_known_files(self, path):
+        """取出目录中上次留在原处的文件：{文件名: (大小, mtime_ns, inode)}
+
+        取出后这些记录从索引中删除，仍未变化的文件由 record_dir 重新写入，
+        本次处理后仍留在原处的文件由 record_file 写入。
+        """
+        rel = self.relative(path)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name, size, mtime_ns, ino FROM files WHERE dir = ?', (rel,)
+            ).fetchall()
+            if rows:
+                self._conn.execute('DELETE FROM files WHERE dir = ?', (rel,))
+        return {name: (size, mtime_ns, ino) for name, size, mtime_ns, ino in rows}
+
+    def record_dir(self, path, st, subdirs, kept_files):
+        """记录一个重新读取过的目录：扫描前的 stat、子目录名、未变化而跳过的文件"""
+        rel = self.relative(path)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO dirs (path, mtime_ns, ino, subdirs, gen) VALUES (?, ?, ?, ?, ?)',
+                (rel, st.st_mtime_ns, st.st_ino, _SEP.join(subdirs), self.generation)
+            )
+            if kept_files:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO files (dir, name, size, mtime_ns, ino) VALUES (?, ?, ?, ?, ?)',
+                    [(rel, name, *info) for name, info in kept_files.items()]
+                )
+            self.dirs_scanned += 1
+
+    def record_file(self, path):
+        """记录一个有意留在原处的文件（例如跳过的重复文件），以后没有变化时不再处理"""
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return
+        rel_dir = self.relative(os.path.dirname(os.fspath(path)))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (dir, name, size, mtime_ns, ino) VALUES (?, ?, ?, ?, ?)',
+                (rel_dir, os.path.basename(path), st.st_size, st.st_mtime_ns, st.st_ino)
+            )
+
+    def retry_file(self, path):
+        """记录一个需要重试的文件（移动失败、被中断）：下次整理时重新读取它所在的目录"""
+        rel_dir = self.relative(os.path.dirname(os.fspath(path)))
+        with self._lock:
+            self._retry_dirs.add(rel_dir)
+
+    def commit(self):
+        """提交本次扫描结果，并删除已经不存在的目录的记录"""
+        with self._lock:
+            if self._retry_dirs:
+                # mtime 记为 -1，与任何实际的目录都不一致
+                self._conn.executemany('UPDATE dirs SET mtime_ns = -1 WHERE path = ?',
+                                       [(rel,) for rel in self._retry_dirs])
+                self._retry_dirs.clear()
+            self._conn.execute('DELETE FROM dirs WHERE gen < ?', (self.generation,))
+            self._conn.execute('DELETE FROM files WHERE dir NOT IN (SELECT path FROM dirs)')
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        """放弃本次的修改（整理没有完成）"""
+        with self._lock:
+            self._conn.execute('ROLLBACK')
+
+    def close(self):
+        with self._lock:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+            self._conn.close()
@@ -0,0 +1,427 @@
+"""按文件内容（魔数）识别类型
+
+没有扩展名、扩展名不认识（.tmp 下载、相机导出）或扩展名错误的文件，
+读取文件开头的几 KB 判断真实类型，再按对应的常见扩展名在分类器的扩展名表中
+查找分类，因此自定义的扩展名分类同样生效。
+
+- 每个文件只用一次 read 读取开头 SNIFF_BYTES 字节；
+- 需要识别的文件攒成批次交给线程池读取，扫描不必等待磁盘；
+- 结果按 (设备, inode, 大小, mtime) 缓存在目标文件夹的状态目录中，
+  文件没有变化时以后的整理不再读取它。
+"""
+import collections
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+from .state import state_dir
+
+# 读取文件开头的字节数（tar 的标记在第 257 字节）
+SNIFF_BYTES = 4096
+
+# 每批识别的文件数
+SNIFF_BATCH_SIZE = 64
+
+# 读取文件头的线程数（也是同时进行的批次数）
+SNIFF_WORKERS = 4
+
+# 保持顺序时每段最多暂存的文件数（需要识别的文件很少时也按段提交）
+ORDERED_CHUNK_SIZE = 1024
+
+FINGERPRINT_CACHE_NAME = 'fingerprints.sqlite3'
+
+# 识别模式：只识别扩展名不认识的文件，或者识别所有没有被自定义规则匹配的文件
+SNIFF_UNKNOWN = 'unknown'
+SNIFF_ALL = 'all'
+SNIFF_MODES = (SNIFF_UNKNOWN, SNIFF_ALL)
+
+# 开头固定字节 -> 常见扩展名（按顺序匹配，较长的前缀在前）
+_PREFIXES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'%PDF-', 'pdf'),
+    (b'{\\rtf', 'rtf'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'doc'),
+    (b'Rar!\x1a\x07', 'rar'),
+    (b"7z\xbc\xaf'\x1c", '7z'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'ID3', 'mp3'),
+    (b'fLaC', 'flac'),
+    (b'OggS', 'ogg'),
+    (b'FLV\x01', 'flv'),
+    (b'\x00\x00\x01\xba', 'mpg'),
+    (b'\x00\x00\x01\xb3', 'mpg'),
+    (b'0&\xb2u\x8ef\xcf\x11', 'wmv'),
+    (b'\x7fELF', 'exe'),
+    (b'\xcf\xfa\xed\xfe', 'exe'),
+    (b'\xce\xfa\xed\xfe', 'exe'),
+)
+
+# 以下几种魔数只有一两个字节，单独核对文件头中的其他字段
+
+# 脚本第一行（#! 解释器路径）的最大长度
+_SHEBANG_MAX = 256
+
+# MPEG 音频帧头中的比特率编号 0（自由格式）和 15 以及采样率编号 3 无效
+_MPEG_BAD_BITRATE = (0, 15)
+_MPEG_BAD_SAMPLERATE = 3
+
+# ADTS 帧头的长度和有效的采样率编号（0..12）
+_ADTS_HEADER = 7
+_ADTS_SAMPLERATES = 13
+
+_RIFF_TYPES = {b'WEBP': 'webp', b'WAVE': 'wav', b'AVI ': 'avi'}
+
+_FTYP_BRANDS = {b'M4A ': 'm4a', b'M4B ': 'm4a', b'qt  ': 'mov'}
+
+_ZIP_MEMBERS = ((b'word/', 'docx'), (b'xl/', 'xlsx'), (b'ppt/', 'pptx'))
+
+
+def _is_pe(head):
+    """MZ 头中 e_lfanew（0x3C）指向的位置是否为 PE 签名"""
+    if len(head) < 0x40:
+        return False
+    offset = int.from_bytes(head[0x3c:0x40], 'little')
+    return 0x40 <= offset and head[offset:offset + 4] == b'PE\x00\x00'
+
+
+def _is_shebang(head):
+    """第一行是否为 #! 加解释器的绝对路径（可打印 ASCII，以换行结束）"""
+    end = head.find(b'\n', 0, _SHEBANG_MAX)
+    if end < 0:
+        return False
+    line = head[2:end].rstrip(b'\r').lstrip(b' \t')
+    return line.startswith(b'/') and all(0x20 <= c < 0x7f or c == 0x09 for c in line)
+
+
+def _is_adts(head):
+    """AAC ADTS 帧头：采样率编号有效，帧长度不小于帧头；下一帧在读到的范围内时核对它的同步字"""
+    if len(head) < _ADTS_HEADER or head[1] & 0xf6 != 0xf0:
+        return False
+    if (head[2] >> 2) & 0x0f >= _ADTS_SAMPLERATES:
+        return False
+    length = ((head[3] & 0x03) << 11) | (head[4] << 3) | (head[5] >> 5)
+    if length < _ADTS_HEADER:
+        return False
+    following = head[length:length + 2]
+    return len(following) < 2 or (following[0] == 0xff and following[1] & 0xf6 == 0xf0)
+
+
+def _is_mp3(head):
+    """MPEG 音频第三层的帧头：版本、层、比特率和采样率编号都有效"""
+    if len(head) < 4 or head[1] & 0xe0 != 0xe0:
+        return False
+    version = (head[1] >> 3) & 0x03
+    layer = (head[1] >> 1) & 0x03
+    # 版本 01 保留；层 01 为第三层
+    if version == 1 or layer != 1:
+        return False
+    return head[2] >> 4 not in _MPEG_BAD_BITRATE and (head[2] >> 2) & 0x03 != _MPEG_BAD_SAMPLERATE
+
+
+def sniff_kind(head, size=None):
+    """根据文件开头的字节判断类型，返回常见扩展名（不认识时返回 None）"""
+    for prefix, kind in _PREFIXES:
+        if head.startswith(prefix):
+            return kind
+
+    if head[4:8] == b'ftyp':
+        return _FTYP_BRANDS.get(head[8:12], 'mp4')
+    if head.startswith(b'RIFF'):
+        return _RIFF_TYPES.get(head[8:12])
+    if head.startswith(b'PK\x03\x04') or head.startswith(b'PK\x05\x06'):
+        for member, kind in _ZIP_MEMBERS:
+            if member in head:
+                return kind
+        return 'zip'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'webm' if b'webm' in head[:64] else 'mkv'
+    if head[257:262] == b'ustar':
+        return 'tar'
+    if head.startswith(b'MZ') and _is_pe(head):
+        return 'exe'
+    if head.startswith(b'#!') and _is_shebang(head):
+        return 'sh'
+    if head[:1] == b'\xff':
+        if _is_adts(head):
+            return 'aac'
+        if _is_mp3(head):
+            return 'mp3'
+    if head.startswith(b'BM') and size is not None and len(head) >= 6:
+        # 两个字节太短，再核对头部记录的文件大小
+        if int.from_bytes(head[2:6], 'little') == size:
+            return 'bmp'
+
+    text = head[:256].lstrip().lower()
+    if text.startswith(b'<!doctype html') or text.startswith(b'<html'):
+        return 'html'
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in head):
+        return 'svg'
+    if text.startswith(b'<?xml'):
+        return 'xml'
+    return None
+
+
+def read_head(path, size=SNIFF_BYTES):
+    """一次 read 读取文件开头（不跟随符号链接）
+
+    以非阻塞方式打开，打开后不是普通文件（扫描后被换成了 FIFO、设备等）时返回 b''。
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_CLOEXEC', 0)
+                 | getattr(os, 'O_NONBLOCK', 0))
+    try:
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return b''
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
+class FingerprintCache:
+    """文件类型识别结果缓存：(设备, inode) -> (大小, mtime_ns, 类型)
+
+    大小或 mtime 变化的记录视为失效。新结果先缓存在内存中，批量写入。
+    """
+
+    def __init__(self, root, db_path=None):
+        import sqlite3
+
+        self.db_path = db_path or os.path.join(state_dir(root, create=True), FINGERPRINT_CACHE_NAME)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                PRIMARY KEY (dev, ino)
+            ) WITHOUT ROWID
+        """)
+        self._new = []
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, st):
+        """返回缓存的类型：'' 表示识别过但不认识，None 表示没有有效的缓存"""
+        row = self._conn.execute(
+            'SELECT size, mtime_ns, kind FROM fingerprints WHERE dev = ? AND ino = ?',
+            (st.st_dev, st.st_ino)
+        ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[2]
+
+    def put(self, st, kind):
+        self._new.append((st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, kind or ''))
+
+    def flush(self):
+        if self._new:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO fingerprints (dev, ino, size, mtime_ns, kind) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    self._new
+                )
+            self._new.clear()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+class ContentSniffer:
+    """在扫描流水线中识别文件内容
+
+    stream() 包装扫描得到的文件流：不需要识别的文件原样立即产出；需要识别的
+    文件攒成批次在线程池中读取文件头，识别出的分类写入 results（路径 -> 分类）
+    后再产出，由引擎分类时取用。
+    """
+
+    def __init__(self, classifier, mode=SNIFF_UNKNOWN, cache=None, workers=SNIFF_WORKERS,
+                 batch_size=SNIFF_BATCH_SIZE):
+        if mode not in SNIFF_MODES:
+            raise ValueError(f"未知的内容识别模式: {mode!r}")
+        self.classifier = classifier
+        self.mode = mode
+        self.cache = cache
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool = None
+
+        # 统计
+        self.sniffed = 0
+        self.recognized = 0
+
+    def _needs_sniff(self, entry):
+        classifier = self.classifier
+        if classifier.needs_stat:
+            st = entry.stat()
+            size, mtime = st.st_size, st.st_mtime
+        else:
+            size = mtime = None
+        if self.mode == SNIFF_ALL:
+            return classifier.match_rules(entry.name, size, mtime) is None
+        return classifier.match(entry.name, size, mtime) is None
+
+    def category_of(self, kind):
+        """类型（常见扩展名）对应的分类，分类器中没有时返回 None"""
+        if not kind:
+            return None
+        return self.classifier.extension_index.get(kind)
+
+    @staticmethod
+    def _read_batch(batch):
+        """在工作线程中读取一批文件头：[(entry, stat, kind)]"""
+        out = []
+        for entry, st in batch:
+            try:
+                kind = sniff_kind(read_head(entry.path), st.st_size)
+            except OSError:
+                kind = False  # 读取失败，不缓存
+            out.append((entry, st, kind))
+        return out
+
+    def _submit(self, entries, results):
+        """先查缓存，剩下的交给线程池；返回 (缓存命中的文件, future 或 None)"""
+        ready = []
+        todo = []
+        cache = self.cache
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                ready.append(entry)
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                # 符号链接、FIFO、设备等不读取内容（打开 FIFO 会一直等待写入方）
+                ready.append(entry)
+                continue
+            kind = cache.get(st) if cache is not None else None
+            if kind is None:
+                todo.append((entry, st))
+                continue
+            category = self.category_of(kind)
+            if category is not None:
+                results[entry.path] = category
+            ready.append(entry)
+
+        future = None
+        if todo:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="organizer-sniff"
+                )
+            future = self._pool.submit(self._read_batch, todo)
+        return ready, future
+
+    def _finish(self, future, results):
+        """等待一批识别完成，记录结果，产出其中的文件"""
+        cache = self.cache
+        for entry, st, kind in future.result():
+            if kind is not False:
+                self.sniffed += 1
+                if cache is not None:
+                    cache.put(st, kind)
+                category = self.category_of(kind)
+                if category is not None:
+                    self.recognized += 1
+                    results[entry.path] = category
+            yield entry
+        if cache is not None:
+            cache.flush()
+
+    def stream(self, entries, results, ordered=False):
+        """包装文件流（在扫描线程中运行）
+
+        ordered 为 True 时按输入顺序产出（制定整理方案时使用），
+        排在识别中的文件之后的文件要等这一批识别完成。
+        """
+        if ordered:
+            yield from self._stream_ordered(entries, results)
+            return
+
+        batch = []
+        inflight = collections.deque()
+        for entry in entries:
+            try:
+                needs_sniff = self._needs_sniff(entry)
+            except OSError:
+                needs_sniff = False
+            if not needs_sniff:
+                yield entry
+                continue
+
+            batch.append(entry)
+            if len(batch) < self.batch_size:
+                continue
+            ready, future = self._submit(batch, results)
+            batch = []
+            yield from ready
+            if future is not None:
+                inflight.append(future)
+                if len(inflight) >= self.workers:
+                    yield from self._finish(inflight.popleft(), results)
+
+        if batch:
+            ready, future = self._submit(batch, results)
+            yield from ready
+            if future is not None:
+                inflight.append(future)
+        while inflight:
+            yield from self._finish(inflight.popleft(), results)
+
+    def _stream_ordered(self, entries, results):
+        """按顺序分段：每段中需要识别的文件一起提交，整段识别完成后按原顺序产出"""
+        chunk = []
+        todo = []
+        inflight = collections.deque()
+        for entry in entries:
+            try:
+                needs_sniff = self._needs_sniff(entry)
+            except OSError:
+                needs_sniff = False
+            if needs_sniff:
+                todo.append(entry)
+            elif not chunk and not inflight:
+                # 前面没有等待识别的文件
+                yield entry
+                continue
+            chunk.append(entry)
+            if len(todo) < self.batch_size and len(chunk) < ORDERED_CHUNK_SIZE:
+                continue
+            inflight.append((chunk, self._submit(todo, results)[1]))
+            chunk = []
+            todo = []
+            if len(inflight) >= self.workers:
+                yield from self._finish_chunk(*inflight.popleft(), results)
+
+        if chunk:
+            inflight.append((chunk, self._submit(todo, results)[1]))
+        while inflight:
+            yield from self._finish_chunk(*inflight.popleft(), results)
+
+    def _finish_chunk(self, chunk, future, results):
+        if future is not None:
+            for _ in self._finish(future, results):
+                pass
+        yield from chunk
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        if self.cache is not None:
+            self.cache.close()
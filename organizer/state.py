@@ -0,0 +1,13 @@
+"""目标文件夹中保存整理状态（日志、索引等）的隐藏目录"""
+import os
+
+# 状态目录名，扫描时会跳过
+STATE_DIR_NAME = '.file_organizer'
+
+
+def state_dir(target_folder, create=False):
+    """返回目标文件夹的状态目录路径，create 为 True 时确保目录存在"""
+    path = os.path.join(os.fspath(target_folder), STATE_DIR_NAME)
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
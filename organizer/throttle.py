@@ -0,0 +1,207 @@
+"""I/O 限速：令牌桶限制每秒移动数和复制字节数，可按观测到的延迟自动退让
+
+在共享存储上整理时，全速运行会拉高其他业务的延迟。IOThrottle 把每个移动
+计为一次操作，把跨设备复制的数据按块计入字节预算（同设备 rename 不搬运数据，
+不消耗字节预算）；预算允许 1 秒的突发，长期平均不超过设定值。
+
+设置了延迟目标时，按移动延迟的指数滑动平均调整速率（AIMD）：平均延迟超过
+目标时速率减半，低于目标的 80% 时每次恢复 10%，直到设定的预算。没有设定
+操作数预算时，第一次退让以当时实际的移动速率为基准。跨设备复制的延迟按
+每 MiB 的耗时计算，大文件不会被误判为存储变慢。
+"""
+import threading
+import time
+
+# 每隔多少秒根据延迟调整一次速率
+ADJUST_INTERVAL = 0.5
+
+# 延迟超过目标时速率乘以的系数，以及速率系数的下限
+BACKOFF_FACTOR = 0.5
+MIN_RATE_FACTOR = 1 / 32
+
+# 延迟恢复正常后每次增加的速率系数
+RECOVER_STEP = 0.1
+
+# 延迟滑动平均中新样本的权重
+LATENCY_EWMA_WEIGHT = 0.2
+
+# 等待令牌时每次最多睡眠的秒数（期间检查是否已停止）
+SLEEP_SLICE = 0.1
+
+# 限制带宽时每块复制的数据量约为每秒预算的几分之一
+CHUNKS_PER_SECOND = 8
+
+_MIB = 1024 * 1024
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，burst 为桶容量（默认 1 秒的量）
+
+    reserve() 立即扣除令牌（可以欠账）并返回需要等待的秒数，调用方在锁外睡眠，
+    多个线程可以同时使用。
+    """
+
+    def __init__(self, rate, burst=None):
+        self._rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        with self._lock:
+            self._refill()
+            self._rate = float(rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def reserve(self, amount=1):
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+
+class IOThrottle:
+    """移动循环的限速器，可以在多个线程中使用
+
+    ops_per_sec / bytes_per_sec 为 None 时不限制；latency_target 为秒数，
+    None 表示不做自适应退让。keep_running() 返回 False 时立即结束等待。
+    """
+
+    def __init__(self, ops_per_sec=None, bytes_per_sec=None, latency_target=None, keep_running=None):
+        self.ops_per_sec = ops_per_sec
+        self.bytes_per_sec = bytes_per_sec
+        self.latency_target = latency_target
+        self.keep_running = keep_running
+        self._ops = TokenBucket(ops_per_sec) if ops_per_sec else None
+        self._bytes = TokenBucket(bytes_per_sec) if bytes_per_sec else None
+        # 自适应状态：当前速率系数、没有设定操作数预算时的基准速率
+        self.factor = 1.0
+        self._base_ops = ops_per_sec
+        self._latency = None
+        self._completed = 0
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        # 统计
+        self.waited = 0.0
+        self.backoffs = 0
+
+    @property
+    def enabled(self):
+        return bool(self._ops or self._bytes or self.latency_target)
+
+    def _sleep(self, seconds):
+        if seconds <= 0:
+            return
+        started = time.monotonic()
+        deadline = started + seconds
+        while True:
+            if self.keep_running is not None and not self.keep_running():
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(SLEEP_SLICE, remaining))
+        slept = time.monotonic() - started
+        self._local.waited = self.thread_waited() + slept
+        with self._lock:
+            self.waited += slept
+
+    def thread_waited(self):
+        """当前线程累计等待的秒数（用于从移动耗时中扣除限速等待）"""
+        return getattr(self._local, 'waited', 0.0)
+
+    def acquire_op(self):
+        """每个移动开始前调用，按操作数预算等待"""
+        bucket = self._ops
+        if bucket is not None:
+            self._sleep(bucket.reserve(1))
+
+    def acquire_bytes(self, size):
+        """复制每块数据后调用，按字节预算等待"""
+        bucket = self._bytes
+        if bucket is not None and size:
+            self._sleep(bucket.reserve(size))
+
+    def chunk_size(self, default):
+        """限制带宽时把复制分成较小的块，使等待均匀分布"""
+        if self._bytes is None:
+            return default
+        return max(64 * 1024, min(default, int(self.bytes_per_sec * self.factor) // CHUNKS_PER_SECOND))
+
+    def observe(self, seconds, size=0, copied=False):
+        """记录一个移动的耗时（不含限速等待）；跨设备复制按每 MiB 的耗时计"""
+        if not self.latency_target:
+            return
+        if copied and size > _MIB:
+            seconds = seconds * _MIB / size
+        with self._lock:
+            self._completed += 1
+            if self._latency is None:
+                self._latency = seconds
+            else:
+                self._latency += (seconds - self._latency) * LATENCY_EWMA_WEIGHT
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed < ADJUST_INTERVAL:
+                return
+            observed_rate = self._completed / elapsed
+            self._completed = 0
+            self._window_start = now
+            self._adjust(observed_rate)
+
+    def _adjust(self, observed_rate):
+        """AIMD：延迟超标时乘性减速，恢复后加性提速（在锁内调用）"""
+        if self._latency > self.latency_target:
+            if self._base_ops is None:
+                # 没有设定操作数预算：以当前实际速率为基准开始限速
+                self._base_ops = max(1.0, observed_rate)
+                self._ops = TokenBucket(self._base_ops)
+            self.factor = max(MIN_RATE_FACTOR, self.factor * BACKOFF_FACTOR)
+            self.backoffs += 1
+        elif self._latency < self.latency_target * 0.8 and self.factor < 1.0:
+            self.factor = min(1.0, self.factor + RECOVER_STEP)
+        else:
+            return
+
+        if self._bytes is not None:
+            self._bytes.rate = max(1.0, self.bytes_per_sec * self.factor)
+        if self.factor >= 1.0 and not self.ops_per_sec:
+            # 完全恢复且本来不限制操作数：取消操作数限速
+            self._ops = None
+            self._base_ops = None
+        elif self._ops is not None:
+            self._ops.rate = max(1.0, self._base_ops * self.factor)
+
+    def summary(self):
+        """一行文字摘要"""
+        parts = [f"等待 {self.waited:.1f}s"]
+        if self.latency_target:
+            parts.append(f"退让 {self.backoffs} 次，当前速率 {self.factor:.0%}")
+        return "，".join(parts)
+
+
+def parse_size(text):
+    """解析 10M、512k、1.5G 这类字节数（按 1024 进位）"""
+    text = text.strip().upper().rstrip('B').rstrip('I')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    scale = units.get(text[-1:], 1)
+    if text[-1:] in units:
+        text = text[:-1]
+    value = float(text) * scale
+    if value <= 0:
+        raise ValueError("必须大于 0")
+    return int(value)
@@ -0,0 +1,586 @@
+"""文件移动：同设备直接 rename，跨设备零拷贝复制 + 原子改名
+
+移到目标名时不会覆盖已有文件：目标名在分配之后被其他进程占用时抛出
+FileExistsError，由调用方重新分配名称（见 rename_noreplace）。
+
+跨设备复制按块进行，块之间检查停止请求，停止最多等待一块复制完成。
+大文件复制到目标文件夹中的 .part 文件，定期 fsync 并保存断点（已复制的字节数），
+中断或崩溃后再次移动同一个源文件时从断点继续。可选在删除源文件前校验
+复制结果：复制时对源数据计算哈希，完成后从磁盘读回目标文件比较。
+"""
+import errno
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sys
+import threading
+
+# copy_file_range / sendfile 每次调用的最大字节数
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# 内核零拷贝不可用时，普通读写使用的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 缓存的目标文件夹句柄数上限
+MAX_DIR_FDS = 256
+
+# 跨设备复制时的临时文件名前缀（临时文件位于分类文件夹中，不会被扫描到）
+TEMP_PREFIX = '.organizer-tmp-'
+
+# 不小于此大小的文件使用可续传的 .part 文件复制
+RESUMABLE_MIN_SIZE = 64 * 1024 * 1024
+
+# 可续传复制和校验复制每块的字节数（停止请求最多等待一块）
+RESUME_CHUNK_SIZE = 16 * 1024 * 1024
+
+# 可续传复制每复制多少字节 fsync 并保存一次断点
+CHECKPOINT_INTERVAL = 256 * 1024 * 1024
+
+# 可续传复制的 .part 文件名前缀（断点保存在同名的 .json 文件中）
+PART_PREFIX = '.organizer-part-'
+
+# copy_file_range 返回这些错误时改用普通读写
+_ZERO_COPY_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+_HAS_DIR_FD = os.rename in os.supports_dir_fd and hasattr(os, 'O_DIRECTORY')
+
+# renameat2 的参数（<linux/fs.h>、<fcntl.h>）
+_RENAME_NOREPLACE = 1
+_AT_FDCWD = -100
+
+# 文件系统不支持 RENAME_NOREPLACE 时的 errno
+_NOREPLACE_UNSUPPORTED = {errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+# 文件系统不支持硬链接时 link 返回的 errno
+_LINK_UNSUPPORTED = {errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK, errno.ENOSYS}
+
+# libc 的 renameat2（第一次使用时加载，False 表示不可用）
+_renameat2 = None
+
+
+def _load_renameat2():
+    """通过 ctypes 取得 renameat2（Linux 3.15+、glibc 2.28+），不可用时返回 False"""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = libc.renameat2
+    except (ImportError, OSError, AttributeError):
+        return False
+    func.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint)
+    func.restype = ctypes.c_int
+    return func, ctypes.get_errno
+
+
+def rename_noreplace(src, dst, dst_dir_fd=None):
+    """把 src 改名为 dst，dst 已经存在时抛出 FileExistsError，不会覆盖
+
+    Linux 上使用 renameat2(RENAME_NOREPLACE)；系统或文件系统不支持时退回
+    link + unlink（link 在目标存在时失败），文件系统也不支持硬链接时先用 O_EXCL
+    创建占位文件再改名到它上面。dst_dir_fd 不为 None 时 dst 相对该文件夹句柄。
+    """
+    global _renameat2
+    if os.name == 'nt':
+        # Windows 的 rename 本来就不覆盖已有文件
+        os.rename(src, dst)
+        return
+
+    if _renameat2 is None:
+        _renameat2 = _load_renameat2()
+    if _renameat2:
+        func, get_errno = _renameat2
+        if func(_AT_FDCWD, os.fsencode(src), _AT_FDCWD if dst_dir_fd is None else dst_dir_fd,
+                os.fsencode(dst), _RENAME_NOREPLACE) == 0:
+            return
+        err = get_errno()
+        if err not in _NOREPLACE_UNSUPPORTED:
+            raise OSError(err, os.strerror(err), src, None, dst)
+        if err == errno.ENOSYS:
+            _renameat2 = False
+
+    try:
+        os.link(src, dst, dst_dir_fd=dst_dir_fd, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+        # 不支持硬链接：占位文件保证目标名只属于本次移动
+        os.close(os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600, dir_fd=dst_dir_fd))
+        try:
+            os.rename(src, dst, dst_dir_fd=dst_dir_fd)
+        except BaseException:
+            _unlink_quietly(dst, dst_dir_fd)
+            raise
+        return
+    try:
+        os.unlink(src)
+    except BaseException:
+        _unlink_quietly(dst, dst_dir_fd)
+        raise
+
+
+def _copy_range(src_fd, dst_fd, chunk_size, on_chunk):
+    """用 copy_file_range 复制，返回已复制的字节数"""
+    copied = 0
+    while True:
+        n = os.copy_file_range(src_fd, dst_fd, chunk_size)
+        if n == 0:
+            return copied
+        copied += n
+        if on_chunk is not None:
+            on_chunk(n)
+
+
+def _copy_sendfile(src_fd, dst_fd, chunk_size, on_chunk):
+    """用 sendfile 复制，返回已复制的字节数"""
+    copied = 0
+    while True:
+        n = os.sendfile(dst_fd, src_fd, copied, chunk_size)
+        if n == 0:
+            return copied
+        copied += n
+        if on_chunk is not None:
+            on_chunk(n)
+
+
+def _copy_buffered(src_fd, dst_fd, chunk_size, on_chunk):
+    """普通读写复制（兜底），返回已复制的字节数"""
+    copied = 0
+    buffer = bytearray(min(chunk_size, COPY_BUFFER_SIZE))
+    view = memoryview(buffer)
+    while True:
+        n = os.readv(src_fd, [buffer])
+        if n == 0:
+            return copied
+        written = 0
+        while written < n:
+            written += os.write(dst_fd, view[written:n])
+        copied += n
+        if on_chunk is not None:
+            on_chunk(n)
+
+
+def copy_data(src_fd, dst_fd, chunk_size=COPY_CHUNK_SIZE, on_chunk=None):
+    """在两个文件描述符之间复制全部数据，优先使用内核零拷贝
+
+    零拷贝失败（文件系统不支持、内核太旧等）且还没有写入任何数据时，
+    依次退回 sendfile 和普通读写。每复制一块（最多 chunk_size 字节）后
+    调用 on_chunk(字节数)，限速时在其中等待。
+    """
+    for copier, available in (
+        (_copy_range, hasattr(os, 'copy_file_range')),
+        (_copy_sendfile, hasattr(os, 'sendfile')),
+    ):
+        if not available:
+            continue
+        try:
+            return copier(src_fd, dst_fd, chunk_size, on_chunk)
+        except OSError:
+            if os.lseek(dst_fd, 0, os.SEEK_CUR) != 0 or os.fstat(dst_fd).st_size != 0:
+                raise
+            os.lseek(src_fd, 0, os.SEEK_SET)
+    return _copy_buffered(src_fd, dst_fd, chunk_size, on_chunk)
+
+
+class TransferInterrupted(Exception):
+    """复制过程中收到了停止请求（源文件保持不动，可续传复制的进度已保存）"""
+
+    def __init__(self, src, copied, size, resumable):
+        super().__init__(f"复制已暂停: {src}")
+        self.src = src
+        self.copied = copied
+        self.size = size
+        self.resumable = resumable
+
+
+class ChecksumError(OSError):
+    """复制结果与源文件的校验值不一致（源文件保持不动）"""
+
+
+class _ChunkCopier:
+    """从两个文件描述符的当前位置按块复制，优先使用 copy_file_range
+
+    提供 digest（hashlib 对象）时数据经过用户空间，同时计算源数据的哈希。
+    """
+
+    def __init__(self, src_fd, dst_fd, digest=None):
+        self.src_fd = src_fd
+        self.dst_fd = dst_fd
+        self.digest = digest
+        self.zero_copy = digest is None and hasattr(os, 'copy_file_range')
+        self._buffer = None
+
+    def copy(self, count):
+        """复制最多 count 字节，返回实际复制的字节数（0 表示源文件已结束）"""
+        if self.zero_copy:
+            try:
+                return os.copy_file_range(self.src_fd, self.dst_fd, count)
+            except OSError as e:
+                if e.errno not in _ZERO_COPY_ERRORS:
+                    raise
+                self.zero_copy = False
+        if self._buffer is None:
+            self._buffer = bytearray(COPY_BUFFER_SIZE)
+        buffer = self._buffer
+        view = memoryview(buffer)
+        copied = 0
+        while copied < count:
+            n = os.readv(self.src_fd, [view[:min(COPY_BUFFER_SIZE, count - copied)]])
+            if n == 0:
+                break
+            if self.digest is not None:
+                self.digest.update(view[:n])
+            written = 0
+            while written < n:
+                written += os.write(self.dst_fd, view[written:n])
+            copied += n
+        return copied
+
+
+def _hash_file(fd, digest, size=None):
+    """从当前位置读取 size 字节（None 为读到结尾）计入 digest"""
+    buffer = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+    remaining = size
+    while remaining is None or remaining > 0:
+        n = os.readv(fd, [view if remaining is None else view[:min(COPY_BUFFER_SIZE, remaining)]])
+        if n == 0:
+            break
+        digest.update(view[:n])
+        if remaining is not None:
+            remaining -= n
+
+
+def _unlink_quietly(path, dir_fd=None):
+    try:
+        os.unlink(path, dir_fd=dir_fd)
+    except OSError:
+        pass
+
+
+def _part_path(folder, src):
+    """源文件对应的 .part 文件路径（同一个源路径总是同一个 .part）"""
+    key = hashlib.sha1(os.fsencode(os.path.abspath(src))).hexdigest()[:16]
+    return os.path.join(folder, f"{PART_PREFIX}{key}")
+
+
+def _read_checkpoint(path, identity):
+    """读取断点，源文件与断点记录的不是同一个版本时返回 0"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if not isinstance(data, dict) or data.get('source') != identity:
+        return 0
+    offset = data.get('offset')
+    return offset if isinstance(offset, int) and 0 < offset <= identity['size'] else 0
+
+
+def _write_checkpoint(path, identity, offset):
+    temp = f"{path}.tmp"
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump({'source': identity, 'offset': offset}, f, ensure_ascii=False)
+    os.replace(temp, path)
+
+
+def _part_is_live(part):
+    """.part 文件的断点是否仍然有效（断点存在，源文件还在且没有变化）"""
+    checkpoint = f"{part}.json"
+    try:
+        with open(checkpoint, 'r', encoding='utf-8') as f:
+            path = json.load(f)['source']['path']
+        st = os.stat(path)
+    except (OSError, ValueError, TypeError, KeyError):
+        return False
+    identity = {'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'ino': st.st_ino}
+    return _read_checkpoint(checkpoint, identity) > 0 and os.path.exists(part)
+
+
+def clean_transfer_files(folder, recursive=False):
+    """删除 folder 中中断的跨设备复制留下的文件，返回删除的文件数
+
+    一次性临时文件总是删除；.part 文件和断点只在断点缺失、无法读取或源文件已经
+    变化时删除，仍然有效的留给下次复制从断点继续。recursive 为 True 时包括子文件夹。
+    """
+    removed = 0
+    pending = [os.fspath(folder)]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            name = entry.name
+            if name.startswith(TEMP_PREFIX) or (name.startswith(PART_PREFIX) and name.endswith('.tmp')):
+                stale = True
+            elif name.startswith(PART_PREFIX):
+                part = entry.path[:-len('.json')] if name.endswith('.json') else entry.path
+                stale = not _part_is_live(part)
+            else:
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                continue
+            if stale:
+                try:
+                    os.unlink(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+class Transfer:
+    """执行移动并统计 rename 与复制的次数
+
+    同设备时用 renameat（目标文件夹句柄缓存复用，省去每次的路径解析）；
+    跨设备时复制到目标文件夹中的临时文件（大文件为可续传的 .part 文件），
+    保留元数据并 fsync 后原子改名，最后删除源文件。可以在多个线程中同时使用。
+    throttle 为 throttle.IOThrottle 时，复制的数据按块计入它的字节预算。
+    keep_running() 返回 False 时复制在当前块完成后停止并抛出 TransferInterrupted。
+    verify 为 hashlib 算法名（如 'blake2b'）时，删除源文件前校验复制结果。
+    """
+
+    def __init__(self, throttle=None, keep_running=None, verify=None):
+        self.throttle = throttle
+        self.keep_running = keep_running
+        self.verify = verify
+        self.renamed = 0
+        self.copied = 0
+        self.bytes_copied = 0
+        # 从断点继续的复制数和断点之前不需要再复制的字节数
+        self.resumed = 0
+        self.bytes_resumed = 0
+        self._dir_fds = {}
+        self._temp_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _acquire_dir_fd(self, folder):
+        with self._lock:
+            item = self._dir_fds.get(folder)
+            if item is None:
+                if len(self._dir_fds) >= MAX_DIR_FDS:
+                    self._evict_idle()
+                item = [os.open(folder, os.O_RDONLY | os.O_DIRECTORY), 0]
+                self._dir_fds[folder] = item
+            item[1] += 1
+            return item[0]
+
+    def _release_dir_fd(self, folder):
+        with self._lock:
+            self._dir_fds[folder][1] -= 1
+
+    def _evict_idle(self):
+        for folder, (fd, users) in list(self._dir_fds.items()):
+            if users == 0:
+                os.close(fd)
+                del self._dir_fds[folder]
+
+    def close(self):
+        """关闭缓存的文件夹句柄"""
+        with self._lock:
+            self._evict_idle()
+
+    def rename(self, src, folder, name):
+        """同设备移动（目标已存在时抛出 FileExistsError）"""
+        if _HAS_DIR_FD:
+            folder = os.fspath(folder)
+            dir_fd = self._acquire_dir_fd(folder)
+            try:
+                rename_noreplace(src, name, dst_dir_fd=dir_fd)
+            finally:
+                self._release_dir_fd(folder)
+        else:
+            rename_noreplace(src, os.path.join(folder, name))
+        with self._lock:
+            self.renamed += 1
+
+    def _chunk_size(self, default):
+        return default if self.throttle is None else self.throttle.chunk_size(default)
+
+    def _on_chunk(self, n):
+        """每复制一块后调用：计入字节预算"""
+        if self.throttle is not None:
+            self.throttle.acquire_bytes(n)
+
+    def _stopping(self):
+        return self.keep_running is not None and not self.keep_running()
+
+    def _new_digest(self):
+        return hashlib.new(self.verify) if self.verify else None
+
+    def _check_digest(self, path, digest):
+        """从磁盘读回复制结果（先丢弃页缓存）与源数据的哈希比较"""
+        if digest is None:
+            return
+        check = hashlib.new(digest.name)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            _hash_file(fd, check)
+        finally:
+            os.close(fd)
+        if check.digest() != digest.digest():
+            raise ChecksumError(errno.EIO, "复制结果与源文件的校验值不一致", path)
+
+    def copy(self, src, folder, name):
+        """跨设备移动：复制到临时文件，原子改名（目标已存在时抛出 FileExistsError），再删除源文件"""
+        folder = os.fspath(folder)
+        target = os.path.join(folder, name)
+
+        if os.path.islink(src):
+            temp = os.path.join(folder, f"{TEMP_PREFIX}{os.getpid()}-{next(self._temp_ids)}")
+            try:
+                os.symlink(os.readlink(src), temp)
+                rename_noreplace(temp, target)
+            except BaseException:
+                _unlink_quietly(temp)
+                raise
+            size = 0
+        else:
+            with open(src, 'rb') as fsrc:
+                st = os.fstat(fsrc.fileno())
+                if st.st_size >= RESUMABLE_MIN_SIZE:
+                    size = self._copy_resumable(src, fsrc.fileno(), st, folder, target)
+                else:
+                    size = self._copy_whole(src, fsrc.fileno(), st, folder, target)
+
+        os.unlink(src)
+        with self._lock:
+            self.copied += 1
+            self.bytes_copied += size
+
+    def _copy_whole(self, src, src_fd, st, folder, target):
+        """复制到一次性的临时文件（中断时删除），返回复制的字节数
+
+        不校验时用 copy_data（零拷贝，失败时退回 sendfile 和普通读写），每块之后
+        计入字节预算并检查停止请求；校验时按块复制并计算哈希。
+        """
+        temp = os.path.join(folder, f"{TEMP_PREFIX}{os.getpid()}-{next(self._temp_ids)}")
+        digest = self._new_digest()
+        try:
+            with open(temp, 'xb') as fdst:
+                if digest is None:
+                    if self._stopping():
+                        raise TransferInterrupted(src, 0, None, False)
+                    copied = 0
+
+                    def on_chunk(n):
+                        nonlocal copied
+                        copied += n
+                        self._on_chunk(n)
+                        # 最后一块已经复制完时不再打断
+                        if copied < st.st_size and self._stopping():
+                            raise TransferInterrupted(src, copied, None, False)
+
+                    size = copy_data(src_fd, fdst.fileno(), self._chunk_size(COPY_CHUNK_SIZE), on_chunk)
+                else:
+                    copier = _ChunkCopier(src_fd, fdst.fileno(), digest)
+                    chunk_size = self._chunk_size(RESUME_CHUNK_SIZE)
+                    size = 0
+                    while True:
+                        if self._stopping():
+                            raise TransferInterrupted(src, size, None, False)
+                        n = copier.copy(chunk_size)
+                        if n == 0:
+                            break
+                        size += n
+                        self._on_chunk(n)
+                os.fsync(fdst.fileno())
+            self._check_digest(temp, digest)
+            shutil.copystat(src, temp)
+            rename_noreplace(temp, target)
+        except BaseException:
+            _unlink_quietly(temp)
+            raise
+        return size
+
+    def _copy_resumable(self, src, src_fd, st, folder, target):
+        """复制到可续传的 .part 文件，返回本次复制的字节数
+
+        每 CHECKPOINT_INTERVAL 字节 fsync 一次并保存断点；停止请求或出错时保留
+        .part 文件和最近的断点，下次从断点继续（断点之后没有 fsync 的数据丢弃）。
+        """
+        part = _part_path(folder, src)
+        checkpoint = f"{part}.json"
+        identity = {'path': os.path.abspath(src), 'size': st.st_size,
+                    'mtime_ns': st.st_mtime_ns, 'ino': st.st_ino}
+        offset = _read_checkpoint(checkpoint, identity)
+        digest = self._new_digest()
+
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size < offset:
+                offset = 0
+            os.ftruncate(fd, offset)
+            os.lseek(fd, offset, os.SEEK_SET)
+            if offset:
+                if digest is not None:
+                    # 断点之前的数据已经在 .part 中，只需重新计算源数据的哈希
+                    _hash_file(src_fd, digest, offset)
+                else:
+                    os.lseek(src_fd, offset, os.SEEK_SET)
+                with self._lock:
+                    self.resumed += 1
+                    self.bytes_resumed += offset
+            resumed_at = saved = offset
+
+            copier = _ChunkCopier(src_fd, fd, digest)
+            chunk_size = self._chunk_size(RESUME_CHUNK_SIZE)
+            while True:
+                if self._stopping():
+                    os.fsync(fd)
+                    _write_checkpoint(checkpoint, identity, offset)
+                    raise TransferInterrupted(src, offset, st.st_size, True)
+                n = copier.copy(chunk_size)
+                if n == 0:
+                    break
+                offset += n
+                self._on_chunk(n)
+                if offset - saved >= CHECKPOINT_INTERVAL:
+                    os.fsync(fd)
+                    _write_checkpoint(checkpoint, identity, offset)
+                    saved = offset
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        current = os.fstat(src_fd)
+        if offset != st.st_size or (current.st_size, current.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+            _unlink_quietly(part)
+            _unlink_quietly(checkpoint)
+            raise OSError(errno.EAGAIN, "源文件在复制过程中发生了变化", src)
+        try:
+            self._check_digest(part, digest)
+        except ChecksumError:
+            _unlink_quietly(part)
+            _unlink_quietly(checkpoint)
+            raise
+        shutil.copystat(src, part)
+        # 目标名被占用时保留 .part 和断点，换名称重试时从断点继续
+        rename_noreplace(part, target)
+        _unlink_quietly(checkpoint)
+        return offset - resumed_at
+
+    def move(self, src, folder, name, same_device=None):
+        """把 src 移动为 folder/name，返回 'rename' 或 'copy'
+
+        same_device 为 None 时先尝试 rename，遇到跨设备错误再改为复制；
+        为 False 时直接复制。
+        """
+        src = os.fspath(src)
+        if same_device is not False:
+            try:
+                self.rename(src, folder, name)
+                return 'rename'
+            except OSError as e:
+                # 同一文件系统的不同挂载点之间 rename 也会返回 EXDEV
+                if e.errno != errno.EXDEV:
+                    raise
+        self.copy(src, folder, name)
+        return 'copy'
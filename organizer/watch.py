@@ -0,0 +1,449 @@
+"""监视模式：文件夹中出现的新文件写完后自动整理
+
+Linux 上通过 ctypes 直接使用 inotify（不依赖第三方库），只在文件写完关闭
+（IN_CLOSE_WRITE）或被移入（IN_MOVED_TO）时才考虑整理它；其他平台或 inotify
+不可用时退回定时轮询，文件大小和修改时间在两次检查间保持不变才视为写完。
+
+新文件先进入等待表，经过 settle 秒没有新的写入后才被整理；同一批就绪的文件
+一起交给引擎，目标名索引、查重索引和移动日志在各批之间保留（见
+OrganizerEngine.organize_paths 的 keep_open）。等待表中只保存还没有整理的文件，
+整理结果只累计计数；整理后仍留在原处的文件（跳过、出错）记在一张有上限的表中，
+没有变化时轮询和重新扫描不会再次整理它们，因此长时间运行时内存占用不会增长。
+"""
+import collections
+import errno
+import os
+import select
+import stat
+import struct
+import threading
+import time
+
+# 文件最后一次写入后等待多少秒再整理
+DEFAULT_SETTLE = 2.0
+
+# 只收到创建事件（写入方一直没有关闭文件）时，多少秒检查一次大小是否还在变化
+DEFAULT_STALE_TIMEOUT = 30.0
+
+# 轮询模式下扫描文件夹的间隔（秒）
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 每隔多少秒把就绪的文件交给引擎整理一次
+DEFAULT_BATCH_INTERVAL = 1.0
+
+# 每批最多整理的文件数（其余的留到下一批）
+WATCH_BATCH_SIZE = 1000
+
+# 最多记住多少个整理后留在原处的文件（超出时忘记最早的）
+WATCH_ATTEMPTED_MAX = 100000
+
+# inotify 事件（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+               | IN_ONLYDIR | IN_EXCL_UNLINK)
+
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+class InotifySource:
+    """inotify 事件源：把写完的文件交给 on_file(path, closed)
+
+    closed 为 None 表示文件是扫描新文件夹时发现的，不知道是否已写完。
+    prune(路径) 返回 True 的子文件夹不会被监视。
+    """
+
+    def __init__(self, folder, recursive, skip_names, on_file, on_error=None, prune=None):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "系统不支持 inotify")
+        self._libc = libc
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._get_errno = ctypes.get_errno
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self.folder = folder
+        self.recursive = recursive
+        self.skip_names = set(skip_names)
+        self.on_file = on_file
+        self.on_error = on_error
+        self.prune = prune
+        self.overflowed = False
+        self.closed_root = False
+        self._paths = {}
+        self._limit_reported = False
+        self._poller = select.poll()
+        self._poller.register(self.fd, select.POLLIN)
+        self._watch_tree(folder, report_files=False)
+
+    def _error(self, message):
+        if self.on_error:
+            self.on_error(message)
+
+    def _watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = self._get_errno()
+            if err == errno.ENOSPC:
+                if not self._limit_reported:
+                    self._limit_reported = True
+                    self._error("inotify 监视数量达到上限（fs.inotify.max_user_watches），"
+                                "部分子文件夹不会被监视")
+            elif err not in (errno.ENOENT, errno.ENOTDIR):
+                self._error(f"无法监视文件夹 {path}: {os.strerror(err)}")
+            return False
+        self._paths[wd] = path
+        return True
+
+    def _watch_tree(self, path, report_files=True):
+        """监视 path（递归时包括其子文件夹）
+
+        report_files 为 True 时（文件夹是新出现的）同时报告其中已有的文件，
+        它们可能在添加监视之前就已经写完。
+        """
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if not self._watch(current):
+                continue
+            if not (self.recursive or report_files):
+                continue
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if is_dir:
+                            if self.recursive and entry.name not in self.skip_names and not (
+                                    self.prune is not None and self.prune(entry.path)):
+                                stack.append(entry.path)
+                        elif report_files:
+                            self.on_file(entry.path, None)
+            except OSError as e:
+                self._error(f"扫描文件时出错: {e}")
+
+    def wait(self, timeout):
+        """等待最多 timeout 秒并处理到达的事件"""
+        if not self._poller.poll(max(0, int(timeout * 1000))):
+            return
+        while True:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            self._handle(data)
+
+    def _handle(self, data):
+        offset = 0
+        size = _EVENT.size
+        while offset + size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + size:offset + size + length].rstrip(b'\0')
+            offset += size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失的事件只能靠重新扫描补上
+                self.overflowed = True
+                continue
+            folder = self._paths.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._paths[wd]
+                if folder == self.folder:
+                    self.closed_root = True
+                continue
+            if not name:
+                continue
+
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    if os.fsdecode(name) not in self.skip_names and not (
+                            self.prune is not None and self.prune(path)):
+                        self._watch_tree(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.on_file(path, True)
+            elif mask & IN_CREATE:
+                # 符号链接、硬链接不会有关闭事件，创建即完成
+                try:
+                    closed = not stat.S_ISREG(os.lstat(path).st_mode) or os.stat(path).st_nlink > 1
+                except OSError:
+                    continue
+                self.on_file(path, closed)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollSource:
+    """轮询事件源：定时扫描文件夹，把还没有整理的文件交给 on_file(path, None)"""
+
+    overflowed = False
+    closed_root = False
+
+    def __init__(self, folder, recursive, scanner, on_file, interval=DEFAULT_POLL_INTERVAL,
+                 stop_event=None):
+        self.folder = folder
+        self.recursive = recursive
+        self.scanner = scanner
+        self.on_file = on_file
+        self.interval = interval
+        self._stop_event = stop_event or threading.Event()
+        self._next_poll = 0.0
+
+    def wait(self, timeout):
+        now = time.monotonic()
+        if now < self._next_poll:
+            self._stop_event.wait(min(timeout, self._next_poll - now))
+            return
+        self._next_poll = now + self.interval
+        if not os.path.isdir(self.folder):
+            self.closed_root = True
+            return
+        for entry in self.scanner.scan(self.folder, self.recursive):
+            self.on_file(entry.path, None)
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    """监视一个文件夹，自动整理其中新出现并已写完的文件
+
+    先完整整理一次文件夹，然后持续监视，直到调用 stop()。
+    poll 为 True 时强制使用轮询。
+    """
+
+    def __init__(self, engine, folder, recursive=False, skip_errors=True,
+                 settle=DEFAULT_SETTLE, poll=False, poll_interval=DEFAULT_POLL_INTERVAL,
+                 batch_interval=DEFAULT_BATCH_INTERVAL, stale_timeout=DEFAULT_STALE_TIMEOUT):
+        self.engine = engine
+        self.folder = os.path.normpath(os.fspath(folder))
+        self.recursive = recursive
+        self.skip_errors = skip_errors
+        self.settle = settle
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.batch_interval = batch_interval
+        self.stale_timeout = stale_timeout
+
+        # 路径 -> [下次检查时间, 是否已写完关闭, 上次检查时的 (大小, mtime_ns), 复查间隔]
+        self._pending = {}
+        # 整理过但留在原处的文件：路径 -> (大小, mtime_ns, inode)，按记录顺序淘汰
+        self._attempted = collections.OrderedDict()
+        self._stop_event = threading.Event()
+        self._source = None
+        self._root_dev = None
+
+        # 累计统计
+        self.batches = 0
+        self.moved_files = 0
+        self.skipped_files = 0
+        self.error_files = 0
+
+    def stop(self):
+        """停止监视（正在整理的一批会在当前文件完成后停止）"""
+        self._stop_event.set()
+        self.engine.stop()
+
+    @property
+    def running(self):
+        return not self._stop_event.is_set()
+
+    def _open_source(self):
+        scanner = self.engine.make_scanner(folder=self.folder)
+        if not self.poll:
+            try:
+                prune = None
+                if scanner.path_filter is not None:
+                    prune = lambda path: self._excluded(path, True)
+                source = InotifySource(self.folder, self.recursive, scanner.skip_names,
+                                       self._touch, on_error=self.engine.log, prune=prune)
+                self.engine.log("使用 inotify 监视文件夹")
+                return source
+            except (OSError, AttributeError) as e:
+                self.engine.log(f"inotify 不可用（{e}），改为定时轮询")
+        return PollSource(self.folder, self.recursive, scanner, self._touch,
+                          interval=self.poll_interval, stop_event=self._stop_event)
+
+    def _excluded(self, path, is_dir):
+        """path 是否被引擎的扫描过滤条件排除（inotify 报告的文件和新文件夹使用）"""
+        path_filter = self.engine.path_filter
+        if path_filter is None or not path_filter.active:
+            return False
+        rel = os.path.relpath(path, self.folder).replace(os.sep, '/')
+        if path_filter.excludes_path(rel, is_dir):
+            return True
+        try:
+            if is_dir and path_filter.one_file_system:
+                if self._root_dev is None:
+                    self._root_dev = os.stat(self.folder).st_dev
+                return os.stat(path).st_dev != self._root_dev
+            if not is_dir and path_filter.symlinks == 'skip':
+                return os.path.islink(path)
+        except OSError:
+            return True
+        return False
+
+    def _touch(self, path, closed):
+        """记录文件有新动静
+
+        closed 为 True 表示收到了写完关闭的事件；False 表示只收到创建事件，
+        写入方可能还开着文件，按较长的间隔确认大小不再变化；None 表示扫描时
+        发现的文件，按 settle 间隔确认两次检查之间没有变化。
+        """
+        entry = self._pending.get(path)
+        if entry is None:
+            attempted = self._attempted.get(path)
+            if attempted is not None:
+                # 整理过但留在了原处：只有内容有变化（写入事件或签名不同）时才再次整理
+                if closed is None:
+                    try:
+                        st = os.lstat(path)
+                    except OSError:
+                        del self._attempted[path]
+                        return
+                    if (st.st_size, st.st_mtime_ns, st.st_ino) == attempted:
+                        return
+                del self._attempted[path]
+            if self._excluded(path, False):
+                return
+            recheck = self.stale_timeout if closed is False else self.settle
+            self._pending[path] = [time.monotonic() + recheck, bool(closed), None, recheck]
+        elif closed:
+            entry[0] = time.monotonic() + self.settle
+            entry[1] = True
+
+    def _collect_ready(self):
+        """取出已经写完、可以整理的文件，返回 {路径: (大小, mtime_ns, inode)}"""
+        now = time.monotonic()
+        wall = time.time()
+        ready = {}
+        for path, entry in list(self._pending.items()):
+            if entry[0] > now:
+                continue
+            try:
+                st = os.lstat(path)
+            except OSError:
+                # 已被删除、移走或已经整理过
+                del self._pending[path]
+                continue
+            if not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+                del self._pending[path]
+                continue
+
+            signature = (st.st_size, st.st_mtime_ns)
+            age = wall - st.st_mtime
+            if age < self.settle:
+                # 最近仍有写入
+                entry[0] = now + self.settle - max(age, 0)
+                entry[2] = signature
+                continue
+            if entry[1] or entry[2] == signature:
+                del self._pending[path]
+                ready[path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+                if len(ready) >= WATCH_BATCH_SIZE:
+                    break
+            else:
+                entry[0] = now + entry[3]
+                entry[2] = signature
+        return ready
+
+    def _remember_attempted(self, ready):
+        """记录整理后仍是原来那个文件、留在原处的路径（跳过、出错、保留的重复文件）"""
+        attempted = self._attempted
+        for path, signature in ready.items():
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if (st.st_size, st.st_mtime_ns, st.st_ino) != signature:
+                # 已被移走后原路径又出现了新文件
+                continue
+            attempted[path] = signature
+            attempted.move_to_end(path)
+            if len(attempted) > WATCH_ATTEMPTED_MAX:
+                attempted.popitem(last=False)
+
+    def _next_due(self):
+        if not self._pending:
+            return None
+        return min(entry[0] for entry in self._pending.values())
+
+    def _accumulate(self, result):
+        self.batches += 1
+        self.moved_files += result.moved_files
+        self.skipped_files += result.skipped_files
+        self.error_files += result.error_files
+
+    def _rescan(self):
+        """事件丢失后重新扫描，把所有还没有整理的文件放入等待表"""
+        self.engine.log("监视事件队列溢出，重新扫描文件夹")
+        for entry in self.engine.make_scanner(folder=self.folder).scan(self.folder, self.recursive):
+            self._touch(entry.path, None)
+
+    def run(self):
+        """开始监视（阻塞直到 stop() 被调用或文件夹被删除）"""
+        self._stop_event.clear()
+        self._source = self._open_source()
+        try:
+            # 先打开事件源再做首次整理，整理期间新出现的文件也不会遗漏
+            self._accumulate(self.engine.organize(self.folder, self.recursive, self.skip_errors))
+            self.engine.log(f"开始监视文件夹: {self.folder}")
+            self.engine.update_status("正在监视文件夹...")
+
+            next_batch = time.monotonic() + self.batch_interval
+            while self.running:
+                timeout = next_batch - time.monotonic()
+                due = self._next_due()
+                if due is not None:
+                    timeout = min(timeout, due - time.monotonic())
+                self._source.wait(max(timeout, 0.01))
+
+                if self._source.closed_root:
+                    self.engine.log(f"被监视的文件夹已不存在: {self.folder}")
+                    break
+                if self._source.overflowed:
+                    self._source.overflowed = False
+                    self._rescan()
+
+                if time.monotonic() < next_batch:
+                    continue
+                next_batch = time.monotonic() + self.batch_interval
+                ready = self._collect_ready()
+                if ready and self.running:
+                    self._accumulate(
+                        self.engine.organize_paths(self.folder, list(ready), self.skip_errors, keep_open=True)
+                    )
+                    self._remember_attempted(ready)
+                    self.engine.update_status("正在监视文件夹...")
+        finally:
+            self._source.close()
+            self._pending.clear()
+            self.engine.close_batches()
+        self.engine.update_status("监视已停止")
+        return self
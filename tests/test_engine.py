@@ -0,0 +1,74 @@
+import errno
+import os
+
+from organizer.engine import OrganizerEngine
+
+
+def test_organize_with_metrics(tmp_path):
+    (tmp_path / "a.txt").write_text("a")
+
+    result = OrganizerEngine(metrics=True).organize(str(tmp_path))
+
+    assert result.moved_files == 1
+    assert result.error_files == 0
+    assert os.path.exists(tmp_path / "文档" / "a.txt")
+    assert result.metrics is not None
+
+
+def test_journal_with_non_utf8_filename(tmp_path):
+    root = os.fsencode(tmp_path)
+    with open(os.path.join(root, b"bad\xff.txt"), "wb") as f:
+        f.write(b"x")
+    (tmp_path / "good.txt").write_text("y")
+
+    engine = OrganizerEngine(journal=True)
+    result = engine.organize(str(tmp_path))
+
+    assert result.moved_files == 2
+    assert result.error_files == 0
+    assert os.path.exists(os.path.join(root, "文档".encode(), b"bad\xff.txt"))
+
+    undone = engine.undo(str(tmp_path))
+    assert undone.moved_files == 2
+    assert os.path.exists(os.path.join(root, b"bad\xff.txt"))
+    assert os.path.exists(tmp_path / "good.txt")
+
+
+def test_incremental_retries_failed_move(tmp_path, monkeypatch):
+    from organizer.transfer import Transfer
+
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("a")
+
+    def busy(self, src, folder, name, same_device=None):
+        raise OSError(errno.EBUSY, "文件被占用", src)
+
+    with monkeypatch.context() as m:
+        m.setattr(Transfer, "move", busy)
+        first = OrganizerEngine(incremental=True).organize(str(tmp_path), recursive=True)
+    assert first.error_files == 1
+
+    second = OrganizerEngine(incremental=True).organize(str(tmp_path), recursive=True)
+    assert second.moved_files == 1
+    assert os.path.exists(tmp_path / "文档" / "a.txt")
+
+
+def test_kept_batches_rebuild_indexes(tmp_path, monkeypatch):
+    from organizer import engine as engine_module
+
+    monkeypatch.setattr(engine_module, "KEPT_INDEX_BATCHES", 2)
+    engine = OrganizerEngine(journal=True)
+    seen = []
+    try:
+        for i in range(4):
+            path = tmp_path / "a.txt"
+            path.write_text(str(i))
+            result = engine.organize_paths(str(tmp_path), [str(path)], keep_open=True)
+            assert result.moved_files == 1
+            seen.append(engine._destinations)
+    finally:
+        engine.close_batches()
+
+    assert seen[0] is seen[1]
+    assert seen[1] is not seen[2]
+    assert sorted(os.listdir(tmp_path / "文档")) == ["a.txt", "a_1.txt", "a_2.txt", "a_3.txt"]
@@ -0,0 +1,25 @@
+import json
+import os
+
+from organizer.filetable import RunTable
+
+
+def test_export_with_surrogate_paths(tmp_path):
+    table = RunTable()
+    name = os.fsdecode(b"bad\xff.txt")
+    src = "/data/" + name
+    table.record(src, "/data/文档/" + name, "文档", 1, "moved", mtime_ns=5)
+    table.record("/data/good.txt", None, None, 2, "error", "denied")
+
+    jsonl = str(tmp_path / "report.jsonl")
+    assert table.export(jsonl) == 2
+    with open(jsonl, encoding="utf-8", errors="surrogateescape") as f:
+        rows = [json.loads(line) for line in f]
+    assert rows[0]["source"] == src
+    assert rows[1]["status"] == "error"
+
+    csv_path = str(tmp_path / "report.csv")
+    assert table.export(csv_path) == 2
+    with open(csv_path, encoding="utf-8-sig") as f:
+        text = f.read()
+    assert "bad\\xff.txt" in text
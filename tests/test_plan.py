@@ -0,0 +1,23 @@
+import os
+
+from organizer.engine import OrganizerEngine
+from organizer.plan import read_plan
+
+
+def test_plan_with_non_utf8_filename(tmp_path):
+    target = tmp_path / "target"
+    target.mkdir()
+    root = os.fsencode(target)
+    with open(os.path.join(root, b"bad\xff.txt"), "wb") as f:
+        f.write(b"x")
+    (target / "good.txt").write_text("y")
+    plan_path = str(tmp_path / "plan.jsonl")
+
+    summary = OrganizerEngine().plan(str(target), plan_path)
+    assert summary.files == 2
+    assert sorted(entry.src for entry in read_plan(plan_path).entries()) == \
+        sorted([os.fsdecode(b"bad\xff.txt"), "good.txt"])
+
+    result = OrganizerEngine().apply_plan(plan_path)
+    assert result.moved_files == 2
+    assert os.path.exists(os.path.join(root, "文档".encode(), b"bad\xff.txt"))
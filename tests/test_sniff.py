@@ -0,0 +1,37 @@
+import os
+import threading
+
+import pytest
+
+from organizer.engine import OrganizerEngine
+from organizer.sniff import sniff_kind
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="需要 os.mkfifo")
+def test_sniff_skips_fifo(tmp_path):
+    os.mkfifo(tmp_path / "pipe")
+    (tmp_path / "photo").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(32))
+    results = []
+
+    worker = threading.Thread(
+        target=lambda: results.append(OrganizerEngine(sniff="unknown").organize(str(tmp_path), recursive=True)),
+        daemon=True,
+    )
+    worker.start()
+    worker.join(10)
+    stuck = worker.is_alive()
+    if stuck:
+        # 放开卡在打开 FIFO 上的读取线程，测试进程才能退出
+        os.close(os.open(tmp_path / "pipe", os.O_WRONLY | os.O_NONBLOCK))
+        worker.join(10)
+
+    assert not stuck, "整理在 FIFO 上卡住了"
+    assert os.path.exists(tmp_path / "图片" / "photo")
+
+
+def test_weak_magic_numbers():
+    assert sniff_kind(b"MZ" + bytes(100)) is None
+    assert sniff_kind(b"#!important\n") is None
+    assert sniff_kind(b"#!/bin/sh\necho\n") == "sh"
+    assert sniff_kind(b"\xff\xff\xff\xff" * 4) is None
+    assert sniff_kind(b"\xff\xfb\x90\x64" + bytes(64)) == "mp3"